@@ -0,0 +1,176 @@
+"""
+Benchmarks of nctoolkit's hot paths, in the style used by airspeed velocity (asv)
+
+Each class is a group of benchmarks. setup is called before each benchmark is
+timed, and teardown after it. params and param_names give the parameters each
+benchmark is run with. The data are synthetic, and are generated the first time
+they are needed.
+
+Run them with asv, or with ``python -m benchmarks.run`` from the root of the
+repository, which also splits the time between Python and CDO.
+"""
+
+import pandas as pd
+
+import nctoolkit as nc
+
+from .synthetic import dataset
+
+nc.options(lazy=True, progress="off")
+
+
+class Base:
+    # each benchmark changes the dataset, so it must be set up again every time
+    number = 1
+    repeat = 5
+
+    def teardown(self, *args):
+        for x in ["ds", "grid", "matcher"]:
+            if hasattr(self, x):
+                delattr(self, x)
+        nc.cleanup()
+
+
+class OpenData(Base):
+    params = [[True, False], [1, 10]]
+    param_names = ["checks", "files"]
+
+    def setup(self, checks, files):
+        self.files = dataset(files=files)
+
+    def time_open_data(self, checks, files):
+        nc.open_data(self.files, checks=checks)
+
+
+class Metadata(Base):
+    params = [False, True]
+    param_names = ["curvilinear"]
+
+    def setup(self, curvilinear):
+        self.ds = nc.open_data(
+            dataset(curvilinear=curvilinear, variables=3, levels=5), checks=False
+        )
+
+    def time_variables(self, curvilinear):
+        self.ds.variables
+
+    def time_contents(self, curvilinear):
+        self.ds.contents
+
+    def time_times(self, curvilinear):
+        self.ds.times
+
+    def time_levels(self, curvilinear):
+        self.ds.levels
+
+    def time_size(self, curvilinear):
+        self.ds.size
+
+
+class Run(Base):
+    params = [[False, True], [1, 4]]
+    param_names = ["compression", "files"]
+
+    def setup(self, compression, files):
+        self.ds = nc.open_data(
+            dataset(compression=compression, files=files, variables=2, timesteps=31),
+            checks=False,
+        )
+        self.ds.subset(variables="var1")
+        self.ds.assign(var1=lambda x: x.var1 - 273.15)
+        self.ds.tmean("month")
+        self.ds.spatial_mean()
+
+    def time_fused_chain(self, compression, files):
+        self.ds.run()
+
+
+class Merge(Base):
+    params = [4, 20]
+    param_names = ["files"]
+
+    def setup(self, files):
+        self.ds = nc.open_data(dataset(files=files), checks=False)
+
+    def time_merge_time(self, files):
+        self.ds.merge("time")
+        self.ds.run()
+
+
+class Regrid(Base):
+    params = [False, True]
+    param_names = ["curvilinear"]
+
+    def setup(self, curvilinear):
+        self.ds = nc.open_data(dataset(curvilinear=curvilinear), checks=False)
+        self.grid = nc.open_data(dataset(nx=90, ny=45), checks=False)
+
+    def time_regrid_bil(self, curvilinear):
+        self.ds.regrid(self.grid, method="bil")
+        self.ds.run()
+
+    def time_regrid_nn(self, curvilinear):
+        self.ds.regrid(self.grid, method="nn")
+        self.ds.run()
+
+
+class Ensemble(Base):
+    params = [["mean", "max", "stdev", "range"], [4, 20]]
+    param_names = ["method", "files"]
+
+    def setup(self, method, files):
+        # members with the same times, so the ensemble statistic is per time step
+        self.ds = nc.open_data(
+            [dataset(files=1, seed=i)[0] for i in range(files)], checks=False
+        )
+
+    def time_ensemble(self, method, files):
+        getattr(self.ds, f"ensemble_{method}")()
+        self.ds.run()
+
+
+class Split(Base):
+    params = ["year", "month", "timestep"]
+    param_names = ["by"]
+
+    def setup(self, by):
+        self.ds = nc.open_data(dataset(timesteps=365), checks=False)
+
+    def time_split(self, by):
+        self.ds.split(by)
+
+
+class ToXarray(Base):
+    params = [False, True]
+    param_names = ["pending"]
+
+    def setup(self, pending):
+        self.ds = nc.open_data(dataset(variables=2, levels=5), checks=False)
+        if pending:
+            self.ds.tmean()
+
+    def time_to_xarray(self, pending):
+        self.ds.to_xarray()
+
+
+class Matchup(Base):
+    params = [100, 10000]
+    param_names = ["points"]
+
+    def setup(self, points):
+        self.ds = nc.open_data(dataset(timesteps=31), checks=False)
+        df = pd.DataFrame(
+            {
+                "lon": [(i * 7.3) % 360 - 180 for i in range(points)],
+                "lat": [(i * 3.1) % 160 - 80 for i in range(points)],
+                "year": 2000,
+                "month": 1,
+                "day": [i % 31 + 1 for i in range(points)],
+            }
+        )
+        self.matcher = nc.open_matchpoint()
+        self.matcher.add_points(df, quiet=True)
+        self.matcher.add_data(self.ds, variables="var1", quiet=True)
+
+    def time_matchup(self, points):
+        self.matcher.matchup(quiet=True)
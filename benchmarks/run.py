@@ -0,0 +1,162 @@
+"""
+Run the benchmarks, and store the results for the current commit
+
+Usage, from the root of the repository:
+
+    python -m benchmarks.run [--filter NAME] [--repeat N] [--compare COMMIT]
+
+The time of each benchmark is split into the time spent in CDO and NCO
+(from nctoolkit's record of the commands it ran) and the time spent in Python,
+so that regressions in Python overhead show up separately from changes in CDO.
+Results are saved to benchmarks/results/<commit>.json.
+"""
+
+import argparse
+import inspect
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+from nctoolkit.instrument import records
+
+from . import benchmarks
+
+
+results_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def commit():
+    """
+    Function to get the commit being benchmarked
+    """
+    out = subprocess.run(
+        "git rev-parse HEAD",
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        cwd=os.path.dirname(results_dir),
+    )
+    sha = out.stdout.decode("utf-8").strip()
+    return sha if out.returncode == 0 and sha != "" else "unknown"
+
+
+def cases():
+    """
+    Function to find the benchmarks, as (name, class, method, params) tuples
+    """
+    for name, cls in inspect.getmembers(benchmarks, inspect.isclass):
+        if cls.__module__ != benchmarks.__name__:
+            continue
+        methods = [x for x in dir(cls) if x.startswith("time_")]
+        if len(methods) == 0:
+            continue
+
+        params = getattr(cls, "params", [])
+        if len(params) > 0 and not isinstance(params[0], list):
+            params = [params]
+        for method in methods:
+            for combination in itertools.product(*params):
+                yield f"{name}.{method}", cls, method, list(combination)
+
+
+def measure(cls, method, params, repeat):
+    """
+    Function to time a benchmark, splitting its time between CDO/NCO and Python
+    """
+    totals = []
+    external = []
+    commands = []
+    for i in range(repeat):
+        case = cls()
+        if hasattr(case, "setup"):
+            case.setup(*params)
+        n = records.mark()
+        start = time.perf_counter()
+        getattr(case, method)(*params)
+        totals.append(time.perf_counter() - start)
+        new_records = records.since(n)
+        external.append(sum(x["wall_time"] for x in new_records))
+        commands.append(len(new_records))
+        if hasattr(case, "teardown"):
+            case.teardown(*params)
+
+    total = statistics.median(totals)
+    cdo = statistics.median(external)
+    return {
+        "params": params,
+        "total": total,
+        "cdo": cdo,
+        "python": max(0, total - cdo),
+        "commands": max(commands),
+    }
+
+
+def compare(results, previous):
+    """
+    Function to print how the Python and CDO times have changed since a previous run
+    """
+    print(f"{'benchmark':60} {'python':>10} {'cdo':>10}")
+    for key, x in results.items():
+        if key not in previous:
+            continue
+        y = previous[key]
+        ratios = []
+        for part in ["python", "cdo"]:
+            if y[part] > 0:
+                ratios.append(f"{x[part] / y[part]:10.2f}")
+            else:
+                ratios.append(f"{'-':>10}")
+        print(f"{key:60} {ratios[0]} {ratios[1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the nctoolkit benchmarks")
+    parser.add_argument(
+        "--filter", default="", help="only run benchmarks with this in their name"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=None, help="number of times to run each one"
+    )
+    parser.add_argument(
+        "--compare", default=None, help="commit to compare the results with"
+    )
+    args = parser.parse_args()
+
+    results = dict()
+    for name, cls, method, params in cases():
+        key = f"{name}({', '.join(str(x) for x in params)})"
+        if args.filter not in key:
+            continue
+        repeat = args.repeat if args.repeat is not None else cls.repeat
+        results[key] = measure(cls, method, params, repeat)
+        x = results[key]
+        print(
+            f"{key:60} {x['total']:9.3f}s python {x['python']:8.3f}s cdo {x['cdo']:8.3f}s"
+        )
+
+    sha = commit()
+    os.makedirs(results_dir, exist_ok=True)
+    with open(os.path.join(results_dir, f"{sha}.json"), "w") as f:
+        json.dump(
+            {
+                "commit": sha,
+                "date": time.time(),
+                "machine": platform.node(),
+                "python": platform.python_version(),
+                "results": results,
+            },
+            f,
+            indent=1,
+        )
+
+    if args.compare is not None:
+        with open(os.path.join(results_dir, f"{args.compare}.json")) as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import netCDF4
+
+
+def grid(nx, ny, curvilinear=False):
+    """
+    Function to create the longitudes and latitudes of a global grid
+
+    Curvilinear grids are a regular grid rotated, so that lon and lat are 2D
+    """
+    lon = np.linspace(-180 + 180 / nx, 180 - 180 / nx, nx)
+    lat = np.linspace(-90 + 90 / ny, 90 - 90 / ny, ny)
+
+    if curvilinear is False:
+        return lon, lat
+
+    lon2, lat2 = np.meshgrid(lon, lat)
+    lon2 = lon2 + 5 * np.sin(np.radians(lat2))
+    lat2 = np.clip(lat2 + 2 * np.sin(np.radians(lon2)), -89.9, 89.9)
+    return lon2, lat2
+
+
+def generate(
+    directory,
+    nx=360,
+    ny=180,
+    curvilinear=False,
+    variables=1,
+    levels=1,
+    timesteps=12,
+    files=1,
+    compression=False,
+    seed=0,
+):
+    """
+    Function to write a synthetic netCDF dataset
+
+    Parameters
+    -------------
+    directory : str
+        Directory to write the files to
+    nx, ny : int
+        Number of grid cells in the x and y directions
+    curvilinear : bool
+        Whether the grid is curvilinear, with 2D longitudes and latitudes
+    variables : int
+        Number of variables. Variables are called var1, var2 etc.
+    levels : int
+        Number of vertical levels. There is no vertical axis if this is 1
+    timesteps : int
+        Number of daily time steps in each file
+    files : int
+        Number of files. Each file covers the time steps after the previous one
+    compression : bool
+        Whether to compress the variables (zlib, level 1)
+    seed : int
+        Random seed
+
+    Returns
+    -------------
+    list
+        The files written
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    lon, lat = grid(nx, ny, curvilinear)
+
+    if curvilinear:
+        pattern = np.cos(np.radians(lat)) * 20
+    else:
+        pattern = np.cos(np.radians(lat))[:, None] * 20 + np.zeros((ny, nx))
+
+    paths = []
+    for i in range(files):
+        ff = os.path.join(directory, f"synthetic_{i:04d}.nc")
+        paths.append(ff)
+
+        with netCDF4.Dataset(ff, "w", format="NETCDF4") as nc:
+            nc.createDimension("time", None)
+            dims = ["time"]
+            if levels > 1:
+                nc.createDimension("depth", levels)
+                depth = nc.createVariable("depth", "f8", ("depth",))
+                depth.units = "m"
+                depth.positive = "down"
+                depth.axis = "Z"
+                depth[:] = np.linspace(0, 10 * (levels - 1), levels)
+                dims.append("depth")
+
+            if curvilinear:
+                nc.createDimension("y", ny)
+                nc.createDimension("x", nx)
+                dims += ["y", "x"]
+                lons = nc.createVariable("lon", "f8", ("y", "x"))
+                lats = nc.createVariable("lat", "f8", ("y", "x"))
+            else:
+                nc.createDimension("lat", ny)
+                nc.createDimension("lon", nx)
+                dims += ["lat", "lon"]
+                lons = nc.createVariable("lon", "f8", ("lon",))
+                lats = nc.createVariable("lat", "f8", ("lat",))
+                lons.axis = "X"
+                lats.axis = "Y"
+            lons.units = "degrees_east"
+            lons.standard_name = "longitude"
+            lats.units = "degrees_north"
+            lats.standard_name = "latitude"
+            lons[:] = lon
+            lats[:] = lat
+
+            times = nc.createVariable("time", "f8", ("time",))
+            times.units = "days since 2000-01-01 00:00:00"
+            times.calendar = "standard"
+            times.standard_name = "time"
+            times.axis = "T"
+            times[:] = np.arange(i * timesteps, (i + 1) * timesteps)
+
+            for j in range(variables):
+                var = nc.createVariable(
+                    f"var{j + 1}",
+                    "f4",
+                    tuple(dims),
+                    zlib=compression,
+                    complevel=1,
+                    fill_value=np.float32(-9999),
+                )
+                var.units = "K"
+                var.long_name = f"Synthetic variable {j + 1}"
+                if curvilinear:
+                    var.coordinates = "lon lat"
+                shape = [timesteps] + ([levels] if levels > 1 else []) + [ny, nx]
+                values = rng.normal(size=shape).astype("f4") + pattern + j
+                var[:] = values
+
+    return paths
+
+
+def dataset(**kwargs):
+    """
+    Function to get the files of a synthetic dataset, generating them the first time
+    they are needed. Files are kept in the system temp directory between runs
+    """
+    key = hashlib.sha1(str(sorted(kwargs.items())).encode("utf-8")).hexdigest()[:12]
+    directory = os.path.join(tempfile.gettempdir(), "nctoolkit_benchmarks", key)
+    files = kwargs.get("files", 1)
+    paths = [os.path.join(directory, f"synthetic_{i:04d}.nc") for i in range(files)]
+    if all(os.path.exists(x) for x in paths):
+        return paths
+
+    # write to a scratch directory first, so interrupted runs leave nothing behind
+    shutil.rmtree(directory + ".part", ignore_errors=True)
+    shutil.rmtree(directory, ignore_errors=True)
+    generate(directory + ".part", **kwargs)
+    os.rename(directory + ".part", directory)
+    return paths
@@ -26,10 +26,16 @@ import signal
 
 atexit.register(clean_all)
 
-signal.signal(signal.SIGTERM, clean_all)
+from nctoolkit.runners import terminate
+
+signal.signal(signal.SIGTERM, terminate)
 
 from nctoolkit.create_ensemble import create_ensemble
+from nctoolkit.run import run_all
 from nctoolkit.session import session_files
+from nctoolkit.instrument import session_stats
+from nctoolkit.overhead import overhead_report
+from nctoolkit.checkpoint import checkpoint_status
 from nctoolkit.show import nc_variables, nc_years, nc_months, nc_times
 
 from nctoolkit.utils import validate_version, cdo_version
@@ -10,6 +10,7 @@ from nctoolkit.temp_file import temp_file
 from nctoolkit.session import remove_safe, session_info, nc_safe_par, nc_safe
 from nctoolkit.api import update_options
 from nctoolkit.runners import ann_anomaly
+from nctoolkit.scheduler import Scheduler
 
 if platform.system() == "Linux":
     import multiprocessing as mp
@@ -140,13 +141,10 @@ def annual_anomaly(self, baseline=None, metric="absolute", window=1, align="righ
         # loop over the files and calculate the anomaly in parallel
         cores = session_info["cores"]
 
-        target_list = []
-        results = dict()
-
-        pool = mp.get_context('fork').Pool(cores)
+        scheduler = Scheduler(cores)
         precision = copy.deepcopy(self._precision)
         for ff in self:
-            results[ff] = pool.apply_async(
+            scheduler.submit(
                 ann_anomaly,
                 [
                     ff,
@@ -159,15 +157,12 @@ def annual_anomaly(self, baseline=None, metric="absolute", window=1, align="righ
                     new_commands,
                     nc_safe_par,
                 ],
+                size=os.path.getsize(ff) if os.path.isfile(ff) else None,
             )
-        for k, v in results.items():
-            out = v.get()
+        for out in scheduler.run():
             if "Check that the years in baseline are in the dataset!" in str(out):
                 raise ValueError("Check that the years in baseline are in the dataset!")
 
-        pool.close()
-        pool.join()
-
         self.history += list(new_commands)
         self._hold_history = copy.deepcopy(self.history)
 
@@ -15,6 +15,7 @@ import platform
 from netCDF4 import Dataset
 
 from nctoolkit.cleanup import cleanup, temp_check
+from nctoolkit.runners import run_shell
 from nctoolkit.runthis import run_cdo
 from nctoolkit.session import (
     nc_protected,
@@ -24,6 +25,8 @@ from nctoolkit.session import (
     session_files,
     append_safe,
     remove_safe,
+    append_safe_group,
+    remove_safe_group,
     append_protected,
     remove_protected,
     append_tempdirs,
@@ -38,6 +41,9 @@ from nctoolkit.show import (
     nc_format,
 )
 from nctoolkit.temp_file import temp_file
+from nctoolkit.overhead import account, instrument
+from nctoolkit.history import CompactHistory
+from nctoolkit.instrument import Profile
 
 
 # context manager code so that thredds checks will be stopped if slow
@@ -143,15 +149,24 @@ session_info["coast"] = None
 session_info["interactive"] = sys.__stdin__.isatty()
 
 
-if platform.system() == "Linux":
-    result = os.statvfs("/tmp/")
-    session_info["size"] = result.f_frsize * result.f_bavail
-else:
-    session_info["size"] = 0
-
-
-session_info["latest_size"] = 0
+session_info["temp_tiers"] = None
+session_info["shm_size"] = 0
+session_info["temp_format"] = None
+session_info["temp_compression"] = None
+session_info["temp_precision"] = None
+session_info["stage_dir"] = None
+session_info["stage_size"] = 1e10
+session_info["prefetch"] = 0
 session_info["cores"] = 1
+session_info["tiling"] = False
+session_info["split_size"] = 1e9
+session_info["adaptive"] = False
+session_info["overhead"] = False
+session_info["checkpoint_dir"] = None
+session_info["retries"] = 0
+session_info["timeout"] = None
+session_info["memory_limit"] = None
+session_info["cost_history"] = False
 
 if platform.system() == "Linux":
     append_tempdirs("/tmp")
@@ -170,6 +185,23 @@ def update_options(kwargs):
         "progress",
         "coast",
         "user",
+        "tiling",
+        "split_size",
+        "adaptive",
+        "temp_tiers",
+        "shm_size",
+        "temp_format",
+        "temp_compression",
+        "temp_precision",
+        "stage_dir",
+        "stage_size",
+        "prefetch",
+        "overhead",
+        "checkpoint_dir",
+        "retries",
+        "timeout",
+        "memory_limit",
+        "cost_history",
     ]
 
     for key in kwargs:
@@ -177,7 +209,15 @@ def update_options(kwargs):
         if key not in valid_keys:
             raise AttributeError(key + " is not a valid option")
 
-        if key == "parallel" or key == "lazy" or key == "thread_safe":
+        if key in [
+            "parallel",
+            "lazy",
+            "thread_safe",
+            "tiling",
+            "adaptive",
+            "overhead",
+            "cost_history",
+        ]:
             if not isinstance(kwargs[key], bool):
                 raise TypeError(f"{key} should be boolean")
 
@@ -191,6 +231,131 @@ def update_options(kwargs):
                 raise TypeError(f"{key} should be boolean")
             find = False
 
+        if key == "temp_tiers":
+            if not isinstance(kwargs[key], list) or len(kwargs[key]) == 0:
+                raise TypeError("temp_tiers must be a list of directories")
+            tiers = []
+            for tier in kwargs[key]:
+                if isinstance(tier, str):
+                    tier = (tier, None)
+                if not isinstance(tier, tuple) or len(tier) != 2:
+                    raise TypeError(
+                        "temp_tiers must be directories or (directory, quota) tuples"
+                    )
+                if not isinstance(tier[0], str) or not os.path.exists(tier[0]):
+                    raise ValueError(f"The temp tier {tier[0]} does not exist!")
+                if tier[1] is not None:
+                    if isinstance(tier[1], bool) or not isinstance(
+                        tier[1], (int, float)
+                    ):
+                        raise TypeError("Temp tier quotas must be numbers")
+                    if tier[1] < 0:
+                        raise ValueError("Temp tier quotas must be positive")
+                path = (os.path.abspath(tier[0]) + "/").replace("//", "/")
+                tiers.append((path, tier[1]))
+                append_tempdirs(path)
+            kwargs[key] = tiers
+            find = False
+
+        if key == "split_size":
+            if isinstance(kwargs[key], bool) or not isinstance(
+                kwargs[key], (int, float)
+            ):
+                raise TypeError("split_size must be a number")
+            if kwargs[key] < 0:
+                raise ValueError("split_size must be positive")
+            find = False
+
+        if key == "temp_format":
+            if kwargs[key] not in [None, "nc", "nc1", "nc2", "nc4", "nc4c", "nc5"]:
+                raise ValueError(f"{kwargs[key]} is not a valid format!")
+            find = False
+
+        if key == "temp_compression":
+            if kwargs[key] is not None:
+                if isinstance(kwargs[key], bool) or not isinstance(kwargs[key], int):
+                    raise TypeError("temp_compression must be an int")
+                if kwargs[key] < 0 or kwargs[key] > 9:
+                    raise ValueError("temp_compression must be between 0 and 9")
+            find = False
+
+        if key == "temp_precision":
+            if kwargs[key] not in [None, "F32", "F64"]:
+                raise ValueError("temp_precision must be F32, F64 or None")
+            find = False
+
+        if key == "stage_dir":
+            if kwargs[key] is not None:
+                if not isinstance(kwargs[key], str):
+                    raise TypeError("stage_dir must be a str")
+                if os.path.exists(kwargs[key]) is False:
+                    raise ValueError("The stage_dir specified does not exist!")
+                kwargs[key] = os.path.abspath(kwargs[key])
+            find = False
+
+        if key == "stage_size":
+            if isinstance(kwargs[key], bool) or not isinstance(
+                kwargs[key], (int, float)
+            ):
+                raise TypeError("stage_size must be a number")
+            if kwargs[key] < 0:
+                raise ValueError("stage_size must be positive")
+            find = False
+
+        if key == "prefetch":
+            if isinstance(kwargs[key], bool) or not isinstance(kwargs[key], int):
+                raise TypeError("prefetch must be an int")
+            if kwargs[key] < 0:
+                raise ValueError("prefetch must be positive")
+            find = False
+
+        if key == "checkpoint_dir":
+            if kwargs[key] is not None:
+                if not isinstance(kwargs[key], str):
+                    raise TypeError("checkpoint_dir must be a str")
+                if os.path.exists(kwargs[key]) is False:
+                    raise ValueError("The checkpoint_dir specified does not exist!")
+                kwargs[key] = os.path.abspath(kwargs[key])
+            find = False
+
+        if key == "retries":
+            if isinstance(kwargs[key], bool) or not isinstance(kwargs[key], int):
+                raise TypeError("retries must be an int")
+            if kwargs[key] < 0:
+                raise ValueError("retries must be positive")
+            find = False
+
+        if key == "timeout":
+            if kwargs[key] is not None:
+                if isinstance(kwargs[key], bool) or not isinstance(
+                    kwargs[key], (int, float)
+                ):
+                    raise TypeError("timeout must be a number")
+                if kwargs[key] <= 0:
+                    raise ValueError("timeout must be positive")
+            find = False
+
+        if key == "memory_limit":
+            if kwargs[key] is not None:
+                if isinstance(kwargs[key], bool) or not isinstance(
+                    kwargs[key], (int, float)
+                ):
+                    raise TypeError("memory_limit must be a number")
+                if kwargs[key] <= 0:
+                    raise ValueError("memory_limit must be positive")
+            find = False
+
+        if key == "shm_size":
+            if isinstance(kwargs[key], bool) or not isinstance(
+                kwargs[key], (int, float)
+            ):
+                raise TypeError("shm_size must be a number")
+            if kwargs[key] < 0:
+                raise ValueError("shm_size must be positive")
+            if kwargs[key] > 0:
+                append_tempdirs("/dev/shm")
+            find = False
+
         if not isinstance(kwargs[key], bool) and find:
             if key == "temp_dir":
                 if isinstance(kwargs[key], str):
@@ -308,6 +473,37 @@ def options(**kwargs):
         Set  = "/foo" if you want to change the temporary directory used by nctoolkit to save temporary files.
         Set progress to "on" or "off" if you always or never want a progress bar to show when multi-file datasets are processed. This defaults to "auto", i.e.
         nctoolkit will automatically decide whether to show a progress bar based on the size of the ensemble.
+        Set tiling = True if you want spatially local operations on large single files to be split into horizontal tiles,
+        which are processed in parallel using the available cores and then collected back together.
+        Set split_size = n to change the size, in bytes, above which files will be split for parallel processing. Defaults to 1e9.
+        Set adaptive = True if you want nctoolkit to adjust the number of CDO processes running at once, between 1 and cores,
+        based on the measured throughput. This is useful on file systems where too many concurrent readers slow things down.
+        Set temp_tiers = ["/foo", ("/bar", 5e10)] if you want temporary files to be written to the first of these directories
+        with enough space. Each directory can be given a quota in bytes. Defaults to /tmp followed by /var/tmp on Linux.
+        Set shm_size = n if you want temporary files expected to be smaller than n bytes to be kept in RAM, in /dev/shm.
+        They are moved to disk if RAM starts to fill up. Defaults to 0, i.e. not used.
+        Set temp_format, temp_compression and temp_precision to change how temporary files are written. temp_format is the
+        netCDF format, e.g. "nc4" or "nc5", temp_compression is the compression level (0-9), and temp_precision = "F32"
+        stores temporary files as 32 bit floats. These default to None, i.e. CDO's default. They do not change how
+        to_nc compresses files.
+        Set stage_dir = "/foo" if you want uncompressed copies of compressed input files to be kept in /foo, so that
+        they only need to be decompressed once, including in later sessions. stage_size sets the maximum size of
+        the copies in bytes, with the least recently used removed first. Defaults to 1e10.
+        Set prefetch = n if you want the next n input files of multi-file datasets to be copied to temporary storage while
+        the current files are processed. This is useful when files are on slow or network file systems. Defaults to 0.
+        Set overhead = True if you want the time used by each dataset method to be split into time spent in nctoolkit and
+        time spent waiting on CDO or NCO. See overhead_report.
+        Set checkpoint_dir = "/foo" if you want the outputs for each file in multi-file datasets to be kept in /foo, so that
+        if processing is interrupted, running it again will skip the files already processed. Files that fail are retried
+        retries times, and then left out of the dataset instead of stopping processing. See checkpoint_status.
+        Set timeout = n if you want CDO and NCO commands that run for longer than n seconds to be killed, with an error
+        raised. Defaults to None, i.e. no time limit.
+        Set memory_limit = n if you want each CDO and NCO command to be limited to n bytes of (virtual) memory. Commands that
+        run out of memory are split into smaller pieces, e.g. by time, which are run one at a time and then combined.
+        Defaults to None, i.e. no limit.
+        Set cost_history = True if you want the throughput and output sizes of CDO operators, which explain uses to
+        estimate run times and output sizes, to be stored in ~/.nctoolkit/costs.json and used in later sessions.
+        Defaults to False.
 
     Examples
     ------------
@@ -634,12 +830,7 @@ def open_data(x=[], checks=True, **kwargs):
                     if checks:
                         if wait is not None:
                             with time_limit(stop_time):
-                                out = subprocess.run(
-                                    "cdo sinfo " + x,
-                                    shell=True,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE,
-                                )
+                                out = run_shell("cdo sinfo " + x)
                                 if "Open failed" in str(out.stderr):
                                     raise ValueError(f"{x} is not compatible with CDO!")
 
@@ -647,12 +838,7 @@ def open_data(x=[], checks=True, **kwargs):
                 raise FileNotFoundError("Data set " + x + " does not exist!")
 
         if checks:
-            out = subprocess.run(
-                "cdo sinfo " + x,
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
+            out = run_shell("cdo sinfo " + x)
             if "Open failed" in out.stderr.decode("utf-8"):
                 mes = (
                     out.stderr.decode("utf-8")
@@ -1089,15 +1275,40 @@ class DataSet(object):
     A modifiable ensemble of netCDF files
     """
 
+    # the state is kept compact, and shared between copies until one changes
+    __slots__ = (
+        "_history",
+        "__hold_history",
+        "_start",
+        "_current",
+        "_grouped",
+        "_execute",
+        "_merged",
+        "_safe",
+        "_thredds",
+        "_zip",
+        "_format",
+        "_align",
+        "_precision",
+        "_profile",
+        "_grid",
+        "_weights",
+        "_ncommands",
+        "_atts",
+        "__weakref__",
+    )
+
     def __init__(self, start=""):
         """Initialize the starting file name etc"""
         # Attribuates of interest to users
         self.history = []
         self.start = start
         if isinstance(start, str):
-            self._current = [start]
+            self._current = (sys.intern(start),)
         else:
-            self._current = start
+            self._current = tuple(sys.intern(x) for x in start)
+        # the files are on the safe list individually, not as a group
+        self._grouped = False
 
         # attributes to the module, but not users (probably)
         if session_info["lazy"]:
@@ -1115,6 +1326,9 @@ class DataSet(object):
 
         self._precision = "default"
 
+        # records of the commands run, see profile
+        self._profile = Profile()
+
         self._grid = None
         self._weights = None
         # track number of held over commands
@@ -1137,13 +1351,15 @@ class DataSet(object):
 
 
     def __getitem__(self, index):
-        return self.current[index]
+        if isinstance(index, slice):
+            return list(self._current[index])
+        return self._current[index]
 
     def __len__(self):
-        return len(self.current)
+        return len(self._current)
 
     def __iter__(self):
-        for ff in self.current:
+        for ff in self._current:
             yield ff
         return
 
@@ -1467,12 +1683,7 @@ class DataSet(object):
             for ff in self[0:n]:
                 dataset = Dataset(ff)
 
-                out = subprocess.run(
-                    "cdo sinfon " + ff,
-                    shell=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                )
+                out = run_shell("cdo sinfon " + ff)
                 if "Unsupported file structure" in str(out.stderr):
                     for ff in self:
                         remove_safe(ff)
@@ -1718,21 +1929,33 @@ class DataSet(object):
         list
             A list of the current files in the DataSet object
         """
-        return self._current
+        return list(self._current)
 
     @current.setter
     def current(self, value):
-        for ff in self:
-            remove_safe(ff)
-
         if isinstance(value, str):
-            append_safe(value)
-            self._current = [value]
-        if isinstance(value, list):
-            self._current = value
+            value = [value]
+        if not isinstance(value, (list, tuple)):
+            return
 
-            for ff in value:
-                append_safe(ff)
+        self._release()
+
+        # files are stored as a tuple, so copies of the dataset can share it
+        self._current = tuple(
+            sys.intern(x) if isinstance(x, str) else x for x in value
+        )
+        append_safe_group(self._current)
+        self._grouped = True
+
+    def _release(self):
+        """
+        Remove the dataset's files from the safe list
+        """
+        if self._grouped:
+            remove_safe_group(self._current)
+        else:
+            for ff in self._current:
+                remove_safe(ff)
 
     @property
     def history(self):
@@ -1748,7 +1971,21 @@ class DataSet(object):
 
     @history.setter
     def history(self, value):
-        self._history = value
+        if isinstance(value, CompactHistory):
+            self._history = value.copy()
+        else:
+            self._history = CompactHistory(value)
+
+    @property
+    def _hold_history(self):
+        return self.__hold_history
+
+    @_hold_history.setter
+    def _hold_history(self, value):
+        if isinstance(value, CompactHistory):
+            self.__hold_history = value.copy()
+        else:
+            self.__hold_history = CompactHistory(value)
 
     def copy(self):
         """
@@ -1761,8 +1998,19 @@ class DataSet(object):
         """
         self.run()
 
-        new = copy.deepcopy(self)
-        for ff in new:
+        # the files and history are shared with the copy, not copied
+        new = DataSet.__new__(DataSet)
+        for x in DataSet.__slots__[:-1]:
+            x = "_DataSet" + x if x.startswith("__") else x
+            setattr(new, x, getattr(self, x))
+        new.history = self._history
+        new._hold_history = self._hold_history
+        new._safe = list(self._safe)
+        new._atts = {k: list(v) for k, v in self._atts.items()}
+
+        append_safe_group(self._current)
+        new._grouped = True
+        for ff in new._safe:
             append_safe(ff)
         if self._weights is not None:
             append_safe(self._weights)
@@ -1771,12 +2019,10 @@ class DataSet(object):
 
     def __del__(self):
         if self is not None:
-            for ff in self:
-                if ff is not None:
-                    try:
-                        remove_safe(ff)
-                    except:
-                        blah = "blah"
+            try:
+                self._release()
+            except:
+                blah = "blah"
             for ff in self._safe:
                 if ff is not None:
                     try:
@@ -1926,6 +2172,9 @@ class DataSet(object):
     from nctoolkit.static_plot import pub_plot
     from nctoolkit.static_plot import quiver_plot
 
+    from nctoolkit.profile import profile
+    from nctoolkit.explain import explain
+
     from nctoolkit.reduce import reduce_dims
 
     from nctoolkit.reduce_grid import reduce_grid
@@ -1946,6 +2195,10 @@ class DataSet(object):
     from nctoolkit.rollstat import rolling_var
 
     from nctoolkit.run import run
+    from nctoolkit.run import iter_run
+    from nctoolkit.asynchronous import run_async
+    from nctoolkit.asynchronous import to_nc_async
+    from nctoolkit.asynchronous import to_xarray_async
 
     from nctoolkit.subset import subset
 
@@ -1992,6 +2245,8 @@ class DataSet(object):
 
     from nctoolkit.toxarray import to_xarray
     from nctoolkit.toxarray import to_dataframe
+    from nctoolkit.tonumpy import iter_chunks
+    from nctoolkit.tonumpy import to_numpy
 
     from nctoolkit.tozlev import to_zlevels
 
@@ -2018,3 +2273,8 @@ class DataSet(object):
 
     # deprecated methods
     from nctoolkit.deprecated import invert_levels
+
+
+# split the time used by methods between Python and CDO, see overhead_report
+instrument(DataSet)
+open_data = account("open_data", open_data)
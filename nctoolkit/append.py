@@ -1,6 +1,5 @@
 import os
 import warnings
-from nctoolkit.session import append_safe, remove_safe
 import nctoolkit.api as api
 
 
@@ -56,9 +55,7 @@ def append(self, x=None):
         if os.path.exists(ff) is False:
             raise ValueError(f"{ff} does not exist!")
 
-    for ff in x:
-        append_safe(ff)
-        self.current.append(ff)
+    self.current = self.current + x
 
 
 def remove(self, x=None):
@@ -88,9 +85,7 @@ def remove(self, x=None):
         if ff not in self:
             raise ValueError(f"{x} is not a member of the dataset!")
 
-    for ff in x:
-        self.current.remove(ff)
-        remove_safe(ff)
+    self.current = [ff for ff in self if ff not in x]
 
     # if files have been removed, we need to reset the attributes
     self._atts["variables"] = [None, -1]
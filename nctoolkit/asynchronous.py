@@ -0,0 +1,403 @@
+import asyncio
+import copy
+import functools
+import os
+import time
+import types
+import weakref
+
+from nctoolkit.cleanup import cleanup
+from nctoolkit.instrument import record
+from nctoolkit.run import start_run, end_run, pending_copy
+from nctoolkit.runners import (
+    children,
+    check_cdo,
+    classic,
+    kill_group,
+    memory_limit,
+    omp_threads,
+    prepare_cdo,
+    remove_partial,
+    run_cdo,
+)
+from nctoolkit.runthis import run_this
+from nctoolkit.session import session_info, remove_safe
+from nctoolkit.strategies import out_of_memory
+from nctoolkit.to_nc import check_output
+
+
+# limits on the number of commands running at once in each event loop
+limits = weakref.WeakKeyDictionary()
+
+# asyncio reaps child processes itself, so their resource usage is not available
+no_usage = types.SimpleNamespace(ru_maxrss=0, ru_utime=0.0, ru_stime=0.0)
+
+
+def limit():
+    """
+    Function to get the semaphore limiting the commands running at once in the
+    current event loop to the number of cores
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in limits:
+        limits[loop] = asyncio.Semaphore(session_info["cores"])
+    return limits[loop]
+
+
+async def in_thread(func, *args, **kwargs):
+    """
+    Function to run a blocking function in a thread, e.g. for things asyncio cannot
+    do, like opening files in xarray
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+def blocking():
+    """
+    Function to work out whether getting commands ready to run can block, because
+    input files are staged or prefetched
+    """
+    return session_info["stage_dir"] is not None or session_info["prefetch"] > 0
+
+
+async def call(func, *args, **kwargs):
+    """
+    Function to call a function that may block, e.g. by waiting for files to be
+    staged or prefetched, in a thread if it can block
+    """
+    if blocking():
+        return await in_thread(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+
+async def execute_async(command, target=None):
+    """
+    Function to run a command in the shell without blocking the event loop
+
+    Returns the process and its output
+    """
+    start = time.time()
+    out = await asyncio.create_subprocess_exec(
+        "/bin/sh",
+        "-c",
+        memory_limit(command),
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        start_new_session=True,
+    )
+    children[out.pid] = target
+
+    try:
+        result, error = await asyncio.wait_for(
+            out.communicate(), session_info["timeout"]
+        )
+    except asyncio.TimeoutError:
+        kill_group(out.pid)
+        await out.wait()
+        record(command, target, start, time.time(), no_usage, out.returncode)
+        remove_partial(target)
+        raise ValueError(
+            f"The command timed out after {session_info['timeout']} seconds: {command}"
+        )
+    except BaseException:
+        # e.g. the coroutine was cancelled
+        kill_group(out.pid)
+        remove_partial(target)
+        raise
+    finally:
+        children.pop(out.pid, None)
+
+    record(command, target, start, time.time(), no_usage, out.returncode)
+
+    return out, result
+
+
+def may_rerun(returncode, result):
+    """
+    Function to work out whether checking the output of a CDO command could run it
+    again, e.g. with a different precision
+    """
+    text = result.decode("utf-8", errors="ignore")
+    return (
+        returncode != 0
+        or out_of_memory(result, returncode)
+        or "Use the CDO option -b F32" in text
+        or "not represent" in text
+        or text.startswith("Error")
+        or "HDF error" in text
+    )
+
+
+async def run_cdo_async(
+    command=None,
+    target=None,
+    out_file=None,
+    overwrite=False,
+    precision="default",
+    threads=None,
+):
+    """
+    Function to run a CDO command without blocking the event loop
+    """
+    start_target = target
+
+    command, target = prepare_cdo(
+        command, target, out_file, overwrite, precision, threads
+    )
+
+    async with limit():
+        out, result = await execute_async(command, target)
+
+    # commands that need to be run again are dealt with in a thread
+    if may_rerun(out.returncode, result):
+        return await in_thread(
+            check_cdo, command, target, start_target, out_file, precision, out, result
+        )
+
+    return check_cdo(command, target, start_target, out_file, precision, out, result)
+
+
+class AsyncScheduler:
+    """
+    Scheduler that runs tasks in the event loop, with the same interface as
+    Scheduler. The number of commands running at once is limited by the cores
+    """
+
+    def __init__(self):
+        self.tasks = []
+        self.hooks = []
+
+    def submit(
+        self,
+        func,
+        args,
+        size=None,
+        threaded=False,
+        space=None,
+        target=None,
+        prepare=None,
+        finish=None,
+    ):
+        self.tasks.append((func, list(args), threaded))
+        self.hooks.append((prepare, finish))
+        return len(self.tasks) - 1
+
+    async def run(self):
+        """
+        Run the tasks, and return their results in the order they were submitted
+        """
+        width = min(session_info["cores"], len(self.tasks))
+
+        async def run_task(i):
+            func, args, threaded = self.tasks[i]
+            prepare, finish = self.hooks[i]
+            if prepare is not None:
+                # this waits for the input file to be prefetched
+                args = await call(prepare, args)
+            if threaded:
+                args = args + [omp_threads(width)]
+            try:
+                if func is run_cdo:
+                    return await run_cdo_async(*args)
+                # e.g. checkpointed tasks, which retry commands that fail
+                return await in_thread(func, *args)
+            finally:
+                if finish is not None:
+                    await call(finish)
+
+        tasks = [asyncio.ensure_future(run_task(i)) for i in range(len(self.tasks))]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+
+async def run_pending(self, cdo_command, output="ensemble", out_file=None):
+    """
+    Function to run the stored commands in a dataset in the event loop
+    """
+    scheduler = AsyncScheduler()
+    # input files are staged while the commands are being added
+    finish = await call(
+        run_this,
+        cdo_command,
+        self,
+        output=output,
+        out_file=out_file,
+        suppress=True,
+        scheduler=scheduler,
+    )
+
+    # merged datasets are run straight away
+    if finish is None:
+        return None
+
+    try:
+        results = await scheduler.run()
+    except BaseException as e:
+        # this waits for the prefetching thread to stop
+        await call(finish, None)
+        self.reset()
+        if isinstance(e, Exception):
+            raise ValueError(e)
+        raise
+
+    try:
+        await call(finish, results)
+    except Exception as e:
+        self.reset()
+        raise ValueError(e)
+    finally:
+        # the commands were run in this process, so their outputs were made safe
+        for ff in results:
+            if ff is not None:
+                remove_safe(ff)
+
+
+async def run_async(self):
+    """
+    Run all stored commands in a dataset, without blocking the event loop
+
+    CDO is run using asyncio subprocesses, so many datasets can be run at once
+    from a single thread, e.g. in a web service. At most cores commands, as set
+    using options, are run at once in each event loop. Merged datasets are run in
+    a separate thread.
+
+    Examples
+    ------------
+    If evaluation is lazy and you need to evaluate commands on a dataset in a
+    coroutine, do the following:
+
+    >>> await ds.run_async()
+
+    """
+
+    if self._merged and len(self) > 1:
+        await in_thread(self.run)
+        return None
+
+    start = start_run(self)
+
+    if start is not None:
+        cdo_command, output_method = start
+
+        await run_pending(self, cdo_command, output_method)
+
+        end_run(self)
+
+
+async def to_nc_async(self, out, zip=True, overwrite=False, **kwargs):
+    """
+    Save a dataset to a named file, without blocking the event loop
+
+    This will only work with single file datasets. See to_nc and run_async.
+
+    Parameters
+    -------------
+    out : str
+        Output file name.
+    zip : boolean
+        True/False depending on whether you want to zip the file. Default is True.
+    overwrite : boolean
+        If out file exists, do you want to overwrite it? Default is False.
+    **kwargs : kwargs
+        Optional arguments to be sent to subset.
+
+    Examples
+    ------------
+    If you want to export a dataset to a netCDF file in a coroutine, do the following:
+
+        >>> await ds.to_nc_async("out.nc")
+
+    """
+
+    if self._merged and len(self) > 1:
+        await in_thread(self.to_nc, out, zip, overwrite, **kwargs)
+        return None
+
+    out = check_output(self, out, overwrite)
+
+    # intermediate files may be in a format that cannot be compressed
+    zip_format = ""
+    if session_info["temp_format"] in classic:
+        zip_format = "-f nc4 "
+
+    # copy would run the stored commands without using the event loop
+    ds = self
+    if len(kwargs) > 0:
+        ds = pending_copy(self, self.current)
+        ds.subset(**kwargs)
+        await ds.run_async()
+
+    if len(ds.history) == len(ds._hold_history):
+        if zip:
+            cdo_command = f"cdo {zip_format}-z zip_9 copy {ds[0]} {out}"
+        else:
+            cdo_command = f"cdo copy {ds[0]} {out}"
+        await run_cdo_async(
+            cdo_command, target=out, overwrite=overwrite, precision=ds._precision
+        )
+        ds.history.append(cdo_command)
+        ds._hold_history = copy.deepcopy(ds.history)
+        ds.current = out
+        remove_safe(out)
+    else:
+        if zip:
+            cdo_command = f"cdo {zip_format}-z zip_9 "
+        else:
+            cdo_command = "cdo "
+
+        ds._execute = True
+        try:
+            await run_pending(ds, cdo_command, out_file=out)
+        finally:
+            ds._execute = False
+        ds.current = out
+
+    if os.path.exists(out) is False:
+        raise ValueError("File zipping was not successful")
+
+    cleanup()
+
+
+async def to_xarray_async(self, decode_times=True, **kwargs):
+    """
+    Open a dataset as an xarray object, without blocking the event loop
+
+    The stored commands are run using run_async, and the files are then opened in a
+    separate thread. See to_xarray.
+
+    Parameters
+    -------------
+    decode_times: boolean
+        Set to False if you do not want xarray to decode the times. Default is True.
+    **kwargs : kwargs
+        Optional arguments to be sent to subset.
+
+    Returns
+    ---------------
+    to_xarray_async :  xarray.Dataset
+
+    Examples
+    ------------
+    If you want to convert a dataset to an xarray dataset in a coroutine, do the
+    following:
+
+    >>> data = await ds.to_xarray_async()
+
+    """
+
+    # copy would run the stored commands without using the event loop
+    ds = self
+    if len(kwargs) > 0:
+        ds = pending_copy(self, self.current)
+        ds.subset(**kwargs)
+
+    await ds.run_async()
+
+    return await in_thread(ds.to_xarray, decode_times)
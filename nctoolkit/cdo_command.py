@@ -1,6 +1,6 @@
-import subprocess
 import os
 
+from nctoolkit.runners import run_shell
 from nctoolkit.runthis import run_this
 from nctoolkit.session import session_info
 
@@ -37,12 +37,7 @@ def cdo_command(self, command=None, ensemble=False, check=False):
         command = command.replace("cdo ", " ").strip()
 
     if check:
-        read = subprocess.run(
-            "cdo --operators",
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        ).stdout
+        read = run_shell("cdo --operators").stdout
 
         cdo_methods = [
             x.split(" ")[0].replace("b'", "") for x in str(read).split("\\n")
@@ -0,0 +1,188 @@
+import fcntl
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from nctoolkit.instrument import count
+from nctoolkit.session import session_info
+
+
+def manifest_file(checkpoint_dir):
+    """
+    Function to get the manifest of a checkpoint directory
+    """
+    return os.path.join(checkpoint_dir, "manifest.jsonl")
+
+
+def checkpoint_key(command, ff):
+    """
+    Function to identify the output of a command run on a file. The key changes if
+    the command or the file changes
+    """
+    info = os.stat(ff)
+    source = f"{command}|{os.path.abspath(ff)}|{info.st_size}|{info.st_mtime_ns}"
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+
+def checkpoint_target(checkpoint_dir, key):
+    """
+    Function to get the file a checkpointed command writes to
+    """
+    return os.path.join(checkpoint_dir, f"{key}.nc")
+
+
+def remove_target(target):
+    """
+    Function to remove output left by a failed attempt
+    """
+    try:
+        os.remove(target)
+    except OSError:
+        pass
+
+
+def read_manifest(checkpoint_dir):
+    """
+    Function to read the latest entry for each key in a manifest
+    """
+    entries = dict()
+    try:
+        with open(manifest_file(checkpoint_dir)) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # a line being written when a process crashed
+                    continue
+                entries[entry["key"]] = entry
+    except OSError:
+        pass
+    return entries
+
+
+def completed(checkpoint_dir):
+    """
+    Function to find the outputs that have been completed and still exist
+    """
+    return {
+        k: v["output"]
+        for k, v in read_manifest(checkpoint_dir).items()
+        if v["status"] == "done" and os.path.exists(v["output"])
+    }
+
+
+def record(checkpoint_dir, entry):
+    """
+    Function to add an entry to a manifest. Entries are appended, so this is safe
+    to do from several processes at once
+    """
+    with open(manifest_file(checkpoint_dir), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def attempt(func, args, kwargs, checkpoint_dir, key, source, command):
+    """
+    Function to run a task on a file, retrying it if it fails, and record the
+    outcome in the manifest. The error from the first attempt is recorded. Returns
+    None if every attempt failed
+    """
+    target = checkpoint_target(checkpoint_dir, key)
+    attempts = session_info["retries"] + 1
+    error = None
+    for i in range(attempts):
+        # partial output from an earlier attempt or run would stop the command
+        # being run again
+        remove_target(target)
+        try:
+            output = func(*args, **kwargs)
+        except Exception as e:
+            if error is None:
+                error = str(e)
+            continue
+        record(
+            checkpoint_dir,
+            {
+                "key": key,
+                "source": source,
+                "command": command,
+                "output": output,
+                "status": "done",
+                "attempts": i + 1,
+            },
+        )
+        return output
+
+    remove_target(target)
+    count("checkpoint_failures")
+    record(
+        checkpoint_dir,
+        {
+            "key": key,
+            "source": source,
+            "command": command,
+            "output": None,
+            "status": "failed",
+            "attempts": attempts,
+            "error": error,
+        },
+    )
+    return None
+
+
+def run_task(
+    command, target, out_file, overwrite, precision, checkpoint, threads=None
+):
+    """
+    Function to run a checkpointed command in a worker process
+
+    checkpoint is a tuple of the checkpoint directory, key, source and the command
+    as recorded in the history
+    """
+    from nctoolkit.runners import run_cdo
+
+    return attempt(
+        run_cdo,
+        [command, target, out_file, overwrite, precision],
+        {"threads": threads},
+        *checkpoint,
+    )
+
+
+def checkpoint_status(checkpoint_dir=None):
+    """
+    Get the status of the files processed using checkpointing
+
+    Parameters
+    -------------
+    checkpoint_dir : str
+        The checkpoint directory. Defaults to the one set using options
+
+    Returns
+    -------------
+    pandas.DataFrame
+        One row per file and command, with the status ("done" or "failed"), the
+        number of attempts, the output file and the error message of failures
+
+    Examples
+    ------------
+    If you want to see which files failed, do the following:
+
+    >>> nc.checkpoint_status().query("status == 'failed'")
+
+    """
+    if checkpoint_dir is None:
+        checkpoint_dir = session_info["checkpoint_dir"]
+    if checkpoint_dir is None:
+        raise ValueError("Please provide a checkpoint directory")
+
+    columns = ["source", "command", "status", "attempts", "output", "error"]
+    entries = list(read_manifest(checkpoint_dir).values())
+    return pd.DataFrame(entries, columns=columns)
@@ -1,9 +1,10 @@
 import xarray as xr
 from nctoolkit.temp_file import temp_file
 from netCDF4 import Dataset
-import subprocess
 import warnings
 
+from nctoolkit.runners import execute
+
 
 def is_corrupt(self):
     """
@@ -17,14 +18,7 @@ def is_corrupt(self):
     for ff in self:
         the_temp = temp_file() + "nc"
         command = f"cdo -copy {ff}  {the_temp}"
-        out = subprocess.Popen(
-            command,
-            shell=True,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-        )
-        result, ignore = out.communicate()
+        out, result = execute(command, the_temp)
         if "error" in str(result):
             print(f"{ff} appears to be corrupt")
             return True
@@ -125,14 +119,7 @@ def check(self):
                 else:
                     command = f"cfchecks {ff}"
 
-                out = subprocess.Popen(
-                    command,
-                    shell=True,
-                    stdin=subprocess.PIPE,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                )
-                result, ignore = out.communicate()
+                out, result = execute(command)
 
                 result_split = result.decode("utf-8").split("\n")
                 splits = [
@@ -174,14 +161,7 @@ def check(self):
     try:
         for ff in self:
             command = f"cdo griddes {ff}"
-            out = subprocess.Popen(
-                command,
-                shell=True,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-            )
-            result, ignore = out.communicate()
+            out, result = execute(command)
 
             result = result.decode("utf-8")
             if result.count("gridID") > 1:
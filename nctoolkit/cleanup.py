@@ -14,6 +14,16 @@ from nctoolkit.session import (
     remove_safe,
     get_safe,
 )
+from nctoolkit.tempstore import (
+    tier_of,
+    tiers,
+    has_room,
+    used_space,
+    choose_dir,
+    tidy_dir,
+    shm_tier,
+    shm_pressure,
+)
 
 
 def file_age_in_seconds(pathname):
@@ -49,8 +59,10 @@ def cleanup():
     candidates = [x for x in candidates if os.path.exists(x)]
 
     valid_files = get_safe()
+    if isinstance(valid_files, list):
+        valid_files = set(valid_files)
 
-    delete_these = [v for v in candidates if v not in list(valid_files)]
+    delete_these = [v for v in candidates if v not in valid_files]
 
     delete_these = list(set(delete_these))
 
@@ -66,20 +78,6 @@ def cleanup():
         if os.path.exists(dd):
             nc_remove(dd)
 
-    # only update the session size on linux
-
-    if session_info["user_dir"] is False:
-        if platform.system() == "Linux":
-            result = os.statvfs("/tmp/")
-            result = result.f_frsize * result.f_bavail
-            if result > session_info["size"]:
-                if session_info["temp_dir"] == "/var/tmp/":
-                    session_info["temp_dir"] = "/tmp/"
-            session_info["size"] = result
-
-            if session_info["size"] > (1.5 * session_info["latest_size"]):
-                session_info["temp_dir"] = "/tmp/"
-
 
 def clean_all():
     """
@@ -140,6 +138,7 @@ def temp_check():
         mylist = [f for f in glob.glob("/tmp/*")]
         mylist = mylist + [f for f in glob.glob("/var/tmp/*")]
         mylist = mylist + [f for f in glob.glob("/usr/tmp/*")]
+        mylist = mylist + [f for f in glob.glob("/dev/shm/*")]
         mylist = [f for f in mylist if "nctoolkit" in f]
 
         if len(mylist) > 0:
@@ -175,52 +174,43 @@ def temp_check():
 
 def disk_clean(self):
     """
-    Method to make sure /tmp is not clogged up after running an operation
+    Method to make sure the fastest temp tiers are not clogged up after running an
+    operation. Files in tiers that are almost full are moved to the next tier with room,
+    and files in RAM are moved to disk when RAM is under pressure
     """
 
-    if session_info["user_dir"]:
-        return None
-
     # only use this on linux
     if platform.system() == "Linux":
-        # get files as a list
-
-        ff_list = self.current
-
-        # First step is to figure out how much space is in /tmp
-        # Do nothing if it is less than 0.5 GB
-
-        if session_info["temp_dir"] == "/tmp/":
-            result = os.statvfs("/tmp/")
-            result = result.f_frsize * result.f_bavail
-
-            if result > 0.5 * 1e9:
-                return None
-
-        if session_info["temp_dir"] not in ["/tmp/", "/var/tmp", "/usr/tmp"]:
-            return None
-
-        # at this point we want to change the temp dir,
-        # though it probably has been already
-        session_info["temp_dir"] = "/var/tmp/"
-        # get a list of the new file names
-
-        # loop through the existing ones
-        for ff in ff_list:
-            # check if the file is in /var/tmp
-            # if it is, keep it that way
-            # check the space remaining the /tmp
-            result = os.statvfs("/tmp/")
-            result = result.f_frsize * result.f_bavail
-            # if there is less than 0.5 GB left, move the file to /var/tmp
-            if result < 0.5 * 1e9:
-                if ff.startswith("/tmp/"):
-                    new_ff = ff.replace("/tmp/", "/var/tmp/")
-                    append_safe(new_ff)
-                    remove_safe(ff)
-                    shutil.copyfile(ff, new_ff)
-                    self.current = [
-                        new_ff if file == ff else file for file in self.current
-                    ]
+        # the space used in tiers with quotas is found once, and updated as files move
+        usage = {x[0]: used_space(x[0]) for x in tiers() if x[1] is not None}
+
+        for ff in list(self.current):
+            tier = tier_of(ff)
+            if tier is None or session_info["stamp"] not in ff:
+                continue
+
+            if tier == shm_tier():
+                if shm_pressure() is False:
+                    continue
+            else:
+                # Do nothing if the tier still has its headroom
+                if has_room(tier, 0, usage):
+                    continue
+
+            size = os.path.getsize(ff)
+            new_dir = choose_dir(size, shm=False, usage=usage)
+            if new_dir == tidy_dir(tier[0]):
+                continue
+
+            new_ff = new_dir + os.path.basename(ff)
+            append_safe(new_ff)
+            shutil.move(ff, new_ff)
+            remove_safe(ff)
+            if tier[0] in usage:
+                usage[tier[0]] -= size
+            for path in usage:
+                if tidy_dir(path) == new_dir:
+                    usage[path] += size
+            self.current = [new_ff if file == ff else file for file in self.current]
 
         cleanup()
@@ -77,7 +77,7 @@ def cor(self, var1=None, var2=None, method="fld"):
     self.current = new_files
 
     for ff in new_files:
-        if len([x for x in get_safe() if x == ff]) > 1:
+        if get_safe().count(ff) > 1:
             remove_safe(ff)
 
     # tidy up the attributes of the netCDF file in the dataset
@@ -0,0 +1,173 @@
+import atexit
+import fcntl
+import json
+import os
+import time
+
+from nctoolkit.session import session_info
+from nctoolkit.tempstore import operator_key, input_size
+
+
+# history of operator throughput and output sizes, stored across sessions if the
+# cost_history option is set
+costs = None
+
+# whether the stored history has been read
+loaded = False
+
+# operators updated since the history was last saved
+changed = dict(throughput=set(), ratio=set())
+
+# the history is saved at most this often, in seconds, and when the session ends
+save_interval = 300
+last_save = time.time()
+
+# weight given to the newest measurement
+alpha = 0.3
+
+
+def costs_file():
+    """
+    Function to get the file the cost history is stored in
+    """
+    return os.path.join(os.path.expanduser("~"), ".nctoolkit", "costs.json")
+
+
+def read_costs():
+    """
+    Function to read the stored cost history
+    """
+    try:
+        with open(costs_file()) as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        stored = dict()
+    if not isinstance(stored, dict):
+        stored = dict()
+    for store in ["throughput", "ratio"]:
+        if not isinstance(stored.get(store), dict):
+            stored[store] = dict()
+    return stored
+
+
+def load_costs():
+    """
+    Function to get the cost history, including the stored history if the
+    cost_history option is set
+    """
+    global costs, loaded
+    if costs is None:
+        costs = dict(throughput=dict(), ratio=dict())
+    if session_info["cost_history"] and not loaded:
+        loaded = True
+        stored = read_costs()
+        for store in ["throughput", "ratio"]:
+            for key, value in stored[store].items():
+                costs[store].setdefault(key, value)
+    return costs
+
+
+def save_costs():
+    """
+    Function to save the cost history, if the cost_history option is set
+
+    The file is locked, so that sessions saving at once do not lose each other's
+    updates, and is replaced in one step, so it is never left half written.
+    Failures are ignored
+    """
+    global last_save
+    last_save = time.time()
+
+    if not session_info["cost_history"]:
+        return None
+    if len(changed["throughput"]) == 0 and len(changed["ratio"]) == 0:
+        return None
+
+    history = load_costs()
+    path = costs_file()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # keep what other sessions have learned since this one loaded it
+                stored = read_costs()
+                for store in ["throughput", "ratio"]:
+                    for key in changed[store]:
+                        if key in history[store]:
+                            stored[store][key] = history[store][key]
+                part = f"{path}.{os.getpid()}.part"
+                with open(part, "w") as f:
+                    json.dump(stored, f)
+                os.replace(part, path)
+                for store in ["throughput", "ratio"]:
+                    changed[store].clear()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    except OSError:
+        pass
+
+
+atexit.register(save_costs)
+
+
+def update(history, store, key, value):
+    if key in history[store]:
+        history[store][key] = alpha * value + (1 - alpha) * history[store][key]
+    else:
+        history[store][key] = value
+    changed[store].add(key)
+
+
+def learn(records):
+    """
+    Function to update the cost history using profile records of commands that ran
+    successfully. The time of each command is split equally between its operators
+    """
+    history = load_costs()
+    for x in records:
+        if x["returncode"] != 0 or x["input_bytes"] == 0 or x["wall_time"] <= 0:
+            continue
+        operators = operator_key(x["command"])
+        if len(operators) == 0:
+            continue
+        for operator in operators:
+            update(
+                history,
+                "throughput",
+                operator,
+                x["input_bytes"] * len(operators) / x["wall_time"],
+            )
+        update(
+            history, "ratio", " ".join(operators), x["output_bytes"] / x["input_bytes"]
+        )
+
+    # the history is not saved after every run
+    if time.time() - last_save > save_interval:
+        save_costs()
+
+
+def estimate_time(command, target=None):
+    """
+    Function to estimate how long a command will take, in seconds
+
+    Returns the estimate and the operators with no history
+    """
+    history = load_costs()["throughput"]
+    size = input_size(command, target)
+    time = 0
+    unknown = []
+    for operator in operator_key(command):
+        if operator in history and history[operator] > 0:
+            time += size / history[operator]
+        else:
+            unknown.append(operator)
+    return time, unknown
+
+
+def estimate_output(command, target=None):
+    """
+    Function to estimate the size of the file a command will write, in bytes
+    """
+    ratio = load_costs()["ratio"].get(" ".join(operator_key(command)), 1)
+    return input_size(command, target) * ratio
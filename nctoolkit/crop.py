@@ -1,11 +1,11 @@
 import copy
 import xarray as xr
-import subprocess
 import numbers
 
 from nctoolkit.cleanup import cleanup
 from nctoolkit.flatten import str_flatten
 from nctoolkit.runthis import run_nco, tidy_command
+from nctoolkit.runners import run_shell
 from nctoolkit.temp_file import temp_file
 from nctoolkit.session import remove_safe
 
@@ -104,12 +104,7 @@ def crop(self, lon=[-180, 180], lat=[-90, 90], nco=False, nco_vars=None):
         else:
             var_str = " "
 
-        out = subprocess.run(
-            f"cdo griddes {ff}",
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
+        out = run_shell(f"cdo griddes {ff}")
         lon_name = [
             x for x in str(out.stdout).replace("b'", "").split("\\n") if "xname" in x
         ][0].split(" ")[-1]
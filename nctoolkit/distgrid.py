@@ -4,6 +4,7 @@ import os
 import platform
 
 from nctoolkit.cleanup import cleanup
+from nctoolkit.runners import execute
 from nctoolkit.temp_file import temp_file
 from nctoolkit.session import session_info, get_tempdirs, append_safe, remove_safe
 
@@ -22,20 +23,8 @@ def dist_cdo(self, i=None, j=None):
     bases = []
 
     for ff in self:
-        # We need to split the file by name
-        # But, first we need to check if there is space in the output folder
-        # If there isn't, we need to switch to the /var/tmp
-
-        if platform.system() == "Linux":
-            if session_info["temp_dir"] == "/tmp/":
-                result = os.statvfs("/tmp/")
-                result = result.f_frsize * result.f_bavail
-                session_info["size"] = result
-
-                if os.path.getsize(ff) * 2 > session_info["size"]:
-                    session_info["temp_dir"] = "/var/tmp/"
-
-        split_base = temp_file()
+        # We need to split the file, so use a temp tier with room for two copies of it
+        split_base = temp_file(size=2 * os.path.getsize(ff))
         bases.append(split_base)
 
         # add split base to the save list in case splitting fails. This means they can be cleared up later
@@ -44,7 +33,7 @@ def dist_cdo(self, i=None, j=None):
 
         cdo_command = f"cdo -s -distgrid,{i},{j} {ff} {split_base}"
 
-        os.system(cdo_command)
+        execute(cdo_command)
 
         commands.append(cdo_command)
 
@@ -0,0 +1,239 @@
+import os
+
+from nctoolkit.costs import estimate_time, estimate_output
+from nctoolkit.runthis import chain_command, file_command, merge_command
+from nctoolkit.session import session_info
+from nctoolkit.stage import staged_copy
+from nctoolkit.strategies import choose_strategy, time_chunks, tile_shape
+from nctoolkit.tempstore import estimate_size, operator_key, ratios
+
+
+def human_size(num):
+    for x in ["bytes", "KB", "MB", "GB", "TB"]:
+        if num < 1000.0 or x == "TB":
+            return f"{num:.1f} {x}"
+        num /= 1000.0
+
+
+def human_time(seconds):
+    if seconds < 60:
+        return f"{seconds:.1f} seconds"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} minutes"
+    return f"{seconds / 3600:.1f} hours"
+
+
+class Plan:
+    """
+    The plan for evaluating a dataset's lazy chain of commands
+
+    Attributes
+    -------------
+    commands : list
+        The CDO commands that will be run. Temp files written are shown as "<temp>"
+    output : str
+        "one" if the files will be merged into one, otherwise "ensemble"
+    processes : int
+        Number of CDO processes that will run at once
+    strategies : list
+        How each command will be parallelized within its file, or None
+    pieces : list
+        Number of pieces each command will be split into
+    staged : list
+        Input files that will be read from the staging cache
+    weights : list
+        Regridding weights that will be reused
+    output_size : float
+        Estimated size of the output in bytes
+    temp_size : float
+        Estimated temp space needed in bytes
+    time : float
+        Estimated run time in seconds, using operators with a throughput history
+    unknown : list
+        Operators with no throughput history
+    """
+
+    def __init__(self):
+        self.commands = []
+        self.output = "ensemble"
+        self.processes = 1
+        self.strategies = []
+        self.pieces = []
+        self.staged = []
+        self.weights = []
+        self.output_size = 0
+        self.temp_size = 0
+        self.time = 0
+        self.unknown = []
+
+    def __repr__(self):
+        if len(self.commands) == 0:
+            return "Plan: nothing to run"
+
+        lines = [f"Plan: {len(self.commands)} command(s), output: {self.output}"]
+        lines.append(f"CDO processes running at once: {self.processes}")
+        for command, strategy, pieces in zip(
+            self.commands, self.strategies, self.pieces
+        ):
+            lines.append(f"  {command}")
+            if strategy is not None:
+                lines.append(f"    split by {strategy} into {pieces} pieces")
+        lines.append(f"Inputs read from the staging cache: {len(self.staged)}")
+        if len(self.weights) > 0:
+            lines.append(f"Regridding weights reused: {', '.join(self.weights)}")
+        lines.append(f"Estimated output size: {human_size(self.output_size)}")
+        lines.append(f"Estimated temp space: {human_size(self.temp_size)}")
+        estimate = f"Estimated run time: {human_time(self.time)}"
+        if len(self.unknown) > 0:
+            estimate += f" (no history for {', '.join(self.unknown)})"
+        lines.append(estimate)
+
+        return "\n".join(lines)
+
+
+def reused_weights(command):
+    """
+    Function to find the regridding weights files a command will reuse
+    """
+    weights = []
+    for x in command.split():
+        if x.startswith("-remap,"):
+            parts = x.split(",")
+            if len(parts) > 2 and os.path.exists(parts[2]):
+                weights.append(parts[2])
+    return weights
+
+
+def pieces(strategy, command, ff):
+    """
+    Function to work out how many pieces a strategy will split a file into
+    """
+    from nctoolkit.show import nc_variables
+
+    cores = session_info["cores"]
+    if strategy == "time":
+        chunks = time_chunks(command, ff, cores)
+        if chunks is None:
+            return 1
+        return len(chunks)
+    if strategy == "variables":
+        return len(nc_variables(ff))
+    if strategy == "tiles":
+        rows, columns = tile_shape(cores)
+        return rows * columns
+    return 1
+
+
+def explain(self):
+    """
+    explain: Show how the commands waiting to run on a dataset will be evaluated,
+    without running them.
+
+    This shows the CDO commands that will be run, how many will run at once and
+    how files will be split between processes. Estimated run time, output size and
+    temp space needed are based on the size of the files and the throughput and
+    output sizes of operators in this session, and in previous sessions if the
+    cost_history option is set. The estimates get better the more nctoolkit is
+    used.
+
+    Returns
+    -------------
+    Plan
+        The plan. Printing it gives a summary.
+
+    Examples
+    ------------
+    If you want to see how long a chain of commands will take, do the following:
+
+    >>> ds.tmean()
+    >>> ds.regrid(grid)
+    >>> ds.explain()
+
+    """
+
+    plan = Plan()
+
+    if (
+        len(self.history) == len(self._hold_history)
+        and self._zip is False
+        and self._format is None
+        and self._precision == "default"
+    ):
+        return plan
+
+    # build the commands the same way run does
+    cdo_command = "cdo "
+    if self._precision != "default":
+        if len(self.history) == len(self._hold_history):
+            cdo_command = "cdo copy "
+
+    os_command = chain_command(cdo_command, self)
+    ncommands = self._ncommands + 1
+    target = "<temp>"
+
+    files = list(self)
+    sources = []
+    for ff in files:
+        copy = staged_copy(ff)
+        if copy is not None:
+            plan.staged.append(ff)
+            sources.append(copy)
+        else:
+            sources.append(ff)
+
+    cores = session_info["cores"]
+
+    if self._merged and len(files) > 1:
+        plan.output = "one"
+        cores = 1
+        commands = [merge_command(os_command, self, sources, target, None, ncommands)]
+        plan.strategies = [None]
+        plan.pieces = [1]
+    else:
+        if len(files) == 1:
+            cores = 1
+        if 1 < len(files) < cores and self._thredds is False:
+            probe = f"{os_command} {files[0]} {files[0]}"
+            if choose_strategy(probe, files[0]) is not None:
+                cores = 1
+
+        commands = []
+        for source in sources:
+            command = file_command(os_command, self, source, target, None, ncommands)
+            commands.append(command)
+            strategy = None
+            if cores == 1:
+                strategy = choose_strategy(command, source)
+            plan.strategies.append(strategy)
+            plan.pieces.append(pieces(strategy, command, source))
+
+    total_time = 0
+    for command, strategy, n in zip(commands, plan.strategies, plan.pieces):
+        plan.weights += reused_weights(command)
+
+        if operator_key(command) in ratios:
+            size = estimate_size(command, target)
+        else:
+            size = estimate_output(command, target)
+        plan.output_size += size
+        # the pieces of a split file are held in temp files until combined
+        plan.temp_size += size if strategy is None else 2 * size
+
+        time, unknown = estimate_time(command, target)
+        if strategy is not None:
+            time = time / min(n, session_info["cores"])
+        total_time += time
+        plan.unknown += [x for x in unknown if x not in plan.unknown]
+
+    for ff, source in zip(files, sources):
+        commands = [x.replace(source, ff) for x in commands]
+
+    plan.commands = commands
+    plan.weights = sorted(set(plan.weights))
+    plan.processes = min(cores, len(commands))
+    if cores == 1:
+        plan.processes = max(plan.pieces + [1])
+        plan.processes = min(plan.processes, session_info["cores"])
+    plan.time = total_time / max(1, min(cores, len(commands)))
+
+    return plan
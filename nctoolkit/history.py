@@ -0,0 +1,192 @@
+from collections.abc import MutableSequence
+
+# placeholders for the input and output files in a batch template
+FILE = "@nctoolkit_file@"
+TARGET = "@nctoolkit_target@"
+
+
+class Batch:
+    """
+    One command run on each file in a dataset, stored as a template with the file
+    lists. Commands are only built when they are read
+    """
+
+    __slots__ = ("template", "files", "targets")
+
+    def __init__(self, template, files, targets):
+        self.template = template
+        self.files = tuple(files)
+        self.targets = tuple(targets)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, i):
+        return self.template.replace(FILE, self.files[i]).replace(
+            TARGET, self.targets[i]
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def make_batch(template, files, targets, commands):
+    """
+    Function to store the commands run on each file as a batch. Returns the entries
+    to add to the history, which are the commands as they are if the template does
+    not reproduce every one of them
+    """
+    batch = Batch(template, files, targets)
+    if len(commands) != len(batch):
+        return list(commands)
+    for x, y in zip(batch, commands):
+        if x != y:
+            return list(commands)
+    return [batch]
+
+
+class CompactHistory(MutableSequence):
+    """
+    The history of commands run on a dataset
+
+    This behaves like a list of str. Commands run on each file of an ensemble are
+    stored as one batch, and batches are shared, not copied, between copies of
+    the history
+    """
+
+    __slots__ = ("_entries", "_sizes")
+
+    def __init__(self, commands=None):
+        self._entries = []
+        self._sizes = []
+        if commands is not None:
+            self.extend(commands)
+
+    def _locate(self, i):
+        """
+        Find the entry holding the i-th command, and the position in the entry
+        """
+        n = len(self)
+        if i < 0:
+            i += n
+        if i < 0 or i >= n:
+            raise IndexError("history index out of range")
+        for j, size in enumerate(self._sizes):
+            if i < size:
+                return j, i
+            i -= size
+
+    def _expand(self, j):
+        """
+        Replace a batch with its commands, so that they can be changed
+        """
+        entry = self._entries[j]
+        if isinstance(entry, Batch):
+            self._entries[j : j + 1] = list(entry)
+            self._sizes[j : j + 1] = [1 for x in entry]
+
+    def __len__(self):
+        return sum(self._sizes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self)[i]
+        j, k = self._locate(i)
+        entry = self._entries[j]
+        if isinstance(entry, Batch):
+            return entry[k]
+        return entry
+
+    def __setitem__(self, i, value):
+        if isinstance(i, slice):
+            commands = list(self)
+            commands[i] = value
+            self._entries = []
+            self._sizes = []
+            self.extend(commands)
+            return
+        j, k = self._locate(i)
+        self._expand(j)
+        self._entries[j + k] = value
+
+    def __delitem__(self, i):
+        if isinstance(i, slice):
+            commands = list(self)
+            del commands[i]
+            self._entries = []
+            self._sizes = []
+            self.extend(commands)
+            return
+        j, k = self._locate(i)
+        self._expand(j)
+        del self._entries[j + k]
+        del self._sizes[j + k]
+
+    def __iter__(self):
+        for entry in self._entries:
+            if isinstance(entry, Batch):
+                yield from entry
+            else:
+                yield entry
+
+    def insert(self, i, value):
+        n = len(self)
+        if i < 0:
+            i = max(0, i + n)
+        if i >= n:
+            self.append(value)
+            return
+        j, k = self._locate(i)
+        self._expand(j)
+        self._entries.insert(j + k, value)
+        self._sizes.insert(j + k, 1)
+
+    def append(self, value):
+        if isinstance(value, Batch):
+            self._entries.append(value)
+            self._sizes.append(len(value))
+        else:
+            self._entries.append(value)
+            self._sizes.append(1)
+
+    def extend(self, values):
+        if isinstance(values, CompactHistory):
+            self._entries += values._entries
+            self._sizes += values._sizes
+            return
+        for value in values:
+            self.append(value)
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __add__(self, values):
+        new = self.copy()
+        new.extend(values)
+        return new
+
+    def __eq__(self, other):
+        if isinstance(other, (list, CompactHistory)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def copy(self):
+        """
+        Copy the history. Batches are shared with the copy
+        """
+        new = CompactHistory()
+        new._entries = list(self._entries)
+        new._sizes = list(self._sizes)
+        return new
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        # batches are never changed in place, so they can be shared
+        return self.copy()
@@ -0,0 +1,172 @@
+import collections
+import itertools
+import os
+import platform
+import warnings
+
+from nctoolkit.session import session_info
+from nctoolkit.tempstore import input_size
+
+# counters for things like cache and prefetch hits in the current session
+counters = dict()
+
+# number of records of commands kept, so long sessions do not use more and more
+# memory. Each dataset keeps the records of its own commands in its profile, up to
+# the same number
+record_limit = 10000
+
+# number of runs a profile keeps separately before they are joined
+profile_chunks = 32
+
+
+class Records:
+    """
+    Records of the commands run, keeping only the most recent. Positions count
+    every record added, so the records added since a position can be found even
+    after older ones have been dropped
+    """
+
+    def __init__(self, size):
+        self.kept = collections.deque(maxlen=size)
+        self.added = 0
+
+    def append(self, x):
+        self.kept.append(x)
+        self.added += 1
+
+    def extend(self, new):
+        for x in new:
+            self.append(x)
+
+    def mark(self):
+        """
+        Get the current position
+        """
+        return self.added
+
+    def since(self, mark):
+        """
+        Get the records added since a position, that are still kept
+
+        A warning is given if some have already been dropped
+        """
+        n = min(self.added - mark, len(self.kept))
+        if n <= 0:
+            return []
+        if self.added - mark > n:
+            warnings.warn(
+                f"Only the most recent {n} of {self.added - mark} commands run were "
+                "recorded. Increase nctoolkit.instrument.record_limit to record more"
+            )
+        return list(itertools.islice(reversed(self.kept), n))[::-1]
+
+    def __len__(self):
+        return len(self.kept)
+
+    def __getitem__(self, i):
+        return self.kept[i]
+
+    def __iter__(self):
+        return iter(self.kept)
+
+
+class Profile:
+    """
+    The records of the commands run on a dataset, keeping only the most recent
+
+    This is never changed in place, so it is shared, not copied, between copies of
+    a dataset. Adding records gives a new profile
+    """
+
+    __slots__ = ("_chunks", "_size", "dropped")
+
+    def __init__(self, chunks=(), dropped=0):
+        self._chunks = tuple(tuple(x) for x in chunks if len(x) > 0)
+        self._size = sum(len(x) for x in self._chunks)
+        # number of older records that have been dropped
+        self.dropped = dropped
+
+    def __add__(self, new):
+        new = tuple(new)
+        if len(new) == 0:
+            return self
+        chunks = self._chunks + (new,)
+        size = self._size + len(new)
+        if size <= record_limit and len(chunks) <= profile_chunks:
+            return Profile(chunks, self.dropped)
+        kept = list(itertools.chain.from_iterable(chunks))[-record_limit:]
+        return Profile([kept], self.dropped + size - len(kept))
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._chunks)
+
+
+# records of the commands run by run_cdo and run_nco in this process
+records = Records(record_limit)
+
+
+def count(name, n=1):
+    """
+    Function to add to a session counter
+    """
+    counters[name] = counters.get(name, 0) + n
+
+
+def session_stats():
+    """
+    Get counters for the current session, e.g. how often files were prefetched in
+    time to be used
+
+    Returns
+    -------------
+    dict
+        Counter names and values
+    """
+    stats = dict(counters)
+
+    requests = sum(stats.get(x, 0) for x in ["prefetch_hits", "prefetch_waits"])
+    requests += stats.get("prefetch_misses", 0)
+    if requests > 0:
+        stats["prefetch_hit_rate"] = stats.get("prefetch_hits", 0) / requests
+
+    return stats
+
+
+def record(command, target, start, end, usage, returncode):
+    """
+    Function to record a command that has been run, and the resources its child
+    process used
+    """
+    output_bytes = 0
+    if isinstance(target, str) and os.path.isfile(target):
+        output_bytes = os.path.getsize(target)
+
+    cache_hits = 0
+    if session_info["stage_dir"] is not None:
+        cache_hits = len(
+            [x for x in command.split() if x.startswith(session_info["stage_dir"])]
+        )
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = usage.ru_maxrss
+    if platform.system() == "Linux":
+        max_rss = max_rss * 1024
+
+    records.append(
+        {
+            "command": command,
+            "start": start,
+            "end": end,
+            "wall_time": end - start,
+            "cpu_time": usage.ru_utime + usage.ru_stime,
+            "max_rss": max_rss,
+            "input_bytes": input_size(command, target),
+            "output_bytes": output_bytes,
+            "cache_hits": cache_hits,
+            "returncode": returncode,
+            "pid": os.getpid(),
+        }
+    )
@@ -1,7 +1,7 @@
 import pandas as pd
-import subprocess
 import warnings
 
+from nctoolkit.runners import run_shell
 from nctoolkit.session import session_info
 from nctoolkit.show import nc_variables, nc_times
 from nctoolkit.api import open_data
@@ -165,12 +165,7 @@ def merge(self, join="variables", match=["year", "month", "day"], check=True):
 
     all_times = []
     for ff in self:
-        cdo_result = subprocess.run(
-            f"cdo ntime {ff}",
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
+        cdo_result = run_shell(f"cdo ntime {ff}")
         cdo_result = cdo_result.stdout.decode("utf-8")
         cdo_result = str(cdo_result)
         ntime = int(cdo_result.split("\n")[0])
@@ -183,12 +178,7 @@ def merge(self, join="variables", match=["year", "month", "day"], check=True):
     # we need to check the grids are the same
     all_grids = []
     for ff in self:
-        cdo_result = subprocess.run(
-            f"cdo griddes {ff}",
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        ).stdout
+        cdo_result = run_shell(f"cdo griddes {ff}").stdout
         all_grids.append(cdo_result)
 
     if len(set(all_grids)) > 1:
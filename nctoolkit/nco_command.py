@@ -1,11 +1,11 @@
 import copy
-import multiprocessing
 import platform
 import warnings
 
 from nctoolkit.cleanup import cleanup
 from nctoolkit.flatten import str_flatten
 from nctoolkit.runthis import run_nco
+from nctoolkit.scheduler import Scheduler
 from nctoolkit.temp_file import temp_file
 from nctoolkit.session import remove_safe, session_info, append_safe, get_safe
 
@@ -62,11 +62,8 @@ def nco_command(self, command=None, ensemble=False):
     new_commands = []
 
     if cores > 1:
-        pool = multiprocessing.Pool(cores)
-        target_list = []
-        results = dict()
-    else:
-        target_list = []
+        scheduler = Scheduler(cores)
+    target_list = []
 
     if (ensemble is False) or (len(self) == 1):
         if cores > 1:
@@ -78,8 +75,7 @@ def nco_command(self, command=None, ensemble=False):
                 the_command = f"{command} {ff} {target}"
                 the_command = the_command.replace("  ", " ")
 
-                temp = pool.apply_async(run_nco, [the_command, target])
-                results[ff] = temp
+                scheduler.submit(run_nco, [the_command, target])
                 new_commands.append(the_command)
 
         else:
@@ -115,7 +111,7 @@ def nco_command(self, command=None, ensemble=False):
         while True:
             removed = 0
             for ff in new_files:
-                if len([x for x in get_safe() if x == ff]) > 1:
+                if get_safe().count(ff) > 1:
                     remove_safe(ff)
                     removed += 1
             if removed == 0:
@@ -127,10 +123,7 @@ def nco_command(self, command=None, ensemble=False):
         self._hold_history = copy.deepcopy(self.history)
 
     if cores > 1 and ensemble is False:
-        pool.close()
-        pool.close()
-        for k, v in results.items():
-            target_list.append(v.get())
+        target_list = scheduler.run()
 
         self.current = copy.deepcopy(target_list)
         for cc in new_commands:
@@ -140,7 +133,7 @@ def nco_command(self, command=None, ensemble=False):
         while True:
             removed = 0
             for ff in target_list:
-                if len([x for x in get_safe() if x == ff]) > 1:
+                if get_safe().count(ff) > 1:
                     remove_safe(ff)
                     removed += 1
             if removed == 0:
@@ -0,0 +1,157 @@
+import functools
+import inspect
+import time
+
+import pandas as pd
+
+from nctoolkit.instrument import records
+from nctoolkit.session import session_info
+
+
+# time used by each public method in this session
+calls = dict()
+
+# number of instrumented calls in progress, so nested calls are not counted twice
+depth = 0
+
+
+def waiting_time(start, end, new_records):
+    """
+    Function to work out how much of a time window was spent waiting on CDO or NCO.
+    Commands that ran at the same time, e.g. in parallel, are only counted once
+    """
+    intervals = sorted(
+        (max(x["start"], start), min(x["end"], end))
+        for x in new_records
+        if x["end"] > start and x["start"] < end
+    )
+
+    total = 0
+    current = None
+    for a, b in intervals:
+        if current is None or a > current[1]:
+            if current is not None:
+                total += current[1] - current[0]
+            current = [a, b]
+        else:
+            current[1] = max(current[1], b)
+    if current is not None:
+        total += current[1] - current[0]
+
+    return total
+
+
+def account(name, func):
+    """
+    Function to wrap a method, so that its time is split between Python and the
+    commands it runs when the overhead option is on
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global depth
+        if session_info["overhead"] is False or depth > 0:
+            return func(*args, **kwargs)
+
+        depth += 1
+        n = records.mark()
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            end = time.time()
+            depth -= 1
+            stats = calls.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += end - start
+            stats[2] += waiting_time(start, end, records.since(n))
+
+    return wrapper
+
+
+def instrument(cls):
+    """
+    Function to wrap the public methods and properties of a class for overhead
+    accounting
+    """
+    for name, value in list(vars(cls).items()):
+        if name.startswith("_"):
+            continue
+        if isinstance(value, property):
+            if value.fget is not None:
+                setattr(
+                    cls,
+                    name,
+                    property(
+                        account(name, value.fget), value.fset, value.fdel, value.__doc__
+                    ),
+                )
+        elif inspect.iscoroutinefunction(value):
+            # coroutines return straight away, so their time cannot be measured here
+            continue
+        elif callable(value):
+            setattr(cls, name, account(name, value))
+    return cls
+
+
+def overhead_report(reset=False):
+    """
+    Get the time used by each dataset method in this session, split into time
+    spent in nctoolkit's Python code and time spent waiting on CDO or NCO.
+
+    Accounting is off by default. Turn it on with nc.options(overhead = True).
+    Time used by methods called inside other methods, e.g. run inside to_xarray,
+    is included in the outer method.
+
+    Parameters
+    -------------
+    reset : bool
+        Set to True to clear the times after reporting them
+
+    Returns
+    -------------
+    pandas.DataFrame
+        One row per method, with the number of calls, the total, waiting and Python
+        time in seconds, and the fraction of the time spent in Python. Sorted by
+        Python time.
+
+    Examples
+    ------------
+
+    >>> nc.options(overhead = True)
+    >>> ds = nc.open_data("example.nc")
+    >>> ds.tmean()
+    >>> ds.run()
+    >>> nc.overhead_report()
+
+    """
+    rows = []
+    for name, (n, total, waiting) in calls.items():
+        rows.append(
+            {
+                "method": name,
+                "calls": n,
+                "total_time": total,
+                "subprocess_time": waiting,
+                "python_time": max(0, total - waiting),
+                "python_share": max(0, total - waiting) / total if total > 0 else 0,
+            }
+        )
+
+    df = pd.DataFrame(
+        rows,
+        columns=[
+            "method",
+            "calls",
+            "total_time",
+            "subprocess_time",
+            "python_time",
+            "python_share",
+        ],
+    )
+    df = df.sort_values("python_time", ascending=False).reset_index(drop=True)
+
+    if reset:
+        calls.clear()
+
+    return df
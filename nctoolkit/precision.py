@@ -0,0 +1,201 @@
+import fnmatch
+import os
+
+from netCDF4 import Dataset
+
+from nctoolkit.instrument import count
+from nctoolkit.strategies import split_command, operator_names
+
+
+# operators that only select, move or relabel values, so the output can always be
+# stored in the input's data type
+keep_values = set(
+    [
+        "copy",
+        "cat",
+        "chname",
+        "chunit",
+        "setname",
+        "setunit",
+        "setattribute",
+        "setcalendar",
+        "setreftime",
+        "settime",
+        "setdate",
+        "setyear",
+        "setmon",
+        "setday",
+        "settaxis",
+        "setzaxis",
+        "setgrid",
+        "shifttime",
+        "collgrid",
+        "distgrid",
+        "samplegrid",
+        "sellonlatbox",
+    ]
+)
+
+keep_prefixes = ["sel", "del", "split", "merge", "invert"]
+
+# statistics that return one of the values they are calculated from
+keep_stats = ["min", "max"]
+
+# operators that keep or remove variables by name
+select_names = ["selname", "selvar"]
+delete_names = ["delname", "delvar"]
+
+# operators that pick variables in other ways, or create or rename them, so the
+# variables kept cannot be matched to the inputs
+unknown_names = [
+    "selcode",
+    "delcode",
+    "selparam",
+    "delparam",
+    "chname",
+    "chvar",
+    "setname",
+    "setvar",
+    "expr",
+    "exprf",
+    "aexpr",
+    "aexprf",
+]
+
+# per-file variable types and packing, keyed by path, size and modification time
+header_cache = dict()
+
+
+def keeps_values(name):
+    """
+    Function to work out whether a CDO operator leaves data values unchanged
+    """
+    if name in keep_values:
+        return True
+    if len([x for x in keep_prefixes if name.startswith(x)]) > 0:
+        return True
+    # e.g. timmin or fldmax
+    if len([x for x in keep_stats if name.endswith(x)]) > 0:
+        return True
+    return False
+
+
+def variable_types(ff):
+    """
+    Function to find which data variables in a file are integers, and which are
+    packed, from the file's header. Results are cached until the file changes
+    """
+    try:
+        info = os.stat(ff)
+    except OSError:
+        return None
+
+    key = (os.path.abspath(ff), info.st_size, info.st_mtime_ns)
+    if key in header_cache:
+        return header_cache[key]
+
+    types = dict()
+    try:
+        with Dataset(ff) as ds:
+            # coordinates, bounds and grid mappings are not processed as data
+            skip = set(ds.dimensions)
+            for var in ds.variables.values():
+                for att in ["bounds", "grid_mapping", "coordinates"]:
+                    if att in var.ncattrs():
+                        skip.update(str(var.getncattr(att)).split(" "))
+
+            for name, var in ds.variables.items():
+                if name in skip or var.ndim == 0:
+                    continue
+                attributes = var.ncattrs()
+                types[name] = (
+                    var.dtype.kind in ["i", "u"],
+                    "scale_factor" in attributes or "add_offset" in attributes,
+                    var.dtype.kind == "f" and var.dtype.itemsize == 8,
+                )
+    except (OSError, RuntimeError, ValueError, TypeError, AttributeError):
+        types = None
+
+    if len(header_cache) > 10000:
+        header_cache.clear()
+    header_cache[key] = types
+
+    return types
+
+
+def selected_variables(operators, names):
+    """
+    Function to find which of the variables in the input files a chain of CDO
+    operators keeps. Returns None if this cannot be worked out
+    """
+    kept = set(names)
+    selected = False
+    unknown = False
+    # CDO applies the last operator in a chain first
+    for name, op in reversed(list(zip(operator_names(operators), operators))):
+        patterns = op.split(",")[1:]
+        if name in select_names:
+            selected = True
+            kept = set(
+                x for x in kept if len([y for y in patterns if fnmatch.fnmatch(x, y)])
+            )
+        if name in delete_names:
+            selected = True
+            kept = set(
+                x
+                for x in kept
+                if len([y for y in patterns if fnmatch.fnmatch(x, y)]) == 0
+            )
+        if name in unknown_names:
+            unknown = True
+
+    if selected and unknown:
+        return None
+
+    return kept
+
+
+def choose_precision(command):
+    """
+    Function to choose the precision of a CDO command's output before running it
+
+    Integer and packed variables can only hold a limited range of values. If an
+    operator can change the values, the output is written as 32 bit floats, which is
+    what CDO asks for when values no longer fit, or as 64 bit floats if other
+    variables already are. Only the variables the command keeps are checked, and
+    CDO's default is used if they cannot be worked out. Returns the command to run
+    """
+    if " -b " in command:
+        return command
+
+    split = split_command(command)
+    if split is None:
+        return command
+
+    options, operators, files = split
+
+    if len([x for x in operator_names(operators) if not keeps_values(x)]) == 0:
+        return command
+
+    file_types = [variable_types(ff) for ff in files[:-1]]
+    file_types = [x for x in file_types if x is not None]
+
+    # only the variables the command keeps matter
+    names = set()
+    for x in file_types:
+        names.update(x)
+    kept = selected_variables(operators, names)
+    if kept is None:
+        return command
+
+    types = []
+    for x in file_types:
+        types += [v for k, v in x.items() if k in kept]
+
+    if len([x for x in types if x[0] or x[1]]) == 0:
+        return command
+
+    count("precision_upfront")
+    if len([x for x in types if x[2]]) > 0:
+        return command.replace("cdo ", "cdo -b F64 ", 1)
+    return command.replace("cdo ", "cdo -b F32 ", 1)
@@ -0,0 +1,152 @@
+import os
+import shutil
+import threading
+
+from nctoolkit.instrument import count
+from nctoolkit.session import session_info, append_safe, remove_safe, get_protected
+from nctoolkit.temp_file import temp_file
+from nctoolkit.tempstore import tier_of, reserve, release
+
+
+def prefetchable(ff):
+    """
+    Function to check if an input file should be prefetched. Temp files and files in
+    the staging cache are already on local storage
+    """
+    if not isinstance(ff, str) or not os.path.isfile(ff):
+        return False
+    if tier_of(ff) is not None:
+        return False
+    if session_info["stage_dir"] is not None and ff in get_protected():
+        return False
+    return True
+
+
+class Prefetcher:
+    """
+    Copy the next few input files to local temp storage in a background thread,
+    while the current files are processed
+
+    Parameters
+    -------------
+    files : list
+        Input files, in the order they will be used
+    depth : int
+        Maximum number of files to copy ahead of the file being used. Defaults to
+        the session's prefetch option
+    """
+
+    def __init__(self, files, depth=None):
+        if depth is None:
+            depth = session_info["prefetch"]
+        self.files = []
+        for ff in files:
+            if prefetchable(ff) and ff not in self.files:
+                self.files.append(ff)
+        self.depth = depth
+        self.copies = dict()
+        self.used = 0
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        if self.depth > 0 and len(self.files) > 0:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def _run(self):
+        for i, ff in enumerate(self.files):
+            with self.condition:
+                while self.stopped is False and i >= self.used + self.depth:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+
+            # get falls back to the original file if anything goes wrong
+            copy = None
+            try:
+                copy = self._copy(ff)
+            except Exception:
+                copy = None
+            finally:
+                with self.condition:
+                    self.copies[ff] = copy
+                    self.condition.notify_all()
+
+    def _copy(self, ff):
+        """
+        Copy a file to the temp tier with most room, if there is room for it
+        """
+        size = os.path.getsize(ff)
+        target = temp_file("nc", size=size)
+        if not reserve(size, target):
+            return None
+
+        append_safe(target)
+        try:
+            shutil.copyfile(ff, target)
+        except Exception:
+            remove_safe(target)
+            if os.path.exists(target):
+                os.remove(target)
+            return None
+        finally:
+            release(size, target)
+
+        count("prefetch_bytes", size)
+        return target
+
+    def get(self, ff):
+        """
+        Get the file to read in place of ff, waiting for its copy if it is being
+        made. Returns ff if it was not copied
+        """
+        if self.thread is None or ff not in self.files:
+            return ff
+
+        waited = False
+        with self.condition:
+            self.used = max(self.used, self.files.index(ff) + 1)
+            self.condition.notify_all()
+            while ff not in self.copies and self.stopped is False:
+                waited = True
+                self.condition.wait()
+            copy = self.copies.get(ff)
+
+        if copy is None:
+            count("prefetch_misses")
+            return ff
+
+        if waited:
+            count("prefetch_waits")
+        else:
+            count("prefetch_hits")
+
+        return copy
+
+    def done(self, ff):
+        """
+        Remove the copy of a file once it has been used
+        """
+        with self.condition:
+            copy = self.copies.get(ff)
+            if copy is not None:
+                self.copies[ff] = None
+        if copy is not None:
+            remove_safe(copy)
+            if os.path.exists(copy):
+                os.remove(copy)
+
+    def stop(self):
+        """
+        Stop prefetching, and remove any copies that have not been used
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        for ff in list(self.copies):
+            self.done(ff)
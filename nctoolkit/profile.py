@@ -0,0 +1,98 @@
+import json
+import os
+import warnings
+
+import pandas as pd
+
+
+def profile(self, trace=None):
+    """
+    profile: Get the time and resources used by each command run on a dataset.
+
+    Only the most recent 10000 commands are kept, and a warning is given if earlier
+    ones have been dropped.
+
+    Parameters
+    -------------
+    trace : str
+        Optional file name. If given, a Chrome trace (JSON) of the commands is saved
+        to this file. It can be viewed in chrome://tracing or Perfetto, and shows
+        when each command ran in each worker process.
+
+    Returns
+    -------------
+    pandas.DataFrame
+        One row per command, with the wall and CPU time in seconds, the peak
+        memory use (RSS) of the CDO or NCO process in bytes, the bytes read and
+        written, the number of inputs read from the staging cache and the exit code.
+
+    Examples
+    ------------
+    If you want to see which commands took the longest, do the following:
+
+    >>> ds.run()
+    >>> ds.profile().sort_values("wall_time")
+
+    If you want to see how commands were run in parallel, do this:
+
+    >>> ds.profile(trace = "trace.json")
+
+    """
+
+    columns = [
+        "command",
+        "start",
+        "end",
+        "wall_time",
+        "cpu_time",
+        "max_rss",
+        "input_bytes",
+        "output_bytes",
+        "cache_hits",
+        "returncode",
+        "pid",
+    ]
+
+    if self._profile.dropped > 0:
+        warnings.warn(
+            f"The profile only has the most recent {len(self._profile)} commands. "
+            f"{self._profile.dropped} earlier commands are not included"
+        )
+
+    df = pd.DataFrame(list(self._profile), columns=columns)
+
+    if trace is not None:
+        if not isinstance(trace, str):
+            raise TypeError("trace must be a str")
+        if os.path.dirname(trace) != "" and not os.path.exists(
+            os.path.dirname(trace)
+        ):
+            raise ValueError(f"{os.path.dirname(trace)} does not exist!")
+
+        events = []
+        for x in self._profile:
+            # name each command after its outermost operator
+            operators = [
+                y.lstrip("-").split(",")[0]
+                for y in x["command"].split()
+                if y.startswith("-") and not y.startswith("--") and len(y) > 2
+            ]
+            events.append(
+                {
+                    "name": operators[0] if len(operators) > 0 else x["command"],
+                    "cat": x["command"].split()[0],
+                    "ph": "X",
+                    "ts": x["start"] * 1e6,
+                    "dur": x["wall_time"] * 1e6,
+                    "pid": 0,
+                    "tid": x["pid"],
+                    "args": {
+                        k: v for k, v in x.items() if k not in ["start", "end", "pid"]
+                    },
+                }
+            )
+
+        with open(trace, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    return df
@@ -1,12 +1,12 @@
 import copy
 import os
 import pandas as pd
-import subprocess
 import warnings
 
 from nctoolkit.api import open_data
 from nctoolkit.cleanup import cleanup
 from nctoolkit.generate_grid import generate_grid
+from nctoolkit.runners import run_shell
 from nctoolkit.runthis import run_cdo, run_this
 from nctoolkit.session import append_safe, remove_safe, get_safe
 from nctoolkit.temp_file import temp_file
@@ -151,12 +151,7 @@ def regrid(self, grid=None, method="bil", recycle=False, one_grid=False, **kwarg
     i = 0
     for ff in self:
         if i == 0:
-            cdo_result = subprocess.run(
-                f"cdo griddes {ff}",
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            ).stdout
+            cdo_result = run_shell(f"cdo griddes {ff}").stdout
             cdo_result = str(cdo_result)
             if cdo_result in grid_split:
                 grid_split[cdo_result].append(ff)
@@ -236,7 +231,7 @@ def regrid(self, grid=None, method="bil", recycle=False, one_grid=False, **kwarg
     self.current = new_files
 
     for ff in self:
-        if len([x for x in get_safe() if x == ff]) > 1:
+        if get_safe().count(ff) > 1:
             remove_safe(ff)
 
     self._thredds = False
@@ -1,22 +1,17 @@
 from nctoolkit.cleanup import cleanup
 from nctoolkit.runthis import run_this
-from nctoolkit.session import remove_safe
+from nctoolkit.session import session_info, append_safe, remove_safe
+from nctoolkit.scheduler import Scheduler
+from nctoolkit.instrument import records
+from nctoolkit.costs import learn
 
 
-def run(self):
+def start_run(self):
     """
-    Run all stored commands in a dataset
-
-    Examples
-    ------------
-    If evaluation is lazy and you need to evaluate commands on a dataset, do the following:
-
-    >>> ds.run()
-
+    Function to get the command and output method needed to run the stored
+    commands in a dataset. Returns None if there is nothing to run
     """
 
-    # the first step is to set the run status to true
-
     if (self._execute is False) and (
         len(self.history) > len(self._hold_history)
         or self._zip
@@ -35,23 +30,298 @@ def run(self):
         if self._merged:
             output_method = "one"
 
+        return cdo_command, output_method
+
+    return None
+
+
+def end_run(self):
+    """
+    Function to tidy up a dataset once its stored commands have been run
+    """
+    self._merged = False
+
+    self._execute = False
+    self._zip = False
+
+    if len(self._safe) > 0:
+        for ff in self._safe:
+            remove_safe(ff)
+
+    self._safe = []
+
+    cleanup()
+
+    self._ncommands = 0
+    self._align = ""
+    self.disk_clean()
+
+    self._precision = "default"
+
+
+def run(self):
+    """
+    Run all stored commands in a dataset
+
+    Examples
+    ------------
+    If evaluation is lazy and you need to evaluate commands on a dataset, do the following:
+
+    >>> ds.run()
+
+    """
+
+    # the first step is to set the run status to true
+
+    start = start_run(self)
+
+    if start is not None:
+        cdo_command, output_method = start
+
         run_this(cdo_command, self, output=output_method)
 
-        self._merged = False
+        end_run(self)
+
+
+def run_all(datasets, cores=None):
+    """
+    Run all stored commands in many datasets at once
+
+    The commands run on each file of each dataset are run in parallel, sharing the
+    same pool of processes. This is much faster than calling run on each dataset
+    in turn when there are many small datasets. Datasets that have been merged are
+    run one at a time. Datasets used by others, e.g. in add or regrid, are run when
+    those methods are called, so the datasets can be in any order.
 
-        self._execute = False
-        self._zip = False
+    Parameters
+    -------------
+    datasets : list
+        List of datasets to run
+    cores : int
+        Maximum number of commands to run at once. Defaults to the cores set using
+        options
 
-        if len(self._safe) > 0:
-            for ff in self._safe:
+    Examples
+    ------------
+    If you have created a dataset for each variable and region, you can run them all
+    as follows:
+
+    >>> nc.run_all(datasets, cores = 6)
+
+    """
+    from tqdm import tqdm
+    from nctoolkit.api import DataSet
+
+    if isinstance(datasets, DataSet):
+        datasets = [datasets]
+
+    if not isinstance(datasets, list):
+        raise TypeError("Please provide a list of datasets")
+
+    for ds in datasets:
+        if not isinstance(ds, DataSet):
+            raise TypeError("Please provide a list of datasets")
+
+    if cores is None:
+        cores = session_info["cores"]
+
+    if isinstance(cores, bool) or not isinstance(cores, int):
+        raise TypeError("cores must be an int")
+
+    if cores < 1:
+        raise ValueError("cores must be positive")
+
+    # a dataset could be in the list more than once
+    unique = []
+    for ds in datasets:
+        if len([x for x in unique if x is ds]) == 0:
+            unique.append(ds)
+
+    scheduler = Scheduler(cores)
+
+    pending = []
+    try:
+        for ds in unique:
+            start = start_run(ds)
+            if start is None:
+                continue
+
+            cdo_command, output_method = start
+            n_tasks = len(scheduler.tasks)
+            finish = run_this(
+                cdo_command, ds, output=output_method, scheduler=scheduler
+            )
+
+            # merged datasets are run straight away
+            if finish is None:
+                end_run(ds)
+                continue
+
+            pending.append((ds, finish, n_tasks, len(scheduler.tasks)))
+
+        n_records = records.mark()
+        try:
+            if session_info["progress"] == "on" and len(scheduler.tasks) > 0:
+                pbar = tqdm(total=len(scheduler.tasks), position=0, leave=True)
+                results = scheduler.run(lambda: pbar.update(1))
+            else:
+                results = scheduler.run()
+        finally:
+            # keep a history of operator throughput, for estimating costs
+            learn(records.since(n_records))
+    except Exception as e:
+        for ds, finish, start, end in pending:
+            finish(None)
+            ds.reset()
+        raise ValueError(e)
+
+    # keep every output until the dataset it belongs to has been updated
+    for ff in results:
+        if ff is not None:
+            append_safe(ff)
+
+    error = None
+    try:
+        for ds, finish, start, end in pending:
+            try:
+                finish(results[start:end])
+                end_run(ds)
+            except Exception as e:
+                ds.reset()
+                if error is None:
+                    error = e
+    finally:
+        for ff in results:
+            if ff is not None:
                 remove_safe(ff)
 
-        self._safe = []
+    if error is not None:
+        raise ValueError(error)
 
-        cleanup()
 
-        self._ncommands = 0
-        self._align = ""
-        self.disk_clean()
+def pending_copy(self, files):
+    """
+    Function to copy a dataset, including any commands not yet run, so that they
+    can be run on some of its files
+    """
+    from nctoolkit.api import DataSet
+
+    new = DataSet.__new__(DataSet)
+    for x in DataSet.__slots__[:-1]:
+        x = "_DataSet" + x if x.startswith("__") else x
+        setattr(new, x, getattr(self, x))
+    new.history = self._history
+    new._hold_history = self._hold_history
+    new._safe = list(self._safe)
+    new._atts = dict()
+
+    new._grouped = False
+    new._current = tuple(files)
+    for ff in files:
+        append_safe(ff)
+    for ff in new._safe:
+        append_safe(ff)
+    if self._weights is not None:
+        append_safe(self._weights)
+        append_safe(self._grid)
+    return new
+
+
+def iter_run(self):
+    """
+    Run all stored commands in a dataset, and yield a dataset for each file as soon
+    as it has been processed
+
+    Files are processed in parallel, using the cores set using options, and are
+    yielded in the order they finish, not the order of the files in the dataset.
+    New files are only processed while you are asking for results, so handling and
+    discarding each result as it arrives keeps memory and temporary file use down.
+    The dataset itself is not changed. Merged datasets are yielded as one dataset
+    once they have been run.
+
+    Examples
+    ------------
+    If you want to work with each file in an ensemble as soon as it is ready, do the
+    following:
+
+    >>> for ds_file in ds.iter_run():
+    >>>     df = ds_file.to_dataframe()
 
-        self._precision = "default"
+    """
+
+    if len(self) == 0:
+        raise ValueError("Failure do to empty dataset!")
+
+    if self._merged and len(self) > 1:
+        ds = pending_copy(self, self.current)
+        ds.run()
+        yield ds
+        return None
+
+    datasets = [pending_copy(self, [ff]) for ff in self.current]
+
+    scheduler = Scheduler(session_info["cores"])
+
+    # the tasks for each dataset that still has commands to run
+    pending = dict()
+    owner = dict()
+    targets = []
+    n_records = records.mark()
+
+    try:
+        for ds in datasets:
+            start = start_run(ds)
+            if start is None:
+                continue
+            cdo_command, output_method = start
+            n_tasks = len(scheduler.tasks)
+            finish = run_this(cdo_command, ds, output=output_method, scheduler=scheduler)
+            tasks = list(range(n_tasks, len(scheduler.tasks)))
+            pending[id(ds)] = (finish, tasks)
+            for i in tasks:
+                owner[i] = ds
+
+        # results are kept while the caller works with earlier ones, which may clean
+        # up temporary files
+        targets = [x[5] for x in scheduler.tasks]
+        for ff in targets:
+            append_safe(ff)
+
+        # files with nothing to run, or that were already processed, are ready now
+        for ds in datasets:
+            if id(ds) not in pending:
+                yield ds
+            elif len(pending[id(ds)][1]) == 0:
+                pending.pop(id(ds))[0]([])
+                end_run(ds)
+                yield ds
+
+        results = dict()
+        for i, result in scheduler.iterate():
+            ds = owner[i]
+            results[i] = result
+            finish, tasks = pending[id(ds)]
+            if len([x for x in tasks if x not in results]) > 0:
+                continue
+            pending.pop(id(ds))
+            try:
+                finish([results[x] for x in tasks])
+            finally:
+                for x in tasks:
+                    remove_safe(targets[x])
+            end_run(ds)
+            yield ds
+    except Exception as e:
+        raise ValueError(e)
+    finally:
+        # keep a history of operator throughput, for estimating costs
+        learn(records.since(n_records))
+        for ds in datasets:
+            if id(ds) in pending:
+                # the dataset was never given to the caller, so is not reset
+                finish, tasks = pending.pop(id(ds))
+                finish(None)
+                for x in tasks:
+                    if x < len(targets):
+                        remove_safe(targets[x])
+        cleanup()
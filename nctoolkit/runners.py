@@ -7,9 +7,17 @@ import platform
 import warnings
 
 import signal
+import threading
+import time
+
+if platform.system() == "Linux":
+    import multiprocessing as mp
+else:
+    import multiprocess as mp
 
 from nctoolkit.cleanup import cleanup
 from nctoolkit.flatten import str_flatten
+from nctoolkit.instrument import count, record
 
 from nctoolkit.session import (
     session_info,
@@ -18,8 +26,11 @@ from nctoolkit.session import (
     get_protected,
 )
 from nctoolkit.temp_file import temp_file
+from nctoolkit.tempstore import relocate, fallback, estimate_size, observe
 
 from nctoolkit.show import nc_variables
+from nctoolkit.strategies import out_of_memory, run_out_of_core, OutOfMemory
+from nctoolkit.precision import choose_precision
 
 def ann_anomaly(
     ff, baseline, metric, window, align, precision, new_files, new_commands, nc_safe):
@@ -92,6 +103,260 @@ def tidy_command(command):
     return command
 
 
+# CDO and NCO processes running in this process, and the files they write
+children = dict()
+
+
+def kill_group(pid):
+    """
+    Function to kill a child process, and anything it started
+    """
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def remove_partial(target):
+    """
+    Function to remove a temp file left part written by a command that was stopped
+    """
+    if isinstance(target, str) and session_info["stamp"] in target:
+        remove_safe(target)
+        if os.path.exists(target):
+            os.remove(target)
+
+
+def kill_children():
+    """
+    Function to kill all CDO and NCO processes started by this process, and remove
+    the temp files they were writing
+    """
+    for pid, target in list(children.items()):
+        kill_group(pid)
+        remove_partial(target)
+        children.pop(pid, None)
+
+
+def terminate(signum, frame):
+    """
+    Signal handler for SIGTERM. Running commands are killed, and temp files are
+    removed, unless this is a worker process, whose files belong to the main process
+    """
+    kill_children()
+    if mp.current_process().daemon:
+        os._exit(128 + signum)
+    from nctoolkit.cleanup import clean_all
+
+    clean_all()
+    raise SystemExit(128 + signum)
+
+
+def worker_init():
+    """
+    Function to set up the signal handlers of worker processes. Ctrl-C is left to
+    the main process, which stops the workers
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, terminate)
+
+
+# virtual memory reserved by each extra thread of a CDO process, for its stack and
+# malloc arena. This counts towards the memory limit without being used
+thread_memory = 72 * 1024**2
+
+
+def command_threads(command):
+    """
+    Function to find the number of threads a CDO command uses
+    """
+    parts = command.split()
+    for i in range(len(parts) - 1):
+        if parts[i] == "-P" and parts[i + 1].isdigit():
+            return int(parts[i + 1])
+    return 1
+
+
+def memory_limit(command):
+    """
+    Function to limit the memory of a command, if the memory_limit option is set
+
+    The shell sets the limit before running the command. Setting it in the child
+    process before exec is not safe while other threads are running
+    """
+    if session_info["memory_limit"] is None:
+        return command
+
+    size = int(session_info["memory_limit"])
+    size += (command_threads(command) - 1) * thread_memory
+
+    return f"ulimit -v {size // 1024} 2>/dev/null; {command}"
+
+
+def spawn(command, target=None, stderr=subprocess.STDOUT):
+    """
+    Function to run a command in the shell, and record how long it took and the
+    resources the child process used
+
+    Returns the process, its output and its error output, which is None unless
+    stderr is subprocess.PIPE
+    """
+    start = time.time()
+
+    # each command gets its own process group, so everything it starts can be killed
+    out = subprocess.Popen(
+        memory_limit(command),
+        shell=True,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=stderr,
+        start_new_session=True,
+    )
+    children[out.pid] = target
+
+    # the error output is read at the same time, so that neither pipe fills up
+    errors = []
+    reader = None
+    if stderr == subprocess.PIPE:
+        reader = threading.Thread(target=lambda: errors.append(out.stderr.read()))
+        reader.daemon = True
+        reader.start()
+
+    timer = None
+    expired = threading.Event()
+    if session_info["timeout"] is not None:
+
+        def expire():
+            expired.set()
+            kill_group(out.pid)
+
+        timer = threading.Timer(session_info["timeout"], expire)
+        timer.daemon = True
+        timer.start()
+
+    try:
+        out.stdin.close()
+        result = out.stdout.read()
+        out.stdout.close()
+        if reader is not None:
+            reader.join()
+            out.stderr.close()
+
+        # reap the child ourselves, so that its resource usage is available
+        pid, status, usage = os.wait4(out.pid, 0)
+    except BaseException:
+        kill_group(out.pid)
+        try:
+            os.waitpid(out.pid, 0)
+        except ChildProcessError:
+            pass
+        out.returncode = -signal.SIGKILL
+        remove_partial(target)
+        raise
+    finally:
+        if timer is not None:
+            timer.cancel()
+        children.pop(out.pid, None)
+
+    if os.WIFEXITED(status):
+        out.returncode = os.WEXITSTATUS(status)
+    else:
+        out.returncode = -os.WTERMSIG(status)
+
+    record(command, target, start, time.time(), usage, out.returncode)
+
+    if expired.is_set():
+        remove_partial(target)
+        raise ValueError(
+            f"The command timed out after {session_info['timeout']} seconds: {command}"
+        )
+
+    return out, result, errors[0] if len(errors) > 0 else None
+
+
+def execute(command, target=None):
+    """
+    Function to run a command in the shell, and record how long it took and the
+    resources the child process used
+
+    The command is killed if it runs for longer than the timeout option, or if
+    processing is interrupted. Its memory is limited by the memory_limit option.
+    Returns the process and its output
+    """
+    out, result, errors = spawn(command, target)
+    return out, result
+
+
+def run_shell(command, target=None):
+    """
+    Function to run a command in the shell, with its output and error output kept
+    apart, like subprocess.run. The command is recorded, and limited, in the same
+    way as those run by execute, so that the time spent in metadata calls etc. is
+    not mistaken for Python overhead
+
+    Returns a subprocess.CompletedProcess
+    """
+    out, result, errors = spawn(command, target, stderr=subprocess.PIPE)
+    return subprocess.CompletedProcess(command, out.returncode, result, errors)
+
+
+# netCDF formats that do not support compression
+classic = ["nc", "nc1", "nc2", "nc5"]
+
+
+def temp_options(command, precision="default", format=None, zip=False):
+    """
+    Function to add the session's policy for intermediate files to a CDO command
+    that writes a temporary file. Anything set on the dataset takes priority
+
+    Parameters
+    -------------
+    command : str
+        CDO command
+    precision : str
+        Precision set on the dataset
+    format : str
+        Format set on the dataset
+    zip : bool
+        Whether the dataset is to be zipped
+    """
+    options = []
+
+    if format is None and session_info["temp_format"] is not None:
+        if " -f " not in command:
+            options.append(f"-f {session_info['temp_format']}")
+
+    # compression only works with netCDF4
+    if zip is False and session_info["temp_compression"]:
+        if " -z " not in command and session_info["temp_format"] not in classic:
+            options.append(f"-z zip_{session_info['temp_compression']}")
+
+    if precision in [None, "default"] and session_info["precision"] is None:
+        if session_info["temp_precision"] is not None and " -b " not in command:
+            options.append(f"-b {session_info['temp_precision']}")
+
+    if len(options) == 0:
+        return command
+
+    return command.replace("cdo ", f"cdo {' '.join(options)} ", 1)
+
+
+def omp_threads(width=1):
+    """
+    Function to work out how many OpenMP threads each CDO process can use
+
+    Parameters
+    -------------
+    width : int
+        Number of CDO processes that will run at the same time
+    """
+    # processes inside a pool are given their threads by the parent
+    if mp.current_process().daemon or session_info["parallel"]:
+        return 1
+
+    return max(1, session_info["cores"] // max(width, 1))
+
+
 def run_nco(command, target, out_file=None, overwrite=False):
     command = command.strip()
     append_safe(target)
@@ -102,28 +367,18 @@ def run_nco(command, target, out_file=None, overwrite=False):
             if overwrite is False:
                 raise ValueError("Attempting to overwrite an opened file")
 
-    if platform.system() == "Linux":
-        if session_info["temp_dir"] == "/tmp/":
-            result = os.statvfs("/tmp/")
-            result = result.f_frsize * result.f_bavail
-
-            if result < 1 * 1e9:
-                session_info["temp_dir"] == "/var/tmp/"
-                if target.startswith("/tmp"):
-                    new_target = target.replace("/tmp/", "/var/tmp/")
-                    command = command.replace(target, new_target)
-                    remove_safe(target)
-                    target = new_target
-                    append_safe(target)
+    # make sure the target is in a temp tier with room for it
+    if out_file is None:
+        new_target = relocate(target, estimate_size(command, target))
+    else:
+        new_target = target
+    if new_target != target:
+        command = command.replace(target, new_target)
+        remove_safe(target)
+        target = new_target
+        append_safe(target)
 
-    out = subprocess.Popen(
-        command,
-        shell=True,
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-    )
-    result, ignore = out.communicate()
+    out, result = execute(command, target)
 
     if "(Abort)" in str(result):
         raise ValueError(
@@ -131,27 +386,19 @@ def run_nco(command, target, out_file=None, overwrite=False):
         )
 
     if "ERROR" in str(result):
-        if target.startswith("/tmp/"):
-            new_target = target.replace("/tmp/", "/var/tmp/")
+        new_target = fallback(target)
+        if new_target is not None:
             command = command.replace(target, new_target)
             append_safe(new_target)
             remove_safe(target)
             target = new_target
 
-            out = subprocess.Popen(
-                command,
-                shell=True,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-            )
-            result1, ignore = out.communicate()
+            out, result1 = execute(command, target)
             if "ERROR" in str(result1):
                 remove_safe(target)
                 raise ValueError(
                     str(result1).replace("b'", "").replace("\\n", "").replace("'", "")
                 )
-            session_info["temp_dir"] = "/var/tmp/"
             if "Warning:" in str(result1):
                 warnings.warn(message=f"NCO warning: {str(result1)}")
     else:
@@ -174,10 +421,12 @@ def run_nco(command, target, out_file=None, overwrite=False):
     return target
 
 
-def run_cdo(command=None, target=None, out_file=None, overwrite=False, precision=None):
-    warned = False
-
+def prepare_cdo(command, target, out_file, overwrite, precision, threads):
+    """
+    Function to get a CDO command ready to run, and find the file it will write to
 
+    Returns the command and the target
+    """
     if not isinstance(precision, str):
         raise TypeError("Precision must be str")
 
@@ -192,42 +441,88 @@ def run_cdo(command=None, target=None, out_file=None, overwrite=False, precision
 
     command = tidy_command(command)
 
+    # use OpenMP threads for any cores not used by other CDO processes
+    if threads is None:
+        threads = omp_threads()
+
+    # avoid running the command again if the output will not fit its data types
+    if precision == "default":
+        command = choose_precision(command)
+
+    if threads > 1 and " -P " not in command:
+        command = command.replace("cdo ", f"cdo -P {threads} ")
+
     if target is None:
         raise TypeError("Target must be specified")
 
-    start_target = target
-
     if out_file is None:
         if os.path.exists(command.split()[-1]):
             if overwrite is False:
                 raise ValueError("Attempting to overwrite file")
 
-    if platform.system() == "Linux":
-        if session_info["temp_dir"] == "/tmp/":
-            result = os.statvfs("/tmp/")
-            result = result.f_frsize * result.f_bavail
-
-            if result < 1 * 1e9:
-                session_info["temp_dir"] == "/var/tmp/"
-                if target.startswith("/tmp"):
-                    new_target = target.replace("/tmp/", "/var/tmp/")
-                    command = command.replace(target, new_target)
-                    target = target.replace("/tmp/", "/var/tmp/")
+    # make sure the target is in a temp tier with room for it
+    if out_file is None:
+        new_target = relocate(target, estimate_size(command, target))
+    else:
+        new_target = target
+    if new_target != target:
+        command = command.replace(target, new_target)
+        target = new_target
 
     if command.startswith("cdo ") is False:
         raise ValueError("The command does not start with cdo!")
 
     append_safe(target)
 
-    out = subprocess.Popen(
-        command,
-        shell=True,
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
+    return command, target
+
+
+def run_cdo(
+    command=None,
+    target=None,
+    out_file=None,
+    overwrite=False,
+    precision=None,
+    threads=None,
+):
+    start_target = target
+
+    command, target = prepare_cdo(
+        command, target, out_file, overwrite, precision, threads
     )
-    out.wait()
-    result, ignore = out.communicate()
+
+    out, result = execute(command, target)
+
+    return check_cdo(command, target, start_target, out_file, precision, out, result)
+
+
+def check_cdo(command, target, start_target, out_file, precision, out, result):
+    """
+    Function to check the output of a CDO command, and deal with any problems,
+    e.g. by running it again with a different precision
+
+    Returns the file written to
+    """
+    warned = False
+
+    # run the command in smaller pieces if it ran out of memory
+    if out_of_memory(result, out.returncode):
+        if os.path.exists(target):
+            os.remove(target)
+        new_target = run_out_of_core(command, target, out_file, precision)
+        if new_target is not None:
+            return new_target
+
+        remove_safe(target)
+        remove_safe(start_target)
+        if "sellonlat" in command:
+            raise OutOfMemory(
+                "Is the horizontal grid very large? Consider setting cdo=False in crop!"
+            )
+        raise OutOfMemory(
+            "CDO ran out of memory. The command could not be split into pieces that "
+            f"fit in memory: {command}"
+        )
 
     # If it is a generic grid, it's better to not throw the CDO error which might be confusing.
     if "generic" in result.decode("utf-8").lower():
@@ -241,6 +536,7 @@ def run_cdo(command=None, target=None, out_file=None, overwrite=False, precision
         result.decode("utf-8")
     ) or "not represent" in result.decode("utf-8"):
         print("Switching to 32 bit precision!")
+        count("precision_reruns")
         command_chunks = command.split(" ")
 
         i = 0
@@ -265,17 +561,10 @@ def run_cdo(command=None, target=None, out_file=None, overwrite=False, precision
         command = command.replace(target, new_target)
         target = new_target
 
-        out = subprocess.Popen(
-            command,
-            shell=True,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-        )
-        out.wait()
-        result, ignore = out.communicate()
+        out, result = execute(command, target)
 
     if "Use the CDO option -b F32" in (result.decode("utf-8")):
+        count("precision_reruns")
         command_chunks = command.split(" ")
 
         i = 0
@@ -291,15 +580,7 @@ def run_cdo(command=None, target=None, out_file=None, overwrite=False, precision
             command = command.replace("cdo ", "cdo -b F64 ")
         command
 
-        out = subprocess.Popen(
-            command,
-            shell=True,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-        )
-        out.wait()
-        result, ignore = out.communicate()
+        out, result = execute(command, target)
 
     if out_file is not None:
         if "HDF5 library version mismatched error" in str(result):
@@ -324,13 +605,6 @@ def run_cdo(command=None, target=None, out_file=None, overwrite=False, precision
         else:
             return out_file
 
-    if ("sellonlat" in command) and ("std::bad_alloc" in str(result)):
-        remove_safe(target)
-        remove_safe(start_target)
-        raise ValueError(
-            "Is the horizontal grid very large? Consider setting cdo=False in crop!"
-        )
-
     if "cdf_put" in str(result):
         error = str(result).replace("b'", "").replace("\\n", "").replace("'", "")
         if "Numeric conversion not representable" in error:
@@ -477,8 +751,8 @@ def run_cdo(command=None, target=None, out_file=None, overwrite=False, precision
         or ("HDF error" in str(result))
         or (out.returncode != 0)
     ):
-        if target.startswith("/tmp/"):
-            new_target = target.replace("/tmp/", "/var/tmp/")
+        new_target = fallback(target)
+        if new_target is not None:
             command = command.replace(target, new_target)
             target = new_target
             append_safe(target)
@@ -488,15 +762,7 @@ def run_cdo(command=None, target=None, out_file=None, overwrite=False, precision
                     "HDF error when running CDO. Check if files are corrupt using the is_corrupt method, and consider running the check method"
                 )
 
-            out = subprocess.Popen(
-                command,
-                shell=True,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-            )
-            out.wait()
-            result1, ignore = out.communicate()
+            out, result1 = execute(command, target)
             if (
                 (str(result1).startswith("b'Error"))
                 or ("HDF error" in str(result1))
@@ -838,4 +1104,7 @@ def run_cdo(command=None, target=None, out_file=None, overwrite=False, precision
             message = f"The following month was missing in the dataset: {sel_month}"
         warnings.warn(message=message)
 
+    # keep track of output sizes, so they can be estimated next time
+    observe(command, target)
+
     return target
\ No newline at end of file
@@ -23,7 +23,22 @@ from nctoolkit.session import (
 from nctoolkit.temp_file import temp_file
 
 from nctoolkit.show import nc_variables
-from nctoolkit.runners import run_cdo, tidy_command, run_nco
+from nctoolkit.runners import run_cdo, tidy_command, run_nco, temp_options
+from nctoolkit.scheduler import Scheduler
+from nctoolkit.tempstore import estimate_size
+from nctoolkit.strategies import choose_strategy, run_strategy
+from nctoolkit.stage import staged_file, release
+from nctoolkit.prefetch import Prefetcher
+from nctoolkit.instrument import records, count
+from nctoolkit.costs import learn
+from nctoolkit.history import FILE, TARGET, make_batch
+from nctoolkit.checkpoint import (
+    attempt,
+    checkpoint_key,
+    checkpoint_target,
+    completed,
+    run_task,
+)
 
 
 def file_size(file_path):
@@ -38,7 +53,141 @@ def file_size(file_path):
 # pool = mp.get_context('fork').Pool(1)
 
 
-def run_this(os_command, self, output="one", out_file=None, suppress=False):
+def chain_command(os_command, self):
+    """
+    Function to add any commands held over in the history to a command
+    """
+    if len(self.history) > len(self._hold_history):
+        os_command = f'{os_command} {self.history[-1].replace("cdo ", " ")}'
+        os_command = os_command.replace("  ", " ")
+    return os_command
+
+
+def file_command(os_command, self, source, target, out_file=None, ncommands=None):
+    """
+    Function to build the command that is run on a single file in a dataset
+
+    Parameters
+    -------------
+    os_command : str
+        The command, including held over commands
+    source : str
+        File to run the command on
+    target : str
+        File the command writes to
+    ncommands : int
+        Number of commands run since the dataset was last evaluated. Defaults to the
+        dataset's count
+    """
+    if ncommands is None:
+        ncommands = self._ncommands
+
+    ff_command = f"{os_command} {source} "
+    if "infile09178" in ff_command:
+        ff_command = " ".join(ff_command.split(" ")[:-2])
+        ff_command = ff_command.replace("infile09178", source)
+
+    ff_command = f"{ff_command} {target}"
+    ff_command = ff_command.replace("  ", " ")
+
+    if "reduce_dim" in ff_command:
+        ff_command = (
+            ff_command.replace("reduce_dim", "").replace(" - ", " ").replace(" -- ", " ")
+        )
+        ff_command = ff_command.replace("cdo ", "cdo --reduce_dim ")
+
+    ff_command = tidy_command(ff_command)
+
+    zip_copy = False
+    if self._zip and ncommands == 1:
+        zip_copy = True
+
+    format_it = False
+    if self._format is not None:
+        format_it = True
+        if ncommands == 1:
+            ff_command = ff_command.replace("cdo ", f"cdo -f {self._format} copy ")
+        else:
+            ff_command = ff_command.replace("cdo ", f"cdo -f {self._format} ")
+    ff_command = ff_command.replace("cdo ", f"cdo {self._align} ").replace("  ", " ")
+
+    if self._zip and zip_copy and format_it is False:
+        ff_command = ff_command.replace("cdo ", "cdo -z zip copy ")
+    else:
+        if self._zip:
+            ff_command = ff_command.replace("cdo ", "cdo -z zip ")
+
+    if out_file is None:
+        ff_command = temp_options(ff_command, self._precision, self._format, self._zip)
+
+    return ff_command
+
+
+def merge_command(os_command, self, sources, target, out_file=None, ncommands=None):
+    """
+    Function to build the command that is run on all files in a dataset at once,
+    e.g. when merging
+
+    Parameters
+    -------------
+    os_command : str
+        The command, including held over commands
+    sources : list
+        Files to run the command on
+    target : str
+        File the command writes to
+    ncommands : int
+        Number of commands run since the dataset was last evaluated. Defaults to the
+        dataset's count
+    """
+    if ncommands is None:
+        ncommands = self._ncommands
+
+    os_command = os_command + " [ " + str_flatten(sources, " ") + " ] " + target
+
+    zip_copy = False
+    if self._zip and ncommands == 1:
+        zip_copy = True
+
+    format_it = False
+
+    if self._format is not None:
+        format_it = True
+        if ncommands == 1:
+            os_command = os_command.replace("cdo ", f"cdo -f {self._format} copy ")
+        else:
+            os_command = os_command.replace("cdo ", f"cdo -f {self._format} ")
+
+    if self._zip and zip_copy and format_it is False:
+        os_command = os_command.replace("cdo ", "cdo -z zip copy ")
+    else:
+        if self._zip:
+            os_command = os_command.replace("cdo ", "cdo -z zip ")
+
+    if "infile09178" in os_command:
+        os_command = os_command.replace(sources[-1], "")
+        os_command = os_command.replace("infile09178", sources[-1])
+
+    os_command = tidy_command(os_command)
+
+    os_command = os_command.replace("cdo ", f"cdo {self._align} ").replace("  ", " ")
+
+    if out_file is None:
+        os_command = temp_options(os_command, self._precision, self._format, self._zip)
+
+    return os_command
+
+
+def run_this(
+    os_command, self, output="one", out_file=None, suppress=False, scheduler=None
+):
+    """
+    Function to run a command on a dataset
+
+    If a scheduler is given, the commands run on each file are added to it instead
+    of being run, and a function is returned that takes the scheduler's results
+    for those commands and finishes updating the dataset
+    """
     from tqdm import tqdm
 
     if len(self) == 0:
@@ -48,6 +197,14 @@ def run_this(os_command, self, output="one", out_file=None, suppress=False):
 
     cores = session_info["cores"]
 
+    prefetcher = None
+
+    # staged copies of the inputs, which cannot be evicted until the commands are run
+    staged = set()
+
+    # keep track of the commands run, so they can be added to the profile
+    n_records = records.mark()
+
     if len(self) == 1:
         output = "ensemble"
 
@@ -68,21 +225,47 @@ def run_this(os_command, self, output="one", out_file=None, suppress=False):
                     cores = 1
                 file_list = self.current
 
-                if len(self.history) > len(self._hold_history):
-                    os_command = f'{os_command} {self.history[-1].replace("cdo ", " ")}'
-                    os_command = os_command.replace("  ", " ")
-
-                if cores > 1:
-                    original_sigint_handler = signal.signal(
-                        signal.SIGTERM, signal.SIG_IGN
-                    )
-                    pool = mp.get_context('fork').Pool(cores)
-                    signal.signal(signal.SIGTERM, original_sigint_handler)
-
-                    target_list = []
-                    results = dict()
-                else:
-                    target_list = []
+                os_command = chain_command(os_command, self)
+
+                # if there are fewer files than cores, use the cores within each file
+                if 1 < len(self) < cores and self._thredds is False:
+                    probe = f"{os_command} {self[0]} {self[0]}"
+                    if choose_strategy(probe, self[0]) is not None:
+                        cores = 1
+
+                # tasks can be added to a scheduler shared with other datasets
+                deferred = scheduler is not None
+                parallel = cores > 1 or deferred
+                if parallel and not deferred:
+                    scheduler = Scheduler(cores)
+
+                target_list = []
+
+                # commands run on each file are stored in the history as one batch
+                template = file_command(os_command, self, FILE, TARGET, out_file)
+                history_targets = []
+                history_commands = []
+
+                # record finished files in the checkpoint directory, so that reruns
+                # can skip them
+                checkpoint_dir = None
+                if session_info["checkpoint_dir"] is not None and out_file is None:
+                    checkpoint_dir = session_info["checkpoint_dir"]
+                keys = [None for ff in file_list]
+                reused = dict()
+                if checkpoint_dir is not None:
+                    finished = completed(checkpoint_dir)
+                    for i, ff in enumerate(file_list):
+                        if os.path.isfile(ff):
+                            keys[i] = checkpoint_key(template.replace(FILE, ff), ff)
+                            if keys[i] in finished:
+                                reused[i] = finished[keys[i]]
+                                count("checkpoint_hits")
+
+                # copy upcoming input files to local storage while others are processed
+                prefetcher = Prefetcher(
+                    [ff for i, ff in enumerate(file_list) if i not in reused]
+                ).start()
 
                 progress_bar = False
 
@@ -98,7 +281,7 @@ def run_this(os_command, self, output="one", out_file=None, suppress=False):
                 if session_info["progress"] == "on" and len(self) > 1:
                     progress_bar = True
 
-                if cores == 1:
+                if not parallel:
                     if progress_bar:
                         if session_info["progress"] == "on":
                             if not suppress:
@@ -109,79 +292,155 @@ def run_this(os_command, self, output="one", out_file=None, suppress=False):
                         if not suppress:
                             pbar = tqdm(total=len(file_list), position=0, leave=True)
 
-                for ff in file_list:
-                    ff_command = os_command
+                for i, ff in enumerate(file_list):
+                    if i in reused:
+                        history_targets.append(reused[i])
+                        history_commands.append(
+                            template.replace(FILE, ff).replace(TARGET, reused[i])
+                        )
+                        if not parallel and progress_bar and not suppress:
+                            pbar.update(1)
+                        continue
 
-                    ff_command = f"{ff_command} {ff} "
-                    if "infile09178" in ff_command:
-                        ff_command = " ".join(ff_command.split(" ")[:-2])
-                        ff_command = ff_command.replace("infile09178", ff)
+                    # read compressed inputs from the staging cache, if in use
+                    source = staged_file(ff, staged)
+                    if not parallel and source == ff:
+                        source = prefetcher.get(ff)
 
-                    target = temp_file("nc")
+                    if keys[i] is not None:
+                        target = checkpoint_target(checkpoint_dir, keys[i])
+                    else:
+                        target = temp_file("nc")
 
                     if out_file is not None:
                         target = out_file
 
-                    ff_command = f"{ff_command} {target}"
-                    ff_command = ff_command.replace("  ", " ")
-                    if " --sortname " in os_command:
-                        os_command = os_command.replace(" --sortname ", " ")
-                        os_command = os_command.replace("cdo  ", "cdo --sortname ")
-
-                    if "reduce_dim" in ff_command:
-                        ff_command = (
-                            ff_command.replace("reduce_dim", "")
-                            .replace(" - ", " ")
-                            .replace(" -- ", " ")
-                        )
-                        ff_command = ff_command.replace("cdo ", "cdo --reduce_dim ")
+                    ff_command = file_command(os_command, self, source, target, out_file)
 
-                    ff_command = tidy_command(ff_command)
+                    history_targets.append(target)
+                    history_commands.append(ff_command.replace(source, ff))
 
-                    zip_copy = False
-                    if self._zip and self._ncommands == 1:
-                        zip_copy = True
+                    task = run_cdo
+                    args = [ff_command, target, out_file, False, self._precision]
+                    if keys[i] is not None:
+                        task = run_task
+                        args.append(
+                            (checkpoint_dir, keys[i], ff, history_commands[-1])
+                        )
 
-                    format_it = False
-                    if self._format is not None:
-                        format_it = True
-                        if self._ncommands == 1:
-                            ff_command = ff_command.replace(
-                                "cdo ", f"cdo -f {self._format} copy "
+                    if parallel:
+                        scheduler.submit(
+                            task,
+                            args,
+                            size=file_size(source),
+                            threaded=True,
+                            space=estimate_size(ff_command, target),
+                            target=target,
+                            prepare=lambda x, ff=ff: [
+                                x[0].replace(f" {ff} ", f" {prefetcher.get(ff)} ")
+                            ]
+                            + x[1:],
+                            finish=lambda ff=ff: prefetcher.done(ff),
+                        )
+                    else:
+                        strategy = choose_strategy(ff_command, source)
+                        if strategy is not None:
+                            task = run_strategy
+                            args = [strategy, ff_command, source, target, out_file]
+                        else:
+                            task = run_cdo
+                            args = [ff_command, target, out_file]
+                        if keys[i] is not None:
+                            # failed files are retried, and left out if they still fail
+                            target = attempt(
+                                task,
+                                args,
+                                {"precision": self._precision},
+                                checkpoint_dir,
+                                keys[i],
+                                ff,
+                                history_commands[-1],
                             )
                         else:
-                            ff_command = ff_command.replace(
-                                "cdo ", f"cdo -f {self._format} "
+                            target = task(*args, precision=self._precision)
+                        prefetcher.done(ff)
+                        target_list.append(target)
+                        if progress_bar:
+                           if not suppress:
+                               pbar.update(1)
+
+                def finish(target_list):
+                    prefetcher.stop()
+                    release(staged)
+
+                    # the shared scheduler failed
+                    if target_list is None:
+                        return None
+
+                    if len(reused) > 0:
+                        results = iter(target_list)
+                        target_list = [
+                            reused[i] if i in reused else next(results)
+                            for i in range(len(file_list))
+                        ]
+
+                    if checkpoint_dir is not None:
+                        failed = [
+                            ff for ff, x in zip(file_list, target_list) if x is None
+                        ]
+                        if len(failed) == len(file_list):
+                            raise ValueError(
+                                "Processing failed for every file. Use "
+                                "checkpoint_status to see the errors"
+                            )
+                        if len(failed) > 0:
+                            warnings.warn(
+                                f"Processing failed for {len(failed)} file(s), which "
+                                f"were removed from the dataset: "
+                                f"{str_flatten(failed, ', ')}. Run the commands again "
+                                "to retry them, or use checkpoint_status to see the "
+                                "errors"
                             )
-                    ff_command = ff_command.replace(
-                        "cdo ", f"cdo {self._align} "
-                    ).replace("  ", " ")
 
-                    if self._zip and zip_copy and format_it is False:
-                        ff_command = ff_command.replace("cdo ", "cdo -z zip copy ")
-                    else:
-                        if self._zip:
-                            ff_command = ff_command.replace("cdo ", "cdo -z zip ")
+                    self.history = new_history + make_batch(
+                        template, file_list, history_targets, history_commands
+                    )
+                    self.current = copy.deepcopy(target_list)
+                    self.current = [x for x in self.current if x is not None]
 
-                    new_history.append(ff_command)
+                    if not parallel or session_info["parallel"]:
+                        for ff in target_list:
+                            remove_safe(ff)
 
-                    if cores > 1:
-                        temp = pool.apply_async(
-                            run_cdo,
-                            [ff_command, target, out_file, False, self._precision],
-                        )
+                    self.disk_clean()
 
-                        results[ff] = temp
-                    else:
-                        target = run_cdo(
-                            ff_command, target, out_file, precision=self._precision
-                        )
-                        target_list.append(target)
-                        if progress_bar:
-                           if not suppress:
-                               pbar.update(1)
+                    cleanup()
+
+                    self._hold_history = copy.deepcopy(self.history)
 
-                if cores > 1:
+                    self._zip = False
+
+                    self._ncommands = 0
+
+                    self._format = None
+
+                    # the commands were run by the shared scheduler
+                    if deferred:
+                        # outputs can be moved to another temp tier when run
+                        targets = set(history_targets)
+                        targets.update(x for x in target_list if x is not None)
+                        self._profile += [
+                            x
+                            for x in records.since(n_records)
+                            if x["command"].split()[-1] in targets
+                        ]
+
+                    return None
+
+                if deferred:
+                    return finish
+
+                if parallel:
                    if progress_bar:
                        if session_info["progress"] == "on":
                            if not suppress:
@@ -191,99 +450,34 @@ def run_this(os_command, self, output="one", out_file=None, suppress=False):
                                print("Processing a large ensemble. In progress:")
                        if not suppress:
                           pbar = tqdm(total=len(file_list), position=0, leave=True)
-                   for k, v in results.items():
-                       target_list.append(v.get())
-                       if progress_bar:
-                          if not suppress:
-                              pbar.update(1)
-                #if cores > 1:
-                #    pool.close()
+                   if progress_bar and not suppress:
+                       target_list = scheduler.run(lambda: pbar.update(1))
+                   else:
+                       target_list = scheduler.run()
 
-
-                self.history = copy.deepcopy(new_history)
-                self.current = copy.deepcopy(target_list)
-                self.current = [x for x in self.current if x is not None]
-
-                if cores == 1 or session_info["parallel"]:
-                    for ff in target_list:
-                        remove_safe(ff)
-
-                self.disk_clean()
-
-                cleanup()
-
-                self._hold_history = copy.deepcopy(self.history)
-
-                self._zip = False
-
-                self._ncommands = 0
-
-                self._format = None
-
-                return None
+                return finish(target_list)
 
             if ((output == "one") and (len(self) > 1)) or self._zip is False:
                 new_history = copy.deepcopy(self._hold_history)
 
-                if len(self.history) > len(self._hold_history):
-                    os_command = f'{os_command} {self.history[-1].replace("cdo ", " ")}'
-                    os_command = os_command.replace("  ", " ")
+                os_command = chain_command(os_command, self)
 
-                # ensure there is sufficient space in /tmp if it is to be used
-                if platform.system() == "Linux":
-                    all_sizes = 0
+                # make sure the temp tier used has room for the output
+                all_sizes = 0
 
-                    for ff in self:
-                        if file_size(ff) is not None:
-                            all_sizes += file_size(ff)
+                for ff in self:
+                    if file_size(ff) is not None:
+                        all_sizes += file_size(ff)
 
-                    result = os.statvfs("/tmp/")
-                    result = result.f_frsize * result.f_bavail
-
-                    if result < (2 * all_sizes):
-                        session_info["temp_dir"] == "/var/tmp/"
-
-                target = temp_file("nc")
+                target = temp_file("nc", size=all_sizes)
 
                 if out_file is not None:
                     target = out_file
 
-                os_command = (
-                    os_command + " [ " + str_flatten(self.current, " ") + " ] " + target
-                )
-
-                zip_copy = False
-                if self._zip and self._ncommands == 1:
-                    zip_copy = True
+                # read compressed inputs from the staging cache, if in use
+                sources = [staged_file(ff, staged) for ff in self]
 
-                format_it = False
-
-                if self._format is not None:
-                    format_it = True
-                    if self._ncommands == 1:
-                        os_command = os_command.replace(
-                            "cdo ", f"cdo -f {self._format} copy "
-                        )
-                    else:
-                        os_command = os_command.replace(
-                            "cdo ", f"cdo -f {self._format} "
-                        )
-
-                if self._zip and zip_copy and format_it is False:
-                    os_command = os_command.replace("cdo ", "cdo -z zip copy ")
-                else:
-                    if self._zip:
-                        os_command = os_command.replace("cdo ", "cdo -z zip ")
-
-                if "infile09178" in os_command:
-                    os_command = os_command.replace(ff, "")
-                    os_command = os_command.replace("infile09178", ff)
-
-                os_command = tidy_command(os_command)
-
-                os_command = os_command.replace("cdo ", f"cdo {self._align} ").replace(
-                    "  ", " "
-                )
+                os_command = merge_command(os_command, self, sources, target, out_file)
 
                 if "mergetime" in os_command:
                     try:
@@ -324,10 +518,15 @@ def run_this(os_command, self, output="one", out_file=None, suppress=False):
                         os_command, target, out_file, precision=self._precision
                     )
 
+                release(staged)
+
                 remove_safe(target)
 
                 self.current = target
 
+                for ff, source in zip(self, sources):
+                    os_command = os_command.replace(source, ff)
+
                 self.history = new_history
                 self.history.append(os_command)
 
@@ -338,9 +537,16 @@ def run_this(os_command, self, output="one", out_file=None, suppress=False):
                 self._hold_history = copy.deepcopy(self.history)
 
                 self._zip = False
-                self._n_commands = 0
+                self._ncommands = 0
 
                 self._format = None
     except Exception as e:
+        if prefetcher is not None:
+            prefetcher.stop()
+        release(staged)
         self.reset()
         raise ValueError(e)
+    finally:
+        self._profile += records.since(n_records)
+        # keep a history of operator throughput, for estimating costs
+        learn(records.since(n_records))
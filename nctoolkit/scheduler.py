@@ -0,0 +1,246 @@
+import platform
+import queue
+import resource
+import time
+
+from nctoolkit.instrument import records
+from nctoolkit.session import session_info
+from nctoolkit.tempstore import reserve, release, ratios
+
+if platform.system() == "Linux":
+    import multiprocessing as mp
+else:
+    import multiprocess as mp
+
+
+def timed(func, args):
+    """
+    Function to run a task in a worker and measure how long it took, and how
+    much CPU time its child processes (i.e. CDO) used
+    """
+    start = time.time()
+    n = records.mark()
+    seen = dict(ratios)
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    result = func(*args)
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    # send the records of the commands run, and the output size ratios seen, back
+    # to the parent
+    new_ratios = {k: v for k, v in ratios.items() if seen.get(k) != v}
+    return result, time.time() - start, cpu, records.since(n), new_ratios
+
+
+class Controller:
+    """
+    Hill-climbing controller for the number of CDO processes running at once
+
+    The controller starts in the middle of its bounds. After every window of
+    completed tasks it compares the throughput (bytes processed per second) with
+    the previous window. It keeps moving in the same direction while throughput
+    improves, and turns around when it falls. If throughput is flat and the CDO
+    processes are mostly waiting on I/O, it backs off.
+    """
+
+    def __init__(self, low, high, adaptive=True):
+        self.low = max(1, low)
+        self.high = max(self.low, high)
+        self.adaptive = adaptive
+        if adaptive:
+            self.limit = max(self.low, (self.low + self.high) // 2)
+        else:
+            self.limit = self.high
+        self.direction = 1
+        self.previous = None
+        self.limits = [self.limit]
+        self._reset()
+
+    def _reset(self):
+        self.start = time.time()
+        self.done = 0
+        self.processed = 0
+        self.wall = 0
+        self.cpu = 0
+
+    def update(self, size, wall, cpu):
+        """
+        Record a completed task, and change the limit at the end of a window
+        """
+        self.done += 1
+        self.processed += size
+        self.wall += wall
+        self.cpu += cpu
+
+        if self.adaptive is False or self.done < self.limit:
+            return self.limit
+
+        rate = self.processed / max(time.time() - self.start, 1e-6)
+        usage = self.cpu / max(self.wall, 1e-6)
+
+        if self.previous is not None:
+            if rate < 0.95 * self.previous:
+                self.direction = -self.direction
+            else:
+                if rate < 1.05 * self.previous and usage < 0.5:
+                    self.direction = -1
+
+        self.previous = rate
+        self.limit = min(self.high, max(self.low, self.limit + self.direction))
+        self.limits.append(self.limit)
+        self._reset()
+
+        return self.limit
+
+
+class Scheduler:
+    """
+    Run tasks in a pool of worker processes, with the number of tasks running at
+    once set by a controller
+
+    Parameters
+    -------------
+    cores : int
+        Maximum number of tasks to run at once
+    adaptive : bool
+        Whether to adapt the number of tasks running at once. Defaults to the
+        session's adaptive option
+    """
+
+    def __init__(self, cores, adaptive=None):
+        if adaptive is None:
+            adaptive = session_info["adaptive"]
+        self.cores = cores
+        self.controller = Controller(1, cores, adaptive)
+        self.tasks = []
+        self.hooks = []
+
+    def submit(
+        self,
+        func,
+        args,
+        size=None,
+        threaded=False,
+        space=None,
+        target=None,
+        prepare=None,
+        finish=None,
+    ):
+        """
+        Add a task. size is the number of bytes the task processes. If threaded
+        is True, the number of OpenMP threads CDO can use is added to args when
+        the task is launched. space is the estimated size of the file the task
+        writes to target. Tasks are held back until their temp tier has room for it.
+        prepare is called with args when the task is launched, and returns the args
+        to use. finish is called when the task has finished
+        """
+        self.tasks.append((func, list(args), size, threaded, space, target))
+        self.hooks.append((prepare, finish))
+        return len(self.tasks) - 1
+
+    def run(self, callback=None):
+        """
+        Run the tasks, and return their results in the order they were submitted
+        """
+        results = [None for x in self.tasks]
+        for i, result in self.iterate(callback):
+            results[i] = result
+        return results
+
+    def iterate(self, callback=None):
+        """
+        Run the tasks, and yield the index and result of each one as it finishes.
+        New tasks are only launched while the caller is asking for results, so a
+        slow caller holds back the tasks still waiting
+        """
+        from nctoolkit.runners import omp_threads, worker_init
+
+        if len(self.tasks) == 0:
+            return
+
+        # weight tasks by size only if every size is known
+        sizes = [x[2] for x in self.tasks]
+        if None in sizes or 0 in sizes:
+            sizes = [1 for x in sizes]
+
+        errors = []
+        reserved = set()
+        finished = queue.Queue()
+
+        pool = mp.get_context("fork").Pool(
+            min(self.cores, len(self.tasks)), initializer=worker_init
+        )
+
+        def launch(i):
+            func, args, size, threaded, space, target = self.tasks[i]
+            prepare = self.hooks[i][0]
+            if prepare is not None:
+                args = prepare(args)
+            if threaded:
+                args = args + [
+                    omp_threads(min(self.controller.limit, len(self.tasks)))
+                ]
+            pool.apply_async(
+                timed,
+                [func, args],
+                callback=lambda x: finished.put((i, x, None)),
+                error_callback=lambda e: finished.put((i, None, e)),
+            )
+
+        try:
+            waiting = list(range(len(self.tasks)))
+            running = 0
+            while len(waiting) > 0 or running > 0:
+                while (
+                    len(waiting) > 0
+                    and running < self.controller.limit
+                    and len(errors) == 0
+                ):
+                    # wait for running tasks to finish if there is no room for
+                    # the output, unless nothing is running
+                    space, target = self.tasks[waiting[0]][4:]
+                    if space is not None:
+                        if not reserve(space, target, force=running == 0):
+                            break
+                        reserved.add(waiting[0])
+                    launch(waiting.pop(0))
+                    running += 1
+
+                if running == 0:
+                    break
+
+                i, x, e = finished.get()
+                running -= 1
+
+                if i in reserved:
+                    release(*self.tasks[i][4:])
+                    reserved.remove(i)
+
+                finish = self.hooks[i][1]
+                if finish is not None:
+                    finish()
+
+                if e is not None:
+                    errors.append(e)
+                    continue
+
+                result, wall, cpu, new_records, new_ratios = x
+                records.extend(new_records)
+                ratios.update(new_ratios)
+                self.controller.update(sizes[i], wall, cpu)
+                if callback is not None:
+                    callback()
+
+                yield i, result
+
+            pool.close()
+            pool.join()
+        except BaseException:
+            # stop the workers, which kill any commands they are running
+            pool.terminate()
+            pool.join()
+            for i in reserved:
+                release(*self.tasks[i][4:])
+            raise
+
+        if len(errors) > 0:
+            raise errors[0]
@@ -16,7 +16,71 @@ else:
     temp_dirs_par = Manager().list()
     nc_protected_par = Manager().list()
 
-nc_safe = list()
+
+
+class SafeList:
+    """
+    The safe list, stored as reference counts
+
+    Files can be added one at a time, or as a group of files shared by datasets.
+    Each group counts once towards its files, however many datasets share it, so
+    sharing a group is O(1)
+    """
+
+    def __init__(self):
+        self.counts = dict()
+        self.groups = dict()
+
+    def append(self, ff):
+        self.counts[ff] = self.counts.get(ff, 0) + 1
+
+    def remove(self, ff):
+        n = self.counts.get(ff, 0)
+        if n == 0:
+            raise ValueError(f"{ff} is not in the safe list")
+        if n == 1:
+            del self.counts[ff]
+        else:
+            self.counts[ff] = n - 1
+
+    def append_group(self, files):
+        # the group is kept, so its id cannot be reused while it is in use
+        key = id(files)
+        if key in self.groups:
+            self.groups[key][1] += 1
+            return
+        self.groups[key] = [files, 1]
+        for ff in files:
+            self.append(ff)
+
+    def remove_group(self, files):
+        key = id(files)
+        if key not in self.groups:
+            return
+        self.groups[key][1] -= 1
+        if self.groups[key][1] == 0:
+            del self.groups[key]
+            for ff in files:
+                if ff in self.counts:
+                    self.remove(ff)
+
+    def count(self, ff):
+        return self.counts.get(ff, 0)
+
+    def __contains__(self, ff):
+        return ff in self.counts
+
+    def __iter__(self):
+        # iterate over a snapshot, so the list can be changed while looping
+        for ff, n in list(self.counts.items()):
+            for i in range(n):
+                yield ff
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+
+nc_safe = SafeList()
 
 
 def append_safe(ff):
@@ -41,6 +105,29 @@ def remove_safe(ff):
             nc_safe.remove(ff)
 
 
+def append_safe_group(files):
+    """
+    Function to add a tuple of files shared by datasets to the safe list
+    """
+    if session_info["parallel"]:
+        for ff in files:
+            nc_safe_par.append(ff)
+    else:
+        nc_safe.append_group(files)
+
+
+def remove_safe_group(files):
+    """
+    Function to remove a tuple of files shared by datasets from the safe list
+    """
+    if session_info["parallel"]:
+        for ff in files:
+            if ff in nc_safe_par:
+                nc_safe_par.remove(ff)
+    else:
+        nc_safe.remove_group(files)
+
+
 def get_safe():
     """
     Function to get the safe list
@@ -1,18 +1,16 @@
-import subprocess
 from dateutil.parser import parse
 
+# CDO is run using run_shell, so that the time spent is recorded. It is imported in
+# each function, as runners uses this module
+
 
 def nc_times(ff):
     """
     Function to return times available in a netCDF file
     """
+    from nctoolkit.runners import run_shell
 
-    cdo_result = subprocess.run(
-        f"cdo showtimestamp {ff}",
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
+    cdo_result = run_shell(f"cdo showtimestamp {ff}")
     cdo_result = [
         x
         for x in " ".join(
@@ -38,13 +36,9 @@ def nc_format(ff):
     """
     Function to return the format of a netCDF file
     """
+    from nctoolkit.runners import run_shell
 
-    cdo_result = subprocess.run(
-        f"cdo showformat {ff}",
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
+    cdo_result = run_shell(f"cdo showformat {ff}")
     return [
         x
         for x in cdo_result.stdout.decode("utf-8").split("\n")
@@ -56,13 +50,9 @@ def nc_levels(ff):
     """
     Function to get the depths available in a netCDF file
     """
+    from nctoolkit.runners import run_shell
 
-    cdo_result = subprocess.run(
-        f"cdo showlevel {ff}",
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
+    cdo_result = run_shell(f"cdo showlevel {ff}")
     return list(
         set(
             [
@@ -84,10 +74,9 @@ def nc_years(ff):
     """
     Function to get the years available in a netCDF file
     """
+    from nctoolkit.runners import run_shell
 
-    cdo_result = subprocess.run(
-        f"cdo showyear {ff}", shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    )
+    cdo_result = run_shell(f"cdo showyear {ff}")
     return list(
         set(
             [
@@ -109,10 +98,9 @@ def nc_variables(ff):
     """
     Function to get the variables available in a netCDF file
     """
+    from nctoolkit.runners import run_shell
 
-    cdo_result = subprocess.run(
-        f"cdo showname {ff}", shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    )
+    cdo_result = run_shell(f"cdo showname {ff}")
 
     new = " ".join(
         [
@@ -141,13 +129,9 @@ def nc_months(ff):
     """
     Function to get the months available in a netCDF file
     """
+    from nctoolkit.runners import run_shell
 
-    cdo_result = subprocess.run(
-        f"cdo showmon {ff}",
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
+    cdo_result = run_shell(f"cdo showmon {ff}")
 
     return list(
         set(
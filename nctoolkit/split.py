@@ -4,74 +4,83 @@ import os
 import platform
 
 from nctoolkit.cleanup import cleanup
+from nctoolkit.runners import execute
 from nctoolkit.temp_file import temp_file
 from nctoolkit.session import session_info, get_tempdirs, append_safe, remove_safe
 
 
-def split_cdo(self, method="year"):
+def split_file(ff, method="year"):
     """
-    Method to split files by period
+    Function to split a single file by period or variable
+
+    Returns the new files and the command used. The new files are on the safe list.
     """
-    # this cannot me chained. So release
-    self.run()
+    # We need to split the file, so use a temp tier with room for two copies of it
+    split_base = temp_file(size=2 * os.path.getsize(ff))
 
-    new_files = []
+    # add split base to the save list in case splitting fails. This means they can be cleared up later
 
-    commands = []
+    append_safe(split_base)
 
-    bases = []
+    cdo_command = f"cdo -s -split{method} {ff} {split_base}"
 
-    for ff in self:
-        # We need to split the file by name
-        # But, first we need to check if there is space in the output folder
-        # If there isn't, we need to switch to the /var/tmp
+    # this can be timed out or interrupted, like other commands
+    try:
+        execute(cdo_command)
+    except BaseException:
+        # remove any files written before CDO was stopped
+        for x in glob.glob(f"{split_base}*"):
+            os.remove(x)
+        remove_safe(split_base)
+        raise
 
-        if platform.system() == "Linux":
-            if session_info["temp_dir"] == "/tmp/":
-                result = os.statvfs("/tmp/")
-                result = result.f_frsize * result.f_bavail
-                session_info["size"] = result
+    # now, pull out the files generated
 
-                if os.path.getsize(ff) * 2 > session_info["size"]:
-                    session_info["temp_dir"] = "/var/tmp/"
+    new_files = []
+    for directory in get_tempdirs():
+        mylist = [f for f in glob.glob(f"{directory}/*.nc*")]
+        mylist = [f for f in mylist if session_info["stamp"] in f]
+        for ff in mylist:
+            if split_base in ff:
+                new_files.append(ff)
+                append_safe(ff)
 
-        split_base = temp_file()
-        bases.append(split_base)
+    # remove the base from the split list. This is for parallel processing
+    remove_safe(split_base)
 
-        # add split base to the save list in case splitting fails. This means they can be cleared up later
+    if len(new_files) == 0:
+        for x in glob.glob(f"{split_base}*"):
+            os.remove(x)
+        raise ValueError("Splitting the file did not work!")
 
-        append_safe(split_base)
+    new_files.sort()
 
-        cdo_command = f"cdo -s -split{method} {ff} {split_base}"
+    return new_files, cdo_command
 
-        os.system(cdo_command)
 
-        commands.append(cdo_command)
+def split_cdo(self, method="year"):
+    """
+    Method to split files by period
+    """
+    # this cannot me chained. So release
+    self.run()
 
-        # now, pull out the files generated
+    new_files = []
 
-        counter = 0
-        for directory in get_tempdirs():
-            mylist = [f for f in glob.glob(f"{directory}/*.nc*")]
-            mylist = [f for f in mylist if session_info["stamp"] in f]
-            for ff in mylist:
-                if split_base in ff:
-                    new_files.append(ff)
-                    counter += 1
+    commands = []
 
-        if counter == 0:
-            raise ValueError("Splitting the file did not work!")
+    for ff in self:
+        ff_files, cdo_command = split_file(ff, method)
+        new_files += ff_files
+        commands.append(cdo_command)
 
     self.history += commands
     self._hold_history = copy.deepcopy(self.history)
 
     self._merged = False
-    self.current = new_files
-    self.current.sort()
-
-    # remove the bases from the split list. This is for parallel processing
+    self.current = sorted(new_files)
 
-    for ff in bases:
+    for ff in new_files:
         remove_safe(ff)
 
     cleanup()
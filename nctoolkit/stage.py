@@ -0,0 +1,226 @@
+import fcntl
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from nctoolkit.runners import execute
+from nctoolkit.session import session_info, get_protected
+from nctoolkit.show import nc_format
+
+
+def stage_key(ff):
+    """
+    Function to identify a source file by its path, size, modification time and inode
+    """
+    info = os.stat(ff)
+    source = f"{os.path.abspath(ff)}|{info.st_size}|{info.st_mtime_ns}|{info.st_ino}"
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+
+def read_index(stage_dir):
+    """
+    Function to read the staging cache index
+    """
+    try:
+        with open(os.path.join(stage_dir, "index.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+
+def write_index(stage_dir, index):
+    """
+    Function to write the staging cache index
+    """
+    path = os.path.join(stage_dir, "index.json")
+    with open(path + ".part", "w") as f:
+        json.dump(index, f)
+    os.replace(path + ".part", path)
+
+
+@contextmanager
+def locked(stage_dir):
+    """
+    Context manager to lock the staging cache index, so that sessions do not change
+    it at once
+    """
+    with open(os.path.join(stage_dir, "index.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def alive(pid):
+    """
+    Function to check if a process is still running
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def held(entry):
+    """
+    Function to check if a staged copy is being used by a running session
+    """
+    return any(alive(x) for x in entry.get("holders", []))
+
+
+def evict(stage_dir, index, keep=()):
+    """
+    Function to remove the least recently used copies until the cache is within its
+    byte budget. Copies in keep, or being used by a running session, are not removed
+    """
+    staged = [
+        k for k, v in index.items() if "path" in v and k not in keep and not held(v)
+    ]
+    staged.sort(key=lambda k: index[k]["used"])
+    total = sum(v["size"] for v in index.values() if "path" in v)
+
+    while total > session_info["stage_size"] and len(staged) > 0:
+        key = staged.pop(0)
+        try:
+            os.remove(index[key]["path"])
+        except OSError:
+            pass
+        total -= index[key]["size"]
+        del index[key]
+
+
+def hold_copy(stage_dir, index, key, hold):
+    """
+    Function to mark a staged copy as used by this session until it is released
+    """
+    if hold is None:
+        return
+    index[key]["holders"] = index[key].get("holders", []) + [os.getpid()]
+    hold.add((stage_dir, key))
+
+
+def release(hold):
+    """
+    Function to let the staged copies used by a run be evicted again, once the run
+    has finished, and evict any that are over the cache's budget
+    """
+    stage_dirs = set(x[0] for x in hold)
+    for stage_dir in stage_dirs:
+        with locked(stage_dir):
+            index = read_index(stage_dir)
+            for x, key in hold:
+                if x != stage_dir or key not in index:
+                    continue
+                holders = index[key].get("holders", [])
+                if os.getpid() in holders:
+                    holders.remove(os.getpid())
+            # the cache can go over its budget while copies are held
+            evict(stage_dir, index)
+            write_index(stage_dir, index)
+    hold.clear()
+
+
+def staged_file(ff, hold=None):
+    """
+    Function to get an uncompressed copy of a compressed input file from the staging
+    cache, creating it if needed. Returns ff if it should not be staged
+
+    hold is an optional set. Copies added to it cannot be evicted by any session
+    until they are released, so that commands still to run can use them
+    """
+    stage_dir = session_info["stage_dir"]
+    if stage_dir is None:
+        return ff
+
+    if not isinstance(ff, str) or not os.path.isfile(ff):
+        return ff
+
+    if ff not in get_protected():
+        return ff
+
+    key = stage_key(ff)
+    source = os.path.abspath(ff)
+
+    # claim the file, so that sessions do not stage it at once. The index is not
+    # locked while it is copied
+    with locked(stage_dir):
+        index = read_index(stage_dir)
+
+        if key in index:
+            entry = index[key]
+            if "path" in entry and os.path.exists(entry["path"]):
+                entry["used"] = time.time()
+                hold_copy(stage_dir, index, key, hold)
+                write_index(stage_dir, index)
+                return entry["path"]
+            if "copying" in entry and alive(entry["copying"]):
+                return ff
+            if "path" not in entry and "copying" not in entry:
+                return ff
+
+        index[key] = {"source": source, "copying": os.getpid()}
+        write_index(stage_dir, index)
+
+    target = os.path.join(stage_dir, f"{key}.nc")
+    part = f"{target}.{os.getpid()}.part"
+
+    # only compressed files are worth staging
+    entry = {"source": source}
+    if "zip" in " ".join(nc_format(ff)).lower():
+        try:
+            out, result = execute(f"cdo -s -f nc5 copy {ff} {part}", part)
+            copied = out.returncode == 0
+        except ValueError:
+            copied = False
+        if not copied or not os.path.exists(part):
+            entry = None
+        # do not stage files that are too big for the cache
+        elif os.path.getsize(part) <= session_info["stage_size"]:
+            os.replace(part, target)
+            entry = {
+                "source": source,
+                "path": target,
+                "size": os.path.getsize(target),
+                "used": time.time(),
+            }
+        if os.path.exists(part):
+            os.remove(part)
+
+    with locked(stage_dir):
+        index = read_index(stage_dir)
+        if entry is None:
+            # let the file be staged again later
+            index.pop(key, None)
+            write_index(stage_dir, index)
+            return ff
+        index[key] = entry
+        if "path" not in entry:
+            write_index(stage_dir, index)
+            return ff
+        hold_copy(stage_dir, index, key, hold)
+        evict(stage_dir, index, keep=[key])
+        write_index(stage_dir, index)
+
+    return target
+
+
+def staged_copy(ff):
+    """
+    Function to find the copy of a file in the staging cache without creating it.
+    Returns None if there is no copy
+    """
+    stage_dir = session_info["stage_dir"]
+    if stage_dir is None or not isinstance(ff, str) or not os.path.isfile(ff):
+        return None
+
+    index = read_index(stage_dir)
+    entry = index.get(stage_key(ff), dict())
+    if "path" in entry and os.path.exists(entry["path"]):
+        return entry["path"]
+    return None
@@ -0,0 +1,826 @@
+import bisect
+import glob
+import math
+import os
+import platform
+import signal
+import threading
+
+if platform.system() == "Linux":
+    import multiprocessing as mp
+else:
+    import multiprocess as mp
+
+from nctoolkit.instrument import count
+from nctoolkit.session import session_info, append_safe, remove_safe
+from nctoolkit.temp_file import temp_file
+from nctoolkit.show import nc_variables
+
+
+# CDO options that take a value, e.g. "-b F32"
+value_options = ["-b", "-f", "-z", "-P", "--timestat_date"]
+
+# options that are needed when the pieces are stitched back together
+combine_options = ["-L", "-b", "-f", "-z"]
+
+temporal_prefixes = [
+    "tim",
+    "year",
+    "mon",
+    "day",
+    "hour",
+    "seas",
+    "run",
+    "ymon",
+    "yday",
+    "yhour",
+    "yseas",
+    "dhour",
+    "timsel",
+]
+
+temporal_stats = [
+    "mean",
+    "avg",
+    "sum",
+    "min",
+    "max",
+    "range",
+    "std",
+    "std1",
+    "var",
+    "var1",
+    "pctl",
+    "cumsum",
+]
+
+# operators that only ever need the values in a single grid cell
+space_local = set([x + y for x in temporal_prefixes for y in temporal_stats])
+
+space_local.update(
+    [
+        "vertmean",
+        "vertavg",
+        "vertsum",
+        "vertmin",
+        "vertmax",
+        "vertrange",
+        "vertstd",
+        "vertvar",
+        "vertcum",
+        "abs",
+        "sqr",
+        "sqrt",
+        "exp",
+        "ln",
+        "log10",
+        "pow",
+        "addc",
+        "subc",
+        "mulc",
+        "divc",
+        "expr",
+        "aexpr",
+        "eqc",
+        "nec",
+        "gtc",
+        "ltc",
+        "gec",
+        "lec",
+        "setname",
+        "setunit",
+        "chname",
+        "setattribute",
+        "setmissval",
+        "setmisstoc",
+        "setctomiss",
+        "setrtomiss",
+        "setvrange",
+        "setdate",
+        "setyear",
+        "setday",
+        "setmon",
+        "settime",
+        "setreftime",
+        "setcalendar",
+        "shifttime",
+        "del29feb",
+        "selname",
+        "delname",
+        "select",
+        "delete",
+        "sellevel",
+        "sellevidx",
+        "intlevel",
+        "invertlev",
+        "setzaxis",
+        "selyear",
+        "selmonth",
+        "selday",
+        "selhour",
+        "seldate",
+        "seltimestep",
+        "selseason",
+        "inttime",
+        "intntime",
+    ]
+)
+
+# expr functions that look beyond a single grid cell
+spatial_functions = ["fld", "zon", "mer", "remap", "gridarea", "gridweight"]
+
+# operators that only ever need the values in a single time step
+time_local = set(
+    [
+        x + y
+        for x in ["fld", "zon", "mer", "vert", "gridbox"]
+        for y in temporal_stats
+        if y != "cumsum"
+    ]
+)
+
+time_local.update(
+    [
+        x
+        for x in space_local
+        if x[0:3] in ["set", "sel", "chn", "int", "ver"] and x != "select"
+    ]
+)
+
+time_local.update(
+    [
+        "abs",
+        "sqr",
+        "sqrt",
+        "exp",
+        "ln",
+        "log10",
+        "pow",
+        "addc",
+        "subc",
+        "mulc",
+        "divc",
+        "expr",
+        "aexpr",
+        "eqc",
+        "nec",
+        "gtc",
+        "ltc",
+        "gec",
+        "lec",
+        "invertlev",
+        "shifttime",
+        "sellonlatbox",
+        "selindexbox",
+        "masklonlatbox",
+        "invertlat",
+        "remap",
+        "samplegrid",
+        "reducegrid",
+        "fillmiss",
+        "setmisstonn",
+        "setmisstodis",
+        "gridarea",
+    ]
+    + [f"remap{x}" for x in ["bil", "nn", "bic", "dis", "con", "con2", "laf"]]
+)
+
+# time selections can leave chunks without any time steps
+time_local.difference_update(
+    [
+        "selyear",
+        "selmonth",
+        "selday",
+        "selhour",
+        "seldate",
+        "selseason",
+        "seltimestep",
+        "inttime",
+        "intntime",
+        "del29feb",
+    ]
+)
+
+# operators that treat each variable independently
+variable_local = set([x for x in space_local | time_local])
+
+variable_local.update(
+    [
+        "runmean",
+        "runsum",
+        "runmin",
+        "runmax",
+        "runrange",
+        "runstd",
+        "runvar",
+        "inttime",
+        "intntime",
+        "del29feb",
+        "timcumsum",
+    ]
+)
+
+# these either refer to variables by name or create new ones
+variable_local.difference_update(
+    [
+        "expr",
+        "aexpr",
+        "selname",
+        "delname",
+        "setname",
+        "chname",
+        "setattribute",
+        "select",
+        "delete",
+    ]
+)
+
+# aggregations over calendar periods. Chunks must not split a period
+time_periods = ["hour", "day", "month", "season", "year"]
+
+period_prefixes = {
+    "hour": "hour",
+    "day": "day",
+    "mon": "month",
+    "seas": "season",
+    "year": "year",
+}
+
+# operators that change the times, so chunks found from the original times would
+# not line up with the periods aggregated over
+time_changing = [
+    "shifttime",
+    "setdate",
+    "setyear",
+    "setmon",
+    "setday",
+    "settime",
+    "settaxis",
+    "settunits",
+    "setreftime",
+    "setcalendar",
+]
+
+# expr functions that depend on the position in the time series
+temporal_functions = ["ctimestep", "cdate", "ctime", "cday", "cmonth", "cyear"]
+
+# messages from CDO, and the libraries it uses, when memory cannot be allocated
+memory_messages = [
+    "std::bad_alloc",
+    "Cannot allocate memory",
+    "Allocation of",
+    "Memory allocation",
+    "out of memory",
+    "Out of memory",
+]
+
+# number of pieces to split a command into when it runs out of memory
+memory_pieces = [4, 16, 64]
+
+# whether this thread is running the pieces of a command that ran out of memory
+out_of_core = threading.local()
+
+
+class OutOfMemory(ValueError):
+    """
+    Error raised when CDO runs out of memory, and the command cannot be split
+    """
+
+
+def tokenize(command):
+    """
+    Function to split a command on spaces, without splitting quoted text
+    """
+    tokens = []
+    current = ""
+    quote = None
+    for x in command:
+        if quote is not None:
+            if x == quote:
+                quote = None
+        elif x in ["'", '"']:
+            quote = x
+        elif x == " ":
+            if len(current) > 0:
+                tokens.append(current)
+            current = ""
+            continue
+        current += x
+
+    if quote is not None:
+        return None
+
+    if len(current) > 0:
+        tokens.append(current)
+
+    return tokens
+
+
+def split_command(command):
+    """
+    Function to split a CDO command into its options, operators and files
+    """
+    tokens = tokenize(command)
+    if tokens is None:
+        return None
+
+    if len(tokens) < 3 or tokens[0] != "cdo":
+        return None
+
+    options = []
+    operators = []
+    files = []
+
+    i = 1
+    while i < len(tokens):
+        tt = tokens[i]
+        if tt in value_options and len(operators) == 0 and i + 1 < len(tokens):
+            options.append(tt + " " + tokens[i + 1])
+            i += 2
+            continue
+        if len(operators) == 0:
+            # operator names are always longer than a single letter
+            if tt.startswith("--") or (tt.startswith("-") and len(tt) == 2):
+                options.append(tt)
+                i += 1
+                continue
+        if tt.startswith("-"):
+            operators.append(tt)
+        else:
+            files.append(tt)
+        i += 1
+
+    return options, operators, files
+
+
+def operator_names(operators):
+    """
+    Function to get the names of CDO operators, without arguments
+    """
+    return [x.lstrip("-").split(",")[0] for x in operators]
+
+
+def spatially_local(command):
+    """
+    Function to work out whether a CDO command can be run tile by tile
+    """
+    split = split_command(command)
+    if split is None:
+        return False
+
+    options, operators, files = split
+
+    # only a single input file is allowed
+    if len(files) != 2 or len(operators) == 0:
+        return False
+
+    for name, op in zip(operator_names(operators), operators):
+        if name not in space_local:
+            return False
+        if name in ["expr", "aexpr"]:
+            if len([x for x in spatial_functions if x in op]) > 0:
+                return False
+
+    return True
+
+
+def variables_local(command):
+    """
+    Function to work out whether a CDO command can be run variable by variable
+    """
+    split = split_command(command)
+    if split is None:
+        return False
+
+    options, operators, files = split
+
+    if len(files) != 2 or len(operators) == 0:
+        return False
+
+    return len([x for x in operator_names(operators) if x not in variable_local]) == 0
+
+
+def time_period(command):
+    """
+    Function to work out whether a CDO command can be run in time chunks
+
+    Returns False if it cannot, otherwise the coarsest calendar period
+    aggregated over, which is None for time step by time step operations.
+    """
+    split = split_command(command)
+    if split is None:
+        return False
+
+    options, operators, files = split
+
+    if len(files) != 2 or len(operators) == 0:
+        return False
+
+    periods = []
+    for name, op in zip(operator_names(operators), operators):
+        if name in time_local:
+            if name in ["expr", "aexpr"]:
+                if len([x for x in temporal_functions if x in op]) > 0:
+                    return False
+            continue
+
+        period = None
+        for prefix in period_prefixes:
+            if name in [prefix + x for x in temporal_stats if x != "cumsum"]:
+                period = period_prefixes[prefix]
+        if period is None:
+            return False
+        periods.append(period)
+
+    if len(periods) == 0:
+        return None
+
+    if len([x for x in operator_names(operators) if x in time_changing]) > 0:
+        return False
+
+    # seasons span the turn of the year, so cannot be combined with years
+    if "season" in periods and "year" in periods:
+        return False
+
+    return max(periods, key=lambda x: time_periods.index(x))
+
+
+def period_key(x, period):
+    """
+    Function to identify the calendar period a time is in
+    """
+    if period == "hour":
+        return (x.year, x.month, x.day, x.hour)
+    if period == "day":
+        return (x.year, x.month, x.day)
+    if period == "month":
+        return (x.year, x.month)
+    if period == "season":
+        return [12, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11].index(x.month) // 3
+    return x.year
+
+
+def time_chunks(command, ff, n):
+    """
+    Function to find the time step ranges of up to n chunks of a file
+
+    Chunk boundaries are aligned with the calendar period aggregated over.
+    """
+    from nctoolkit.show import nc_times
+
+    period = time_period(command)
+    if period is False:
+        return None
+
+    times = nc_times(ff)
+    if len(times) < 2:
+        return None
+
+    if period is not None:
+        if len([x for x in times if isinstance(x, str)]) > 0:
+            return None
+        if times != sorted(times):
+            return None
+        keys = [period_key(x, period) for x in times]
+    else:
+        keys = list(range(len(times)))
+
+    # time steps where a new period starts
+    starts = [i for i in range(len(keys)) if i == 0 or keys[i] != keys[i - 1]]
+
+    # cut at the period starts closest to evenly sized chunks
+    cuts = set()
+    for k in range(1, n):
+        j = bisect.bisect_left(starts, k * len(times) / n)
+        candidates = [x for x in starts[max(j - 1, 1) : j + 1] if x > 0]
+        if len(candidates) > 0:
+            cuts.add(min(candidates, key=lambda x: abs(x - k * len(times) / n)))
+
+    cuts = [0] + sorted(cuts) + [len(times)]
+
+    return [(cuts[i] + 1, cuts[i + 1]) for i in range(len(cuts) - 1)]
+
+
+def file_size(ff):
+    """
+    Function to get the size of a file, or 0 if it does not exist
+    """
+    try:
+        return os.path.getsize(ff)
+    except OSError:
+        return 0
+
+
+def splittable(ff, cores):
+    """
+    Function to work out whether splitting a file across cores is worthwhile
+    """
+    if cores < 2:
+        return False
+
+    # pools cannot be created inside the workers of another pool
+    if mp.current_process().daemon:
+        return False
+
+    return file_size(ff) >= session_info["split_size"]
+
+
+def choose_strategy(command, ff):
+    """
+    Function to choose how a single file command should be parallelized
+
+    Returns None if the command should be run as it is.
+    """
+    cores = session_info["cores"]
+
+    if "infile09178" in command:
+        return None
+
+    if splittable(ff, cores) is False:
+        return None
+
+    if time_period(command) is not False:
+        return "time"
+
+    if variables_local(command):
+        if len(nc_variables(ff)) > 1:
+            return "variables"
+
+    if session_info["tiling"] and spatially_local(command):
+        return "tiles"
+
+    return None
+
+
+def tile_shape(n):
+    """
+    Function to find the number of rows and columns for n tiles
+    """
+    rows = int(math.sqrt(n))
+    while n % rows != 0:
+        rows -= 1
+    return rows, n // rows
+
+
+def run_pieces(commands, targets, cores, precision):
+    """
+    Function to run the commands for each piece of a file in parallel
+    """
+    from nctoolkit.runners import run_cdo
+    from nctoolkit.scheduler import Scheduler
+
+    for target in targets:
+        append_safe(target)
+
+    # pools cannot be created inside the workers of another pool
+    if cores < 2 or mp.current_process().daemon:
+        return [
+            run_cdo(command, target, None, False, precision)
+            for command, target in zip(commands, targets)
+        ]
+
+    scheduler = Scheduler(cores)
+    for command, target in zip(commands, targets):
+        scheduler.submit(
+            run_cdo, [command, target, None, False, precision], threaded=True
+        )
+    outputs = scheduler.run()
+
+    return outputs
+
+
+def strip_zip(options):
+    """
+    Function to remove compression from the options used for pieces
+    """
+    return [x for x in options if not x.startswith("-z ")]
+
+
+def run_split(
+    command, inputs, combine, target, out_file=None, precision="default", cores=None
+):
+    """
+    Function to run a command on each piece of a file, and combine the pieces
+
+    Parameters
+    -------------
+    inputs : list
+        Inputs to use in place of the original file. These can include CDO
+        operators, e.g. "-seltimestep,1/10 infile".
+    combine : str
+        CDO operator used to stitch the pieces back together
+    cores : int
+        Number of pieces to run at once. Defaults to the session's cores
+    """
+    from nctoolkit.runners import run_cdo
+
+    if cores is None:
+        cores = session_info["cores"]
+    options, operators, files = split_command(command)
+
+    pieces = []
+    try:
+        commands = []
+        for x in inputs:
+            piece = temp_file("nc")
+            pieces.append(piece)
+            commands.append(
+                " ".join(["cdo"] + strip_zip(options) + operators + [x, piece])
+            )
+
+        pieces = run_pieces(commands, pieces, cores, precision)
+        pieces = [x for x in pieces if x is not None]
+
+        use_options = [x for x in options if x.split(" ")[0] in combine_options]
+        combine_command = " ".join(
+            ["cdo"] + use_options + [combine] + pieces + [target]
+        )
+        target = run_cdo(combine_command, target, out_file, precision=precision)
+    finally:
+        # the pieces will be removed by the next cleanup
+        for ff in pieces:
+            remove_safe(ff)
+
+    return target
+
+
+def run_tiles(
+    command, ff, target, out_file=None, precision="default", pieces=None, cores=None
+):
+    """
+    Function to run a command on a single file tile by tile, and collect the tiles
+    """
+    from nctoolkit.runners import run_cdo
+
+    if pieces is None:
+        pieces = session_info["cores"]
+    rows, columns = tile_shape(pieces)
+
+    split_base = temp_file()
+    append_safe(split_base)
+    tiles = []
+    try:
+        run_cdo(
+            f"cdo -s -distgrid,{columns},{rows} {ff} {split_base}",
+            split_base,
+            split_base,
+            precision=precision,
+        )
+        tiles = sorted([x for x in glob.glob(split_base + "*") if x != split_base])
+        for tile in tiles:
+            append_safe(tile)
+
+        if len(tiles) == 0:
+            raise ValueError("Splitting the file into tiles did not work!")
+
+        target = run_split(
+            command, tiles, "-collgrid", target, out_file, precision, cores
+        )
+    finally:
+        for ff_remove in [split_base] + tiles:
+            remove_safe(ff_remove)
+
+    return target
+
+
+def run_time_chunks(
+    command, ff, target, out_file=None, precision="default", pieces=None, cores=None
+):
+    """
+    Function to run a command on a single file in time chunks, and merge the chunks
+    """
+    from nctoolkit.runners import run_cdo
+
+    if pieces is None:
+        pieces = session_info["cores"]
+    chunks = time_chunks(command, ff, pieces)
+
+    if chunks is None or len(chunks) < 2:
+        return run_cdo(command, target, out_file, precision=precision)
+
+    inputs = [f"-seltimestep,{x[0]}/{x[1]} {ff}" for x in chunks]
+
+    return run_split(
+        command, inputs, "-mergetime", target, out_file, precision, cores
+    )
+
+
+def run_variables(
+    command, ff, target, out_file=None, precision="default", pieces=None, cores=None
+):
+    """
+    Function to run a command on a single file variable by variable, and merge them
+    """
+    from nctoolkit.split import split_file
+
+    files = []
+    try:
+        files, cdo_command = split_file(ff, "name")
+        target = run_split(command, files, "-merge", target, out_file, precision, cores)
+    finally:
+        for ff_remove in files:
+            remove_safe(ff_remove)
+
+    return target
+
+
+def run_strategy(
+    strategy,
+    command,
+    ff,
+    target,
+    out_file=None,
+    precision="default",
+    pieces=None,
+    cores=None,
+):
+    """
+    Function to run a command on a single file using a parallel strategy
+
+    pieces is the number of time chunks or tiles, and cores the number of pieces
+    run at once. Both default to the session's cores
+    """
+    if strategy == "time":
+        return run_time_chunks(command, ff, target, out_file, precision, pieces, cores)
+
+    if strategy == "variables":
+        return run_variables(command, ff, target, out_file, precision, pieces, cores)
+
+    if strategy == "tiles":
+        return run_tiles(command, ff, target, out_file, precision, pieces, cores)
+
+    raise ValueError(f"{strategy} is not a valid strategy")
+
+
+def out_of_memory(result, returncode):
+    """
+    Function to work out whether a command failed because it ran out of memory
+    """
+    text = result.decode("utf-8", errors="ignore")
+    if len([x for x in memory_messages if x in text]) > 0:
+        return True
+
+    # the kernel kills processes when the system runs out of memory
+    return returncode == -signal.SIGKILL
+
+
+def memory_strategy(command, ff):
+    """
+    Function to choose how to split a command that ran out of memory. Unlike
+    choose_strategy, this does not depend on the file size or the cores
+    """
+    if time_period(command) is not False:
+        return "time"
+
+    if variables_local(command):
+        if len(nc_variables(ff)) > 1:
+            return "variables"
+
+    if spatially_local(command):
+        return "tiles"
+
+    return None
+
+
+def run_out_of_core(command, target, out_file=None, precision="default"):
+    """
+    Function to run a command that ran out of memory in smaller pieces, one at a
+    time. More pieces are used if the pieces also run out of memory
+
+    Returns None if the command cannot be split
+    """
+    # the pieces are not split again
+    if getattr(out_of_core, "active", False):
+        return None
+
+    split = split_command(command)
+    if split is None:
+        return None
+
+    options, operators, files = split
+    if len(files) != 2 or os.path.exists(files[0]) is False:
+        return None
+
+    ff = files[0]
+    strategy = memory_strategy(command, ff)
+    if strategy is None:
+        return None
+
+    count("memory_fallbacks")
+
+    # splitting by variable always gives the same pieces
+    attempts = memory_pieces if strategy != "variables" else memory_pieces[0:1]
+
+    out_of_core.active = True
+    try:
+        for pieces in attempts:
+            try:
+                return run_strategy(
+                    strategy, command, ff, target, out_file, precision, pieces, 1
+                )
+            except OutOfMemory:
+                continue
+    finally:
+        out_of_core.active = False
+
+    return None
@@ -4,9 +4,10 @@ import platform
 
 from nctoolkit.session import session_info
 from nctoolkit.session import append_tempdirs
+from nctoolkit.tempstore import choose_dir
 
 
-def temp_file(ext=""):
+def temp_file(ext="", size=0):
     """
     Function to create a temporary file.
     This accounts for OS
@@ -15,22 +16,15 @@ def temp_file(ext=""):
     --------------------
     ext : str
         File extension
+    size : int
+        Expected size of the file in bytes. This is used to choose a temp tier with
+        enough room
     """
 
     # this needs to work differently on Linux
     if platform.system() == "Linux":
-        # check space left in temp dir and switch it if there isn't much
-        if session_info["temp_dir"] == "/tmp/":
-            result = os.statvfs("/tmp/")
-            result = result.f_frsize * result.f_bavail
-
-            if result < 0.5 * 1e9:
-                if session_info["temp_dir"] == "/tmp/":
-                    session_info["temp_dir"] = "/var/tmp/"
-
-        actual_temp = session_info["temp_dir"]
-        actual_temp = actual_temp + "/"
-        actual_temp = actual_temp.replace("//", "/")
+        # use the fastest temp tier with enough space left
+        actual_temp = choose_dir(size)
 
         target = tempfile.NamedTemporaryFile().name
         target = target.replace("tmp/", "tmp/" + session_info["stamp"])
@@ -0,0 +1,274 @@
+import glob
+import os
+import platform
+import tempfile
+
+from nctoolkit.session import session_info
+
+
+# bytes reserved in each tier by tasks that are running
+reservations = dict()
+
+# observed ratios of output to input size for each chain of operators
+ratios = dict()
+
+# space to leave free in each tier, in bytes, or as a fraction of the tier's quota
+# if that is smaller
+margin = 0.5e9
+margin_fraction = 0.1
+
+
+def tiers():
+    """
+    Function to get the temp tiers, fastest first, as (path, quota) tuples
+
+    Quotas are in bytes, or None if the only limit is the free space
+    """
+    if session_info["temp_tiers"] is not None:
+        return session_info["temp_tiers"]
+
+    if session_info["user_dir"]:
+        return [(session_info["temp_dir"], None)]
+
+    if platform.system() == "Linux":
+        return [("/tmp/", None), ("/var/tmp/", None)]
+
+    return [(tempfile.gettempdir() + "/", None)]
+
+
+def shm_tier():
+    """
+    Function to get the RAM-backed tier, or None if it is not in use
+    """
+    if session_info["shm_size"] > 0 and os.path.isdir("/dev/shm"):
+        return ("/dev/shm/", None)
+    return None
+
+
+def shm_pressure(extra=0):
+    """
+    Function to check if the RAM-backed tier would be under pressure, i.e. have less
+    than a quarter of its space free, after writing extra bytes to it
+    """
+    try:
+        result = os.statvfs("/dev/shm")
+    except (OSError, AttributeError):
+        return True
+    total = result.f_frsize * result.f_blocks
+    return available(("/dev/shm/", None)) - extra < 0.25 * total
+
+
+def shm_fits(size):
+    """
+    Function to check if a file of a given size should go in the RAM-backed tier
+    """
+    if shm_tier() is None:
+        return False
+    if size <= 0 or size > session_info["shm_size"]:
+        return False
+    return shm_pressure(size) is False
+
+
+def tidy_dir(path):
+    """
+    Function to make sure a directory path ends in a single /
+    """
+    return (os.path.abspath(path) + "/").replace("//", "/")
+
+
+def free_space(path):
+    """
+    Function to get the free space in bytes in a directory
+    """
+    try:
+        result = os.statvfs(path)
+    except (OSError, AttributeError):
+        return float("inf")
+    return result.f_frsize * result.f_bavail
+
+
+def used_space(path):
+    """
+    Function to get the space used by session files in a directory
+    """
+    size = 0
+    for ff in glob.glob(f"{path}*{session_info['stamp']}*"):
+        try:
+            size += os.path.getsize(ff)
+        except OSError:
+            pass
+    return size
+
+
+def available(tier, usage=None):
+    """
+    Function to work out how many bytes can still be written to a tier
+
+    usage is an optional dictionary of the space used by session files in each
+    tier, to avoid finding it again for every file when many are checked at once
+    """
+    path, quota = tier
+    room = free_space(path)
+    if quota is not None:
+        if usage is not None and path in usage:
+            used = usage[path]
+        else:
+            used = used_space(path)
+        room = min(room, quota - used)
+    return room - reservations.get(path, 0)
+
+
+def headroom(tier):
+    """
+    Function to get the space to leave free in a tier
+    """
+    if tier[1] is None:
+        return margin
+    return min(margin, margin_fraction * tier[1])
+
+
+def has_room(tier, size, usage=None):
+    """
+    Function to check if a file of a given size can be written to a tier, leaving
+    its headroom free
+    """
+    return available(tier, usage) - size > headroom(tier)
+
+
+def tier_of(ff):
+    """
+    Function to find the tier a file is in. Returns None if it is not in a tier
+    """
+    if not isinstance(ff, str):
+        return None
+    directory = tidy_dir(os.path.dirname(ff))
+    for tier in tiers() + [shm_tier()]:
+        if tier is None:
+            continue
+        if tidy_dir(tier[0]) == directory:
+            return tier
+    return None
+
+
+def choose_dir(size=0, shm=True, usage=None):
+    """
+    Function to choose the fastest tier with room for a file of a given size
+
+    Small files go in the RAM-backed tier, if it is in use and shm is True.
+    If no tier has room, the tier with the most room is used
+    """
+    if shm and shm_fits(size):
+        return shm_tier()[0]
+
+    all_tiers = tiers()
+    for tier in all_tiers:
+        if has_room(tier, size, usage):
+            return tidy_dir(tier[0])
+
+    return tidy_dir(max(all_tiers, key=lambda x: available(x, usage))[0])
+
+
+def relocate(target, size=0):
+    """
+    Function to move a temp file target to another tier if its own tier does not
+    have room for it, or to the RAM-backed tier if it is small enough
+    """
+    tier = tier_of(target)
+    if tier is None or session_info["stamp"] not in target:
+        return target
+
+    if shm_fits(size):
+        return shm_tier()[0] + os.path.basename(target)
+
+    if tier != shm_tier() and has_room(tier, size):
+        return target
+
+    return choose_dir(size, shm=False) + os.path.basename(target)
+
+
+def fallback(target):
+    """
+    Function to get the equivalent of a temp file target in the next tier. Returns
+    None if there is no next tier
+    """
+    tier = tier_of(target)
+    if tier is None or session_info["stamp"] not in target:
+        return None
+
+    all_tiers = tiers()
+    # files that do not fit in RAM spill to disk
+    if tier == shm_tier():
+        return tidy_dir(all_tiers[0][0]) + os.path.basename(target)
+
+    i = all_tiers.index(tier)
+    if i == len(all_tiers) - 1:
+        return None
+
+    return tidy_dir(all_tiers[i + 1][0]) + os.path.basename(target)
+
+
+def operator_key(command):
+    """
+    Function to get the chain of operators in a command
+    """
+    return tuple(
+        x.split(",")[0]
+        for x in command.split()
+        if x.startswith("-") and not x.startswith("--") and len(x) > 2
+    )
+
+
+def input_size(command, target=None):
+    """
+    Function to get the total size of the input files in a command
+    """
+    return sum(
+        os.path.getsize(x)
+        for x in set(command.split())
+        if x != target and os.path.isfile(x)
+    )
+
+
+def estimate_size(command, target=None):
+    """
+    Function to estimate the size of the file a command will write
+
+    This uses the ratio of output to input size seen the last time the same chain
+    of operators was run, or the total input size if it has not been run
+    """
+    return input_size(command, target) * ratios.get(operator_key(command), 1)
+
+
+def observe(command, target):
+    """
+    Function to record the ratio of output to input size of a command that has run
+    """
+    size = input_size(command, target)
+    if size > 0 and os.path.isfile(target):
+        ratios[operator_key(command)] = os.path.getsize(target) / size
+
+
+def reserve(size, target, force=False):
+    """
+    Function to reserve space in the tier a task will write to
+
+    Returns False if there is not enough room, unless force is True
+    """
+    tier = tier_of(target)
+    if tier is None:
+        return True
+
+    if force is False and available(tier) < size:
+        return False
+
+    reservations[tier[0]] = reservations.get(tier[0], 0) + size
+    return True
+
+
+def release(size, target):
+    """
+    Function to release space reserved for a task
+    """
+    tier = tier_of(target)
+    if tier is not None:
+        reservations[tier[0]] = max(0, reservations.get(tier[0], 0) - size)
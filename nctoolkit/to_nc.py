@@ -3,7 +3,51 @@ import copy
 
 from nctoolkit.cleanup import cleanup
 from nctoolkit.runthis import run_this, run_cdo
-from nctoolkit.session import remove_safe
+from nctoolkit.runners import classic
+from nctoolkit.session import remove_safe, session_info
+
+
+def check_output(self, out, overwrite):
+    """
+    Function to check a dataset can be saved to a file
+
+    Returns the file name, with any ~ expanded
+    """
+    # out may have ~ in it, which may need fixing
+
+    out = os.path.expanduser(out)
+
+    if len(self) == 0:
+        raise ValueError("You cannot save an empty dataset!")
+
+    if os.path.basename(out) != out:
+        out_dir = os.path.dirname(out)
+        if os.path.exists(out_dir) is False:
+            raise ValueError(f"{out_dir} does not exist!")
+
+    # Figure out if it is possible to write the file, i.e. if a dataset is still an
+    # ensemble, you cannot write.
+    write = False
+
+    if len(self) == 1:
+        write = True
+
+    if self._merged:
+        write = True
+
+    if write is False:
+        raise ValueError("You cannot save multiple files! Please use a method such as merge to create one file.")
+
+    if (os.path.exists(out)) and (overwrite is True):
+        if len(self) > 1:
+            self.run()
+
+    # Check if outfile exists and overwrite is set to False
+    # This should maybe be a warning, not an error
+    if (os.path.exists(out)) and (overwrite is False):
+        raise ValueError("The out file exists and overwrite is set to false")
+
+    return out
 
 
 def to_nc(self, out, zip=True, overwrite=False, **kwargs):
@@ -45,40 +89,12 @@ def to_nc(self, out, zip=True, overwrite=False, **kwargs):
 
     """
 
-    # out may have ~ in it, which may need fixing
-
-    out = os.path.expanduser(out)
-
-    if len(self) == 0:
-        raise ValueError("You cannot save an empty dataset!")
-
-    if os.path.basename(out) != out:
-        out_dir = os.path.dirname(out)
-        if os.path.exists(out_dir) is False:
-            raise ValueError(f"{out_dir} does not exist!")
-
-    # Figure out if it is possible to write the file, i.e. if a dataset is still an
-    # ensemble, you cannot write.
-    ff = copy.deepcopy(self.current)
-    write = False
+    out = check_output(self, out, overwrite)
 
-    if len(self) == 1:
-        write = True
-
-    if self._merged:
-        write = True
-
-    if write is False:
-        raise ValueError("You cannot save multiple files! Please use a method such as merge to create one file.")
-
-    if (os.path.exists(out)) and (overwrite is True):
-        if len(self) > 1:
-            self.run()
-
-    # Check if outfile exists and overwrite is set to False
-    # This should maybe be a warning, not an error
-    if (os.path.exists(out)) and (overwrite is False):
-        raise ValueError("The out file exists and overwrite is set to false")
+    # intermediate files may be in a format that cannot be compressed
+    zip_format = ""
+    if session_info["temp_format"] in classic:
+        zip_format = "-f nc4 "
 
     if len(kwargs) > 0:
         self1 = self.copy()
@@ -89,7 +105,7 @@ def to_nc(self, out, zip=True, overwrite=False, **kwargs):
         ff = copy.deepcopy(self1.current)
 
         if zip:
-            cdo_command = f"cdo -z zip_9 copy {ff[0]} {out}"
+            cdo_command = f"cdo {zip_format}-z zip_9 copy {ff[0]} {out}"
             run_cdo(
                 cdo_command,
                 target=out,
@@ -123,7 +139,7 @@ def to_nc(self, out, zip=True, overwrite=False, **kwargs):
 
         if len(self.history) == len(self._hold_history):
             if zip:
-                cdo_command = f"cdo -z zip_9 copy {ff[0]} {out}"
+                cdo_command = f"cdo {zip_format}-z zip_9 copy {ff[0]} {out}"
                 run_cdo(
                     cdo_command,
                     target=out,
@@ -151,7 +167,7 @@ def to_nc(self, out, zip=True, overwrite=False, **kwargs):
 
         else:
             if zip:
-                cdo_command = "cdo -z zip_9 "
+                cdo_command = f"cdo {zip_format}-z zip_9 "
             else:
                 cdo_command = "cdo "
 
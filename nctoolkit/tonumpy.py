@@ -0,0 +1,400 @@
+import os
+import struct
+
+import numpy as np
+from netCDF4 import Dataset
+
+
+# names of vertical dimensions commonly found in files without axis attributes
+level_names = ["lev", "level", "levels", "depth", "deptht", "height", "z", "plev"]
+
+
+def is_time(nc_file, dim):
+    """
+    Function to work out whether a dimension in an open netCDF file is time
+    """
+    if dim in nc_file.variables:
+        attributes = nc_file.variables[dim].ncattrs()
+        if "axis" in attributes and nc_file.variables[dim].axis == "T":
+            return True
+        if "standard_name" in attributes:
+            if nc_file.variables[dim].standard_name == "time":
+                return True
+    if dim == "time":
+        return True
+    return nc_file.dimensions[dim].isunlimited()
+
+
+def is_level(nc_file, dim):
+    """
+    Function to work out whether a dimension in an open netCDF file is vertical
+    """
+    if dim in nc_file.variables:
+        attributes = nc_file.variables[dim].ncattrs()
+        if "axis" in attributes and nc_file.variables[dim].axis == "Z":
+            return True
+        if "positive" in attributes:
+            return True
+    return dim.lower() in level_names
+
+
+# data types in netCDF3 files, which are always big endian
+classic_types = {
+    1: ">i1",
+    2: "S1",
+    3: ">i2",
+    4: ">i4",
+    5: ">f4",
+    6: ">f8",
+    7: ">u1",
+    8: ">u2",
+    9: ">u4",
+    10: ">i8",
+    11: ">u8",
+}
+
+
+class Header:
+    """
+    Reader for the header of a netCDF3 file. version is 1 for classic files, 2 for
+    64 bit offset files and 5 for 64 bit data files
+    """
+
+    def __init__(self, f, version):
+        self.f = f
+        self.version = version
+
+    def read(self, n):
+        x = self.f.read(n)
+        if len(x) < n:
+            raise ValueError("The header is incomplete")
+        return x
+
+    def int(self):
+        return struct.unpack(">i", self.read(4))[0]
+
+    def count(self):
+        if self.version == 5:
+            return struct.unpack(">q", self.read(8))[0]
+        return struct.unpack(">i", self.read(4))[0]
+
+    def offset(self):
+        if self.version == 1:
+            return struct.unpack(">i", self.read(4))[0]
+        return struct.unpack(">q", self.read(8))[0]
+
+    def name(self):
+        n = self.count()
+        name = self.read(n).decode("utf-8")
+        self.read(-n % 4)
+        return name
+
+    def atts(self):
+        self.int()
+        for i in range(self.count()):
+            self.name()
+            nc_type = self.int()
+            n = self.count() * np.dtype(classic_types[nc_type]).itemsize
+            self.read(n + (-n % 4))
+
+
+def classic_layout(ff):
+    """
+    Function to find where each variable's data is in a netCDF3 file, from the
+    file's header
+
+    Returns a dictionary giving the offset, shape, data type and whether it is a
+    record variable for each variable, along with the offset of the first record
+    and the size of each record. Returns None for other formats
+    """
+    with open(ff, "rb") as f:
+        magic = f.read(4)
+        if len(magic) < 4 or magic[:3] != b"CDF" or magic[3] not in [1, 2, 5]:
+            return None
+
+        header = Header(f, magic[3])
+
+        n_records = header.count()
+        # records are being written, so the number is not known
+        if n_records < 0:
+            return None
+
+        header.int()
+        dims = []
+        for i in range(header.count()):
+            header.name()
+            dims.append(header.count())
+
+        header.atts()
+
+        header.int()
+        layout = dict()
+        for i in range(header.count()):
+            name = header.name()
+            if header.version == 5:
+                ids = [header.count() for x in range(header.count())]
+            else:
+                ids = [header.int() for x in range(header.count())]
+            header.atts()
+            nc_type = header.int()
+            vsize = header.count()
+            begin = header.offset()
+            shape = [dims[x] for x in ids]
+            record = len(shape) > 0 and shape[0] == 0
+            if record:
+                shape[0] = n_records
+            layout[name] = (begin, tuple(shape), classic_types[nc_type], record, vsize)
+
+    records = [x for x in layout.values() if x[3]]
+    record_start = None
+    record_size = 0
+    if len(records) > 0:
+        record_start = min([x[0] for x in records])
+        if len(records) == 1:
+            # a single record variable is not padded
+            x = records[0]
+            record_size = int(np.prod(x[1][1:])) * np.dtype(x[2]).itemsize
+        else:
+            record_size = sum([x[4] for x in records])
+
+    return {"variables": layout, "start": record_start, "size": record_size}
+
+
+def classic_view(ff, variable):
+    """
+    Function to memory map a variable in an uncompressed netCDF3 file, so that it
+    can be read without copying
+
+    Returns a numpy.memmap, or None if the file or variable cannot be mapped
+    """
+    try:
+        layout = classic_layout(ff)
+    except (OSError, ValueError, KeyError, UnicodeDecodeError, struct.error):
+        return None
+
+    if layout is None or variable not in layout["variables"]:
+        return None
+
+    begin, shape, dtype, record, vsize = layout["variables"][variable]
+    dtype = np.dtype(dtype)
+
+    if len(shape) == 0 or int(np.prod(shape)) == 0 or dtype.kind == "S":
+        return None
+
+    try:
+        if not record:
+            return np.memmap(ff, dtype=dtype, mode="r", offset=begin, shape=shape)
+
+        # the values for each time step are stored in records, one after another,
+        # which also hold the other record variables
+        if layout["start"] + shape[0] * layout["size"] > os.path.getsize(ff):
+            return None
+        data = np.memmap(
+            ff,
+            dtype="u1",
+            mode="r",
+            offset=layout["start"],
+            shape=(shape[0], layout["size"]),
+        )
+        start = begin - layout["start"]
+        size = int(np.prod(shape[1:])) * dtype.itemsize
+        return data[:, start : start + size].view(dtype).reshape(shape)
+    except (OSError, ValueError):
+        return None
+
+
+def is_packed(var):
+    """
+    Function to work out whether a netCDF variable is packed
+    """
+    attributes = var.ncattrs()
+    return "scale_factor" in attributes or "add_offset" in attributes
+
+
+def read_values(var, index):
+    """
+    Function to read part of a netCDF variable as a NumPy array
+
+    Values are as stored in the file, so missing values are not masked. Packed
+    variables are unpacked, with missing values as NaN
+    """
+    if is_packed(var):
+        var.set_auto_maskandscale(True)
+        return np.ma.filled(np.ma.asarray(var[index]).astype("float64"), np.nan)
+    var.set_auto_maskandscale(False)
+    return np.asarray(var[index])
+
+
+def read_chunks(ds, variable, time_chunk, level):
+    """
+    Function to read chunks of a variable from each file in a dataset
+    """
+    for ff in ds:
+        with Dataset(ff) as nc_file:
+            if variable not in nc_file.variables:
+                raise ValueError(f"{variable} is not in {ff}")
+
+            var = nc_file.variables[variable]
+            dims = list(var.dimensions)
+
+            index = [slice(None) for x in dims]
+
+            if level is not None:
+                levels = [i for i, x in enumerate(dims) if is_level(nc_file, x)]
+                if len(levels) == 0:
+                    raise ValueError(f"{variable} does not have vertical levels")
+                if level >= var.shape[levels[0]]:
+                    raise ValueError(
+                        f"level {level} is out of range. {variable} has "
+                        f"{var.shape[levels[0]]} levels"
+                    )
+                index[levels[0]] = level
+
+            times = [i for i, x in enumerate(dims) if is_time(nc_file, x)]
+
+            # uncompressed netCDF3 files can be read without copying
+            view = None
+            if not is_packed(var):
+                view = classic_view(ff, variable)
+
+            def read(index):
+                if view is not None:
+                    return np.asarray(view[index])
+                return read_values(var, index)
+
+            if len(times) == 0:
+                yield read(tuple(index))
+                continue
+
+            n_times = var.shape[times[0]]
+            for start in range(0, n_times, time_chunk):
+                index[times[0]] = slice(start, min(start + time_chunk, n_times))
+                yield read(tuple(index))
+
+
+def iter_chunks(self, variable=None, time_chunk=1, level=None):
+    """
+    Iterate over the values of a variable, as NumPy arrays, a few time steps at a
+    time
+
+    The values are read straight from the files, without loading the whole
+    dataset into memory. Uncompressed netCDF3 files are memory mapped, so the values
+    are not copied. This is useful for feeding model fields into e.g. machine
+    learning training loops. Each file in the dataset is read in turn, and chunks
+    do not span files. Values are as stored in the files, so missing values are
+    not masked and are equal to the variable's _FillValue or missing_value. Packed
+    variables are unpacked, with missing values as NaN.
+
+    Parameters
+    -------------
+    variable : str
+        Variable to read
+    time_chunk : int
+        Number of time steps in each chunk. Default is 1. Variables without a time
+        dimension are given back in one chunk.
+    level : int
+        Index of the vertical level to read, starting from 0. The vertical
+        dimension is dropped from the chunks. Default is None, i.e. all levels.
+
+    Returns
+    ---------------
+    iter_chunks : generator of numpy.ndarray
+
+    Examples
+    ------------
+    If you want to read the variable sst one time step at a time, do the following:
+
+    >>> for x in ds.iter_chunks("sst"):
+    >>>     model.train(x)
+
+    If you want to read 12 time steps at a time, for the top level only, do this:
+
+    >>> for x in ds.iter_chunks("temperature", time_chunk = 12, level = 0):
+    >>>     model.train(x)
+
+    """
+
+    if not isinstance(variable, str):
+        raise TypeError("Please provide a variable")
+
+    if isinstance(time_chunk, bool) or not isinstance(time_chunk, int):
+        raise TypeError("time_chunk must be an int")
+
+    if time_chunk < 1:
+        raise ValueError("time_chunk must be positive")
+
+    if level is not None:
+        if isinstance(level, bool) or not isinstance(level, int):
+            raise TypeError("level must be an int")
+        if level < 0:
+            raise ValueError("level must not be negative")
+
+    if len(self) == 0:
+        raise ValueError("You cannot read from an empty dataset!")
+
+    # the copy keeps the files until iteration finishes
+    self.run()
+    ds = self.copy()
+
+    return read_chunks(ds, variable, time_chunk, level)
+
+
+def to_numpy(self, variable=None):
+    """
+    Get the values of a variable as a NumPy array
+
+    For uncompressed netCDF3 files, e.g. temporary files written using the nc1, nc2
+    or nc5 temp_format options, this is a numpy.memmap of the values on disk, so
+    nothing is read or copied until it is used. Values are as stored in the file,
+    with the file's byte order, so missing values are not masked and are equal to
+    the variable's _FillValue or missing_value. Other files, and packed variables,
+    are read using netCDF4. Packed variables are unpacked, with missing values as
+    NaN.
+
+    This will only work with single file datasets.
+
+    Parameters
+    -------------
+    variable : str
+        Variable to read
+
+    Returns
+    ---------------
+    to_numpy :  numpy.memmap or numpy.ndarray
+
+    Examples
+    ------------
+    If you want the values of sst as a NumPy array, do the following:
+
+    >>> x = ds.to_numpy("sst")
+
+    """
+
+    if not isinstance(variable, str):
+        raise TypeError("Please provide a variable")
+
+    if len(self) == 0:
+        raise ValueError("You cannot read from an empty dataset!")
+
+    self.run()
+
+    if len(self) > 1:
+        raise ValueError(
+            "You cannot read from multiple files! Please use a method such as merge "
+            "to create one file."
+        )
+
+    ff = self[0]
+
+    with Dataset(ff) as nc_file:
+        if variable not in nc_file.variables:
+            raise ValueError(f"{variable} is not in {ff}")
+
+        var = nc_file.variables[variable]
+
+        if not is_packed(var):
+            view = classic_view(ff, variable)
+            if view is not None:
+                return view
+
+        return read_values(var, tuple(slice(None) for x in var.dimensions))
@@ -156,7 +156,7 @@ def to_zlevels(self, levels=None, thickness=None, depths=None, surface=None):
 
     command = f"cdo intlevel3d,{target[0]} {ds[0]}  {ds_depths[0]} {out}"
 
-    run_cdo(command, target=out, precision=self._precision)
+    out = run_cdo(command, target=out, precision=self._precision)
 
     test = open_data(out)
     test.cdo_command(f"-setzaxis,{zaxis}")
@@ -1,6 +1,8 @@
 import re
 import subprocess
 
+from nctoolkit.runners import run_shell
+
 
 def name_check(x):
     """
@@ -35,9 +37,7 @@ def is_curvilinear(ff):
     """
     Function to work out if a file contains a curvilinear grid
     """
-    cdo_result = subprocess.run(
-        f"cdo sinfo {ff}", shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    )
+    cdo_result = run_shell(f"cdo sinfo {ff}")
 
     return (
         len(
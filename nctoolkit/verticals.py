@@ -1,9 +1,9 @@
-import subprocess
 import warnings
 import copy
 from nctoolkit.cleanup import cleanup
 from nctoolkit.api import open_data
 from nctoolkit.flatten import str_flatten
+from nctoolkit.runners import execute, run_shell
 import nctoolkit.api as api
 
 
@@ -42,9 +42,7 @@ def bottom(self):
     else:
         ff = self.current[0]
 
-    cdo_result = subprocess.run(
-        "cdo nlevel " + ff, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    ).stdout
+    cdo_result = run_shell("cdo nlevel " + ff).stdout
     n_levels = int(
         str(cdo_result).replace("b'", "").strip().replace("'", "").split("\\n")[0]
     )
@@ -409,14 +407,7 @@ def vertical_integration(self, thickness=None, depth_range=None, fixed=None):
 
         ff = self[0]
         command = f"cdo zaxisdes {ff}"
-        out = subprocess.Popen(
-            command,
-            shell=True,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-        )
-        result, ignore = out.communicate()
+        out, result = execute(command)
 
         if "bounds" not in result.decode("utf-8").lower():
             raise ValueError(
@@ -0,0 +1,76 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+import asyncio
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestAsync:
+    def test_async(self):
+        async def main():
+            datasets = []
+            for i in range(1, 4):
+                ds = nc.open_data(ff, checks=False)
+                ds.subset(months=i)
+                ds.tmean()
+                datasets.append(ds)
+            await asyncio.gather(*[x.run_async() for x in datasets])
+            return datasets
+
+        datasets = asyncio.run(main())
+
+        for i, ds in zip(range(1, 4), datasets):
+            ds1 = nc.open_data(ff, checks=False)
+            ds1.subset(months=i)
+            ds1.tmean()
+            ds1.run()
+            assert ds.current != [ff]
+            assert ds.to_dataframe().sst.sum() == ds1.to_dataframe().sst.sum()
+
+        del datasets
+        del ds
+        del ds1
+
+        n = len(nc.session_files())
+        assert n == 0
+
+    def test_outputs(self):
+        if os.path.exists("async_test.nc"):
+            os.remove("async_test.nc")
+
+        ds = nc.open_data(ff, checks=False)
+        ds.tmean()
+        asyncio.run(ds.to_nc_async("async_test.nc"))
+        assert ds.current == ["async_test.nc"]
+        with pytest.raises(ValueError):
+            asyncio.run(ds.to_nc_async("async_test.nc"))
+
+        ds = nc.open_data(ff, checks=False)
+        ds.tmean()
+        ds1 = nc.open_data("async_test.nc", checks=False)
+        data = asyncio.run(ds.to_xarray_async())
+        assert data.sst.sum() == ds1.to_xarray().sst.sum()
+
+        # subsets are run in the event loop, without running the dataset itself
+        ds = nc.open_data(ff, checks=False)
+        ds.tmean()
+        data = asyncio.run(ds.to_xarray_async(months=1))
+        ds1 = nc.open_data(ff, checks=False)
+        ds1.tmean()
+        ds1.subset(months=1)
+        assert data.sst.sum() == ds1.to_xarray().sst.sum()
+        assert len(ds.history) > len(ds._hold_history)
+        assert ds.current == [ff]
+
+        del ds
+        del ds1
+        del data
+        os.remove("async_test.nc")
+
+        n = len(nc.session_files())
+        assert n == 0
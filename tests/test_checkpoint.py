@@ -0,0 +1,101 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+
+from nctoolkit.checkpoint import (
+    attempt,
+    checkpoint_target,
+    completed,
+    read_manifest,
+    record,
+)
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestCheckpoint:
+    def test_manifest(self, tmp_path):
+        folder = str(tmp_path)
+        record(folder, {"key": "a", "status": "failed", "output": None})
+        record(folder, {"key": "a", "status": "done", "output": ff})
+        record(folder, {"key": "b", "status": "done", "output": "foo.nc"})
+        with open(os.path.join(folder, "manifest.jsonl"), "a") as f:
+            f.write('{"key": "c", "sta')
+        assert len(read_manifest(folder)) == 2
+        assert completed(folder) == {"a": ff}
+
+        with pytest.raises(ValueError):
+            nc.options(checkpoint_dir="/foo/bar")
+        with pytest.raises(TypeError):
+            nc.options(retries=1.5)
+        with pytest.raises(ValueError):
+            nc.options(retries=-1)
+
+    def test_retry(self, tmp_path):
+        folder = str(tmp_path)
+        nc.options(retries=2)
+        try:
+            target = checkpoint_target(folder, "a")
+
+            # each attempt leaves partial output, and only the last one works
+            calls = []
+
+            def task(target):
+                calls.append(os.path.exists(target))
+                with open(target, "w") as f:
+                    f.write("partial")
+                if len(calls) < 3:
+                    raise ValueError(f"cdo error {len(calls)}")
+                return target
+
+            assert attempt(task, [target], {}, folder, "a", ff, "x") == target
+            assert calls == [False, False, False]
+            entry = read_manifest(folder)["a"]
+            assert entry["status"] == "done"
+            assert entry["attempts"] == 3
+
+            # every attempt fails, so the first error is recorded and nothing is kept
+            def fail(target):
+                with open(target, "w") as f:
+                    f.write("partial")
+                raise ValueError(f"cdo error {len(calls)}")
+
+            calls = [1]
+            target = checkpoint_target(folder, "b")
+            with open(target, "w") as f:
+                f.write("stale")
+            assert attempt(fail, [target], {}, folder, "b", ff, "x") is None
+            entry = read_manifest(folder)["b"]
+            assert entry["status"] == "failed"
+            assert entry["attempts"] == 3
+            assert entry["error"] == "cdo error 1"
+            assert not os.path.exists(target)
+        finally:
+            nc.options(retries=0)
+
+    def test_resume(self, tmp_path):
+        folder = str(tmp_path)
+        nc.options(checkpoint_dir=folder)
+        try:
+            ds = nc.open_data([ff, "data/2003.nc"], checks=False)
+            ds.spatial_mean()
+            ds.run()
+            assert len(ds) == 2
+            assert all(x.startswith(os.path.abspath(folder)) for x in ds)
+
+            ds = nc.open_data([ff, "data/2003.nc"], checks=False)
+            ds.spatial_mean()
+            ds.run()
+            assert nc.session_stats()["checkpoint_hits"] >= 2
+            status = nc.checkpoint_status()
+            assert (status.status == "done").all()
+        finally:
+            nc.options(checkpoint_dir=None)
+
+        del ds
+        n = len(nc.session_files())
+        assert n == 0
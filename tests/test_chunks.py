@@ -0,0 +1,59 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+import platform
+
+from nctoolkit.strategies import time_period, time_chunks
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestChunks:
+    def test_periods(self):
+        assert time_period(f"cdo -L -fldmean {ff} out.nc") is None
+        assert time_period(f"cdo -L -monmean -fldmean {ff} out.nc") == "month"
+        assert time_period(f"cdo -L -yearmean -monmean {ff} out.nc") == "year"
+        assert time_period(f"cdo -L -timmean {ff} out.nc") is False
+        assert time_period(f"cdo -L -runmean,3 {ff} out.nc") is False
+        assert time_period(f"cdo -L -selyear,1990 {ff} out.nc") is False
+        assert time_period(f"cdo -L -shifttime,-1day {ff} out.nc") is None
+        # chunks would not line up with the shifted months
+        assert time_period(f"cdo -L -monmean -shifttime,-1day {ff} out.nc") is False
+        assert time_period(f"cdo -L -yearmean -setyear,2000 {ff} out.nc") is False
+
+        chunks = time_chunks(f"cdo -L -yearmean {ff} out.nc", ff, 4)
+        n = len(nc.open_data(ff, checks=False).times)
+        assert chunks[0][0] == 1
+        assert chunks[-1][1] == n
+        for x in chunks:
+            # chunks must start in January
+            assert (x[0] - 1) % 12 == 0
+
+    def test_chunking(self):
+        if platform.system() != "Linux":
+            return None
+
+        ds = nc.open_data(ff, checks=False)
+        ds.tmean("year")
+        ds.spatial_mean()
+        ds.run()
+        x = ds.to_dataframe().sst.values
+
+        nc.options(cores=2, split_size=0)
+        ds = nc.open_data(ff, checks=False)
+        ds.tmean("year")
+        ds.spatial_mean()
+        ds.run()
+        y = ds.to_dataframe().sst.values
+        nc.options(cores=1, split_size=1e9)
+
+        assert len(x) == len(y)
+        assert ((x - y) ** 2).sum() == 0
+
+        del ds
+        n = len(nc.session_files())
+        assert n == 0
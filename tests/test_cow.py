@@ -0,0 +1,53 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+
+from nctoolkit.session import SafeList
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestCow:
+    def test_safelist(self):
+        safe = SafeList()
+        safe.append("a.nc")
+        files = ("a.nc", "b.nc")
+        safe.append_group(files)
+        safe.append_group(files)
+        assert safe.count("a.nc") == 2
+        assert safe.count("b.nc") == 1
+        safe.remove_group(files)
+        assert "b.nc" in safe
+        safe.remove_group(files)
+        assert "b.nc" not in safe
+        assert list(safe) == ["a.nc"]
+        safe.remove("a.nc")
+        assert len(safe) == 0
+        with pytest.raises(ValueError):
+            safe.remove("a.nc")
+
+    def test_copy(self):
+        ds = nc.open_data(ff, checks=False)
+        ds.current = [ff, ff]
+        new = ds.copy()
+        # the files are shared until one dataset changes
+        assert new._current is ds._current
+        assert new.current == ds.current
+        new.current = [ff]
+        assert len(new) == 1
+        assert len(ds) == 2
+        # current is a copy, so changing it does not change the dataset
+        ds.current.append(ff)
+        assert len(ds) == 2
+
+        with pytest.raises(AttributeError):
+            ds.foo = 1
+
+        del ds
+        del new
+        n = len(nc.session_files())
+        assert n == 0
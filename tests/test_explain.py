@@ -0,0 +1,94 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+import json
+
+import nctoolkit.costs
+from nctoolkit.costs import learn, load_costs, save_costs, estimate_time
+from nctoolkit.explain import reused_weights
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestExplain:
+    def test_learn(self, tmp_path, monkeypatch):
+        # do not touch the user's stored history
+        path = str(tmp_path / "costs.json")
+        monkeypatch.setattr(nctoolkit.costs, "costs_file", lambda: path)
+        monkeypatch.setattr(nctoolkit.costs, "costs", None)
+        monkeypatch.setattr(nctoolkit.costs, "loaded", False)
+        monkeypatch.setattr(
+            nctoolkit.costs, "changed", dict(throughput=set(), ratio=set())
+        )
+
+        size = os.path.getsize(ff)
+        learn(
+            [
+                {
+                    "command": f"cdo -fldmean -timmean {ff} out.nc",
+                    "returncode": 0,
+                    "input_bytes": size,
+                    "output_bytes": 10,
+                    "wall_time": 2.0,
+                }
+            ]
+        )
+        costs = load_costs()
+        assert costs["throughput"]["-fldmean"] > 0
+        assert "-fldmean -timmean" in costs["ratio"]
+        time, unknown = estimate_time(f"cdo -fldmean -foo {ff} out.nc")
+        assert time > 0
+        assert unknown == ["-foo"]
+
+        # the history is only stored if the option is set
+        save_costs()
+        assert not os.path.exists(path)
+
+        with open(path, "w") as f:
+            json.dump({"throughput": {"-foo": 5.0}, "ratio": {}}, f)
+        nc.options(cost_history=True)
+        try:
+            assert load_costs()["throughput"]["-foo"] == 5.0
+            save_costs()
+            with open(path) as f:
+                stored = json.load(f)
+            assert stored["throughput"]["-foo"] == 5.0
+            assert stored["throughput"]["-fldmean"] > 0
+            assert "-fldmean -timmean" in stored["ratio"]
+            assert sorted(os.listdir(str(tmp_path))) == [
+                "costs.json",
+                "costs.json.lock",
+            ]
+        finally:
+            nc.options(cost_history=False)
+
+        with pytest.raises(TypeError):
+            nc.options(cost_history=1)
+
+    def test_weights(self):
+        assert reused_weights(f"cdo -remap,grid.txt,{ff} in.nc out.nc") == [ff]
+        assert reused_weights("cdo -remapbil,grid.txt in.nc out.nc") == []
+
+    def test_explain(self):
+        ds = nc.open_data(ff, checks=False)
+        assert str(ds.explain()) == "Plan: nothing to run"
+        ds.spatial_mean()
+        ds.tmean()
+        plan = ds.explain()
+        assert len(plan.commands) == 1
+        assert ff in plan.commands[0]
+        assert "-fldmean" in plan.commands[0]
+        assert plan.output == "ensemble"
+        assert plan.output_size > 0
+        assert "Estimated run time" in str(plan)
+        # nothing has been run
+        assert len(ds.history) == 1
+        assert ds.current == [ff]
+
+        del ds
+        n = len(nc.session_files())
+        assert n == 0
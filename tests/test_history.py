@@ -0,0 +1,55 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+import copy
+
+from nctoolkit.history import CompactHistory, make_batch, FILE, TARGET
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestHistory:
+    def test_compact(self):
+        files = [f"file{i}.nc" for i in range(5)]
+        targets = [f"target{i}.nc" for i in range(5)]
+        commands = [f"cdo -timmean {x} {y}" for x, y in zip(files, targets)]
+
+        history = CompactHistory(["cdo -fldmean"])
+        history += make_batch(f"cdo -timmean {FILE} {TARGET}", files, targets, commands)
+        assert len(history) == 6
+        assert history == ["cdo -fldmean"] + commands
+        assert history[-1] == commands[-1]
+        assert history[1:3] == commands[:2]
+        assert len(history._entries) == 2
+
+        # copies share batches
+        new = copy.deepcopy(history)
+        assert new._entries[1] is history._entries[1]
+        new[2] = "cdo -timmax"
+        assert new[2] == "cdo -timmax"
+        assert history[2] == commands[1]
+        del new[0]
+        assert len(new) == 5
+        assert len(history) == 6
+
+        # commands the template does not reproduce are stored as they are
+        entries = make_batch(
+            f"cdo -timmean {FILE} {TARGET}", files, targets, commands[:-1] + ["x"]
+        )
+        assert entries == commands[:-1] + ["x"]
+
+    def test_dataset(self):
+        ds = nc.open_data(ff, checks=False)
+        ds.tmean()
+        assert isinstance(ds.history, CompactHistory)
+        assert ds.history == ["cdo -timmean"]
+        ds.history = ["cdo -timmax"]
+        assert isinstance(ds.history, CompactHistory)
+
+        del ds
+        n = len(nc.session_files())
+        assert n == 0
@@ -0,0 +1,72 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestIterrun:
+    def test_iter_run(self):
+        files = nc.create_ensemble("data/ensemble")[0:3]
+        ds = nc.open_data(files, checks=False)
+        ds.tmean()
+
+        expected = dict()
+        for x in files:
+            ds1 = nc.open_data(x, checks=False)
+            ds1.tmean()
+            ds1.run()
+            expected[x] = ds1.to_dataframe()
+
+        found = []
+        for ds_file in ds.iter_run():
+            assert len(ds_file) == 1
+            assert ds_file.current[0] not in files
+            x = [x for x in files if x in str(ds_file.history)][0]
+            found.append(x)
+            assert ds_file.to_dataframe().equals(expected[x])
+        assert sorted(found) == sorted(files)
+
+        # the dataset itself is not run
+        assert ds.current == files
+        ds.run()
+        assert len(ds) == 3
+
+        # files with nothing to run
+        ds = nc.open_data(files, checks=False)
+        assert [x.current for x in ds.iter_run()] == [[x] for x in files]
+
+        # stopping early
+        ds = nc.open_data(files, checks=False)
+        ds.tmean()
+        for ds_file in ds.iter_run():
+            break
+
+        del ds
+        del ds1
+        del ds_file
+
+        n = len(nc.session_files())
+        assert n == 0
+
+    def test_merged(self):
+        ds = nc.open_data(nc.create_ensemble("data/ensemble")[0:2], checks=False)
+        ds.merge("time")
+        results = list(ds.iter_run())
+        assert len(results) == 1
+        assert len(results[0]) == 1
+        assert len(ds) == 2
+
+        with pytest.raises(ValueError):
+            for x in nc.open_data([], checks=False).iter_run():
+                pass
+
+        del ds
+        del results
+
+        n = len(nc.session_files())
+        assert n == 0
@@ -0,0 +1,71 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+import signal
+
+from nctoolkit.strategies import out_of_memory, memory_strategy, run_out_of_core
+from nctoolkit.temp_file import temp_file
+from nctoolkit.runners import execute, memory_limit, command_threads, thread_memory
+from nctoolkit.session import session_info
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestMemory:
+    def test_options(self):
+        with pytest.raises(TypeError):
+            nc.options(memory_limit="1GB")
+        with pytest.raises(ValueError):
+            nc.options(memory_limit=-1)
+
+        assert out_of_memory(b"terminate called after throwing std::bad_alloc", 134)
+        assert out_of_memory(b"", -signal.SIGKILL)
+        assert out_of_memory(b"cdo: Variable not found", 1) is False
+
+        assert memory_strategy(f"cdo -monmean {ff} out.nc", ff) == "time"
+        assert memory_strategy(f"cdo -timmean {ff} out.nc", ff) == "tiles"
+        assert memory_strategy(f"cdo -fldmean -timmean {ff} out.nc", ff) is None
+        assert run_out_of_core(f"cdo -fldmean -timmean {ff} out.nc", "out.nc") is None
+
+        n = len(nc.session_files())
+        assert n == 0
+
+    def test_limit(self):
+        assert memory_limit("cdo -fldmean in.nc out.nc") == "cdo -fldmean in.nc out.nc"
+        assert command_threads("cdo -fldmean in.nc out.nc") == 1
+        assert command_threads("cdo -P 4 -fldmean in.nc out.nc") == 4
+
+        nc.options(memory_limit=1e9)
+        try:
+            # the shell sets the limit, with room for each extra thread's arena
+            out, result = execute("ulimit -v")
+            assert int(result) == int(1e9) // 1024
+            assert memory_limit("cdo -P 4 -fldmean in.nc out.nc").startswith(
+                f"ulimit -v {(int(1e9) + 3 * thread_memory) // 1024} "
+            )
+        finally:
+            session_info["memory_limit"] = None
+
+    def test_out_of_core(self):
+        ds = nc.open_data(ff, checks=False)
+        ds.tmean(["year", "month"])
+        ds.spatial_mean()
+        ds.run()
+        expected = ds.to_dataframe().sst.values
+
+        target = temp_file("nc")
+        out = run_out_of_core(
+            f"cdo -L -fldmean -monmean {ff} {target}", target, precision="default"
+        )
+        assert out == target
+        ds = nc.open_data(target, checks=False)
+        assert len(ds.times) == len(expected)
+        assert list(ds.to_dataframe().sst.values) == pytest.approx(list(expected))
+        del ds
+
+        n = len(nc.session_files())
+        assert n == 0
@@ -0,0 +1,61 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+
+from nctoolkit.overhead import waiting_time
+from nctoolkit.instrument import records
+from nctoolkit.runners import run_shell
+from nctoolkit.show import nc_variables
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestOverhead:
+    def test_waiting(self):
+        new_records = [
+            {"start": 1, "end": 3},
+            {"start": 2, "end": 4},
+            {"start": 6, "end": 12},
+        ]
+        assert waiting_time(0, 10, new_records) == 7
+        assert waiting_time(0, 10, []) == 0
+
+    def test_metadata(self):
+        # metadata calls count as waiting for CDO, not Python overhead
+        n = records.mark()
+        nc_variables(ff)
+        assert [x["command"] for x in records.since(n)] == [f"cdo showname {ff}"]
+
+        out = run_shell("echo foo; echo bar 1>&2; exit 2")
+        assert out.returncode == 2
+        assert out.stdout == b"foo\n"
+        assert out.stderr == b"bar\n"
+
+    def test_report(self):
+        nc.overhead_report(reset=True)
+        ds = nc.open_data(ff, checks=False)
+        ds.tmean()
+        assert len(nc.overhead_report()) == 0
+
+        nc.options(overhead=True)
+        ds = nc.open_data(ff, checks=False)
+        ds.tmean()
+        ds.tmean()
+        nc.options(overhead=False)
+
+        df = nc.overhead_report(reset=True)
+        assert {"open_data", "tmean"} <= set(df.method)
+        assert df.query("method == 'tmean'").calls.values[0] == 2
+        assert (df.python_time <= df.total_time).all()
+        assert len(nc.overhead_report()) == 0
+
+        with pytest.raises(TypeError):
+            nc.options(overhead="yes")
+
+        del ds
+        n = len(nc.session_files())
+        assert n == 0
@@ -0,0 +1,102 @@
+import nctoolkit as nc
+import numpy as np
+import os, pytest
+from netCDF4 import Dataset
+
+from nctoolkit.precision import (
+    choose_precision,
+    keeps_values,
+    selected_variables,
+    variable_types,
+)
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+def packed_file(path):
+    with Dataset(path, "w") as ds:
+        ds.createDimension("lon", 3)
+        ds.createDimension("lat", 2)
+        ds.createDimension("time", None)
+        ds.createVariable("lon", "f8", ("lon",))[:] = [0, 1, 2]
+        ds.createVariable("lat", "f8", ("lat",))[:] = [0, 1]
+        time = ds.createVariable("time", "f8", ("time",))
+        time.units = "days since 2000-01-01"
+        time[:] = [0, 1]
+        var = ds.createVariable("sst", "i2", ("time", "lat", "lon"))
+        var.scale_factor = 0.01
+        var.grid_mapping = "crs"
+        var[:] = np.full((2, 2, 3), 300.0)
+        ds.createVariable("crs", "i4", ())
+        var = ds.createVariable("tas", "f4", ("time", "lat", "lon"))
+        var[:] = np.full((2, 2, 3), 300.0)
+
+
+@pytest.fixture
+def packed(tmp_path):
+    path = str(tmp_path / "packed_test.nc")
+    packed_file(path)
+    yield path
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class TestPrecision:
+    def test_choose(self, packed):
+        assert variable_types(packed) == {
+            "sst": (True, True, False),
+            "tas": (False, False, False),
+        }
+        assert variable_types(ff) == {"sst": (False, False, False)}
+        assert keeps_values("seltimestep")
+        assert keeps_values("timmax")
+        assert keeps_values("timmean") is False
+
+        # only operators that can change values need a float output
+        assert choose_precision(f"cdo -timmean {packed} out.nc").startswith(
+            "cdo -b F32 "
+        )
+        assert (
+            choose_precision(f"cdo -seltimestep,1 {packed} out.nc")
+            == f"cdo -seltimestep,1 {packed} out.nc"
+        )
+        assert (
+            choose_precision(f"cdo -b F64 -timmean {packed} out.nc")
+            == f"cdo -b F64 -timmean {packed} out.nc"
+        )
+        assert (
+            choose_precision(f"cdo -timmean {ff} out.nc")
+            == f"cdo -timmean {ff} out.nc"
+        )
+
+        # only the variables kept are checked
+        assert (
+            choose_precision(f"cdo -timmean -selname,tas {packed} out.nc")
+            == f"cdo -timmean -selname,tas {packed} out.nc"
+        )
+        assert (
+            choose_precision(f"cdo -timmean -delname,sst {packed} out.nc")
+            == f"cdo -timmean -delname,sst {packed} out.nc"
+        )
+        assert choose_precision(
+            f"cdo -timmean -selname,sst {packed} out.nc"
+        ).startswith("cdo -b F32 ")
+        assert selected_variables(["-selname,t*"], ["tas", "sst"]) == {"tas"}
+        assert selected_variables(["-aexpr,x=sst*2", "-selname,tas"], ["tas"]) is None
+        assert selected_variables(["-aexpr,x=sst*2"], ["tas", "sst"]) == {"tas", "sst"}
+
+        stats = nc.session_stats()
+        ds = nc.open_data(packed, checks=False)
+        ds.tmean()
+        ds.run()
+        assert ds.contents.data_type[0] == "F32"
+        assert nc.session_stats().get("precision_reruns", 0) == stats.get(
+            "precision_reruns", 0
+        )
+        del ds
+
+        n = len(nc.session_files())
+        assert n == 0
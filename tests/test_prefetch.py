@@ -0,0 +1,88 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+import shutil
+
+from nctoolkit.prefetch import Prefetcher, prefetchable
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestPrefetch:
+    def test_prefetcher(self, tmp_path):
+        folder = str(tmp_path)
+        files = []
+        for i in range(4):
+            files.append(os.path.join(folder, f"{i}.nc"))
+            shutil.copyfile(ff, files[-1])
+
+        assert prefetchable(files[0])
+        assert prefetchable("foo.nc") is False
+
+        stats = nc.session_stats()
+        start = stats.get("prefetch_hits", 0) + stats.get("prefetch_waits", 0)
+        prefetcher = Prefetcher(files, depth=2).start()
+        copies = []
+        for x in files:
+            copy = prefetcher.get(x)
+            assert copy != x
+            assert os.path.getsize(copy) == os.path.getsize(x)
+            copies.append(copy)
+            prefetcher.done(x)
+            assert os.path.exists(copy) is False
+        prefetcher.stop()
+        stats = nc.session_stats()
+        used = stats.get("prefetch_hits", 0) + stats.get("prefetch_waits", 0)
+        assert used == start + 4
+        assert stats["prefetch_hit_rate"] >= 0
+
+        # nothing is copied if prefetch is off
+        prefetcher = Prefetcher(files, depth=0).start()
+        assert prefetcher.get(files[0]) == files[0]
+        prefetcher.stop()
+
+        # unused copies are removed when stopped
+        prefetcher = Prefetcher(files, depth=4).start()
+        copy = prefetcher.get(files[0])
+        prefetcher.stop()
+        assert os.path.exists(copy) is False
+
+        # files that cannot be copied are read from where they are
+        prefetcher = Prefetcher(files, depth=2)
+        os.remove(files[0])
+        prefetcher.start()
+        assert prefetcher.get(files[0]) == files[0]
+        assert prefetcher.get(files[1]) != files[1]
+        prefetcher.stop()
+
+        n = len(nc.session_files())
+        assert n == 0
+
+    def test_run(self, tmp_path):
+        files = []
+        for i in range(4):
+            files.append(os.path.join(tmp_path, f"{i}.nc"))
+            shutil.copyfile(ff, files[-1])
+
+        nc.options(prefetch=2)
+        try:
+            ds = nc.open_data(files, checks=False)
+            ds.spatial_mean()
+            ds.run()
+            assert ds.history[0].split(" ")[-2] == files[0]
+        finally:
+            nc.options(prefetch=0)
+
+        del ds
+        n = len(nc.session_files())
+        assert n == 0
+
+    def test_error(self):
+        with pytest.raises(TypeError):
+            nc.options(prefetch=1.0)
+        with pytest.raises(ValueError):
+            nc.options(prefetch=-1)
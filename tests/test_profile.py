@@ -0,0 +1,90 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+import json
+
+from nctoolkit.runners import execute
+from nctoolkit import instrument
+from nctoolkit.instrument import records, Records, Profile
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestProfile:
+    def test_execute(self):
+        n = len(records)
+        out, result = execute("exit 3")
+        assert out.returncode == 3
+        assert len(records) == n + 1
+        assert records[-1]["returncode"] == 3
+        assert records[-1]["wall_time"] >= 0
+
+    def test_records(self):
+        x = Records(3)
+        start = x.mark()
+        x.extend([1, 2])
+        assert x.since(start) == [1, 2]
+        middle = x.mark()
+        x.extend([3, 4, 5])
+        # older records are dropped
+        assert len(x) == 3
+        assert list(x) == [3, 4, 5]
+        assert x.since(middle) == [3, 4, 5]
+        with pytest.warns(UserWarning):
+            assert x.since(start) == [3, 4, 5]
+        assert x.since(x.mark()) == []
+
+    def test_bounded_profile(self, monkeypatch):
+        monkeypatch.setattr(instrument, "record_limit", 4)
+        monkeypatch.setattr(instrument, "profile_chunks", 2)
+        x = Profile()
+        y = x + [1, 2]
+        # profiles are never changed in place
+        assert len(x) == 0
+        z = y + [3]
+        assert list(y) == [1, 2]
+        assert list(z) == [1, 2, 3]
+        z = z + [4, 5, 6]
+        assert list(z) == [3, 4, 5, 6]
+        assert z.dropped == 2
+        assert z + [] is z
+
+        ds = nc.open_data(ff, checks=False)
+        ds._profile = Profile() + [{"command": x} for x in "abcdef"]
+        with pytest.warns(UserWarning):
+            assert list(ds.profile().command) == ["c", "d", "e", "f"]
+        # copies share the profile
+        ds1 = ds.copy()
+        assert ds1._profile is ds._profile
+
+    def test_profile(self):
+        ds = nc.open_data(ff, checks=False)
+        assert len(ds.profile()) == 0
+        ds.spatial_mean()
+        ds.run()
+        ds.tmean()
+        ds.run()
+        df = ds.profile(trace="trace.json")
+        assert len(df) == 2
+        assert df.input_bytes[0] == os.path.getsize(ff)
+        assert (df.output_bytes > 0).all()
+        assert (df.returncode == 0).all()
+        assert (df.max_rss > 0).all()
+
+        with open("trace.json") as f:
+            trace = json.load(f)
+        assert [x["name"] for x in trace["traceEvents"]] == ["fldmean", "timmean"]
+        os.remove("trace.json")
+
+        with pytest.raises(TypeError):
+            ds.profile(trace=1)
+        with pytest.raises(ValueError):
+            ds.profile(trace="/foo/bar/trace.json")
+
+        del ds
+        n = len(nc.session_files())
+        assert n == 0
@@ -0,0 +1,78 @@
+import nctoolkit as nc
+from nctoolkit import tempstore
+from nctoolkit.session import session_info
+import pandas as pd
+import xarray as xr
+import os, pytest
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestRunall:
+    def test_run_all(self):
+        with pytest.raises(TypeError):
+            nc.run_all("foo")
+        with pytest.raises(TypeError):
+            nc.run_all([nc.open_data(ff, checks=False), 1])
+        with pytest.raises(ValueError):
+            nc.run_all([nc.open_data(ff, checks=False)], cores=0)
+
+        datasets = []
+        expected = []
+        for i in range(1, 5):
+            ds = nc.open_data(ff, checks=False)
+            ds.subset(months=i)
+            ds.tmean()
+            datasets.append(ds)
+
+            ds1 = nc.open_data(ff, checks=False)
+            ds1.subset(months=i)
+            ds1.tmean()
+            ds1.run()
+            expected.append(ds1.to_dataframe().sst.values)
+
+        # merged datasets and datasets with nothing to run
+        ds = nc.open_data([ff, ff], checks=False)
+        ds.merge("time")
+        datasets.append(ds)
+        datasets.append(nc.open_data(ff, checks=False))
+        datasets.append(datasets[0])
+
+        nc.run_all(datasets, cores=2)
+
+        for ds, values in zip(datasets, expected):
+            assert len(ds) == 1
+            assert ds.current != [ff]
+            assert list(ds.to_dataframe().sst.values) == pytest.approx(
+                list(values), nan_ok=True
+            )
+        assert len(datasets[4]) == 1
+        assert datasets[5].current == [ff]
+
+        # outputs moved to another temp tier are still profiled
+        # /tmp has room for an empty file, but not the output
+        margin = tempstore.margin
+        temp_tiers = session_info["temp_tiers"]
+        tempstore.margin = 0
+        try:
+            used = tempstore.used_space("/tmp/")
+            quota = used + os.path.getsize(ff) // 2
+            nc.options(temp_tiers=[("/tmp", quota), "/var/tmp"])
+            ds = nc.open_data(ff, checks=False)
+            ds.tmean()
+            nc.run_all([ds])
+            assert ds[0].startswith("/var/tmp/")
+            assert len(ds.profile()) == 1
+        finally:
+            session_info["temp_tiers"] = temp_tiers
+            tempstore.margin = margin
+
+        del datasets
+        del ds
+        del ds1
+
+        n = len(nc.session_files())
+        assert n == 0
@@ -0,0 +1,69 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+import platform
+
+from nctoolkit.scheduler import Controller, Scheduler
+from nctoolkit.tempstore import ratios
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+def add(x, y):
+    return x + y
+
+
+def ratio(key, value):
+    ratios[key] = value
+    return value
+
+
+class TestScheduler:
+    def test_controller(self):
+        controller = Controller(1, 8, adaptive=False)
+        assert controller.limit == 8
+        controller.update(100, 1, 1)
+        assert controller.limit == 8
+
+        controller = Controller(1, 8)
+        assert controller.limit == 4
+        for i in range(20):
+            controller.update(100, 1, 1)
+        assert controller.limit >= 1
+        assert controller.limit <= 8
+        assert len(controller.limits) > 1
+
+        controller = Controller(1, 1)
+        for i in range(5):
+            controller.update(100, 1, 0)
+        assert controller.limit == 1
+
+    def test_scheduler(self):
+        if platform.system() != "Linux":
+            return None
+
+        scheduler = Scheduler(2, adaptive=True)
+        for i in range(10):
+            scheduler.submit(add, [i, 1])
+        assert scheduler.run() == list(range(1, 11))
+
+        scheduler = Scheduler(2)
+        scheduler.submit(add, [1, "a"])
+        with pytest.raises(TypeError):
+            scheduler.run()
+
+        assert Scheduler(2).run() == []
+
+        # output size ratios seen by the workers are passed back
+        scheduler = Scheduler(2)
+        scheduler.submit(ratio, [("-foo",), 0.25])
+        scheduler.run()
+        assert ratios.pop(("-foo",)) == 0.25
+
+    def test_error(self):
+        with pytest.raises(TypeError):
+            nc.options(adaptive=1)
@@ -131,3 +131,16 @@ class TestSplit:
 
 
 
+
+    def test_stopped(self, monkeypatch):
+        from nctoolkit import split
+
+        def stopped(command):
+            # write a piece before stopping, like a timed out split
+            open(command.split(" ")[-1] + "2000.nc", "w").close()
+            raise ValueError("Command timed out")
+
+        monkeypatch.setattr(split, "execute", stopped)
+        with pytest.raises(ValueError):
+            split.split_file(ff)
+        assert len(nc.session_files()) == 0
@@ -0,0 +1,127 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+import shutil
+import tempfile
+
+from nctoolkit import stage
+from nctoolkit.session import session_info, append_protected, remove_protected
+from nctoolkit.stage import evict, read_index, write_index, stage_key, release
+from nctoolkit.stage import staged_file
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestStage:
+    def test_evict(self):
+        stage_dir = tempfile.mkdtemp()
+        index = dict()
+        for i in range(3):
+            path = os.path.join(stage_dir, f"{i}.nc")
+            with open(path, "w") as f:
+                f.write("x" * 100)
+            index[str(i)] = {"source": "", "path": path, "size": 100, "used": i}
+        index["3"] = {"source": ""}
+
+        nc.options(stage_size=200)
+        evict(stage_dir, index, keep=["0"])
+        assert list(index.keys()) == ["0", "2", "3"]
+        assert os.path.exists(os.path.join(stage_dir, "1.nc")) is False
+
+        # copies used by running sessions are not evicted
+        index["0"]["holders"] = [os.getpid()]
+        index["2"]["holders"] = [os.getpid()]
+        nc.options(stage_size=100)
+        evict(stage_dir, index)
+        assert list(index.keys()) == ["0", "2", "3"]
+        write_index(stage_dir, index)
+        hold = set([(stage_dir, "0"), (stage_dir, "2")])
+        release(hold)
+        assert len(hold) == 0
+        # the least recently used copy is then evicted
+        index = read_index(stage_dir)
+        assert list(index.keys()) == ["2", "3"]
+        assert index["2"]["holders"] == []
+        nc.options(stage_size=1e10)
+
+        assert stage_key(ff) == stage_key(ff)
+
+        shutil.rmtree(stage_dir)
+
+    def test_hold(self, monkeypatch):
+        stage_dir = tempfile.mkdtemp()
+        monkeypatch.setattr(stage, "nc_format", lambda x: ["nc4_zip"])
+        files = []
+        for i in range(2):
+            files.append(os.path.join(stage_dir, f"input{i}.nc"))
+            shutil.copyfile(ff, files[-1])
+            append_protected(files[-1])
+
+        nc.options(stage_dir=stage_dir)
+        nc.options(stage_size=int(1.5 * os.path.getsize(ff)))
+        try:
+            # copies staged for a run are kept until it finishes
+            hold = set()
+            sources = [staged_file(x, hold) for x in files]
+            assert sources != files
+            assert all(os.path.exists(x) for x in sources)
+            release(hold)
+            assert len(hold) == 0
+            assert os.path.exists(sources[0]) is False
+
+            # files being copied by another session are not staged again
+            os.remove(sources[1])
+            index = read_index(stage_dir)
+            index[stage_key(files[1])] = {"source": "", "copying": os.getppid()}
+            write_index(stage_dir, index)
+            assert staged_file(files[1]) == files[1]
+        finally:
+            nc.options(stage_dir=None)
+            nc.options(stage_size=1e10)
+            for x in files:
+                remove_protected(x)
+            shutil.rmtree(stage_dir)
+
+    def test_stage(self):
+        stage_dir = tempfile.mkdtemp()
+
+        ds = nc.open_data(ff, checks=False)
+        ds.to_nc("zipped.nc", zip=True, overwrite=True)
+
+        nc.options(stage_dir=stage_dir)
+        ds = nc.open_data("zipped.nc", checks=False)
+        ds.spatial_mean()
+        ds.run()
+        assert "zipped.nc" in ds.history[-1]
+        x = ds.to_dataframe().sst.values[0]
+
+        index = read_index(stage_dir)
+        assert len(index) == 1
+        assert os.path.exists(list(index.values())[0]["path"])
+
+        ds = nc.open_data("zipped.nc", checks=False)
+        ds.spatial_mean()
+        ds.run()
+        assert x == ds.to_dataframe().sst.values[0]
+
+        nc.options(stage_dir=None)
+        shutil.rmtree(stage_dir)
+        os.remove("zipped.nc")
+
+        del ds
+        n = len(nc.session_files())
+        assert n == 0
+
+    def test_error(self):
+        with pytest.raises(ValueError):
+            nc.options(stage_dir="/foo/bar/baz")
+        with pytest.raises(TypeError):
+            nc.options(stage_dir=1)
+        with pytest.raises(TypeError):
+            nc.options(stage_size="1")
+        with pytest.raises(ValueError):
+            nc.options(stage_size=-1)
@@ -0,0 +1,57 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+
+from nctoolkit.runners import temp_options
+from nctoolkit.show import nc_format
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestTempformat:
+    def test_options(self):
+        nc.options(temp_format="nc5", temp_compression=1, temp_precision="F32")
+        # compression does not work with netCDF5
+        assert temp_options(f"cdo -fldmean {ff} out.nc") == (
+            f"cdo -f nc5 -b F32 -fldmean {ff} out.nc"
+        )
+        # dataset settings take priority
+        assert temp_options(f"cdo -fldmean {ff} out.nc", "F64", "nc4", True) == (
+            f"cdo -fldmean {ff} out.nc"
+        )
+        nc.options(temp_format="nc4")
+        assert temp_options(f"cdo -fldmean {ff} out.nc") == (
+            f"cdo -f nc4 -z zip_1 -b F32 -fldmean {ff} out.nc"
+        )
+        nc.options(temp_format=None, temp_compression=None, temp_precision=None)
+        assert temp_options(f"cdo -fldmean {ff} out.nc") == f"cdo -fldmean {ff} out.nc"
+
+    def test_run(self):
+        nc.options(temp_format="nc5", temp_precision="F32")
+        ds = nc.open_data(ff, checks=False)
+        ds.spatial_mean()
+        ds.run()
+        assert "nc5" in ds.history[-1]
+        ds.to_nc("out.nc", overwrite=True)
+        nc.options(temp_format=None, temp_precision=None)
+
+        assert "NetCDF4" in nc_format("out.nc")[0]
+        os.remove("out.nc")
+
+        del ds
+        n = len(nc.session_files())
+        assert n == 0
+
+    def test_error(self):
+        with pytest.raises(ValueError):
+            nc.options(temp_format="nc3")
+        with pytest.raises(TypeError):
+            nc.options(temp_compression=1.0)
+        with pytest.raises(ValueError):
+            nc.options(temp_compression=10)
+        with pytest.raises(ValueError):
+            nc.options(temp_precision="I32")
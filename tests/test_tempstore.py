@@ -0,0 +1,133 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+import platform
+
+from nctoolkit.session import session_info
+from nctoolkit.tempstore import (
+    tiers,
+    tier_of,
+    choose_dir,
+    fallback,
+    reserve,
+    release,
+    estimate_size,
+    relocate,
+    shm_pressure,
+    headroom,
+    has_room,
+    reservations,
+)
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+@pytest.fixture(autouse=True)
+def restore_tiers():
+    # put the temp tiers back, even if a test fails
+    saved = {x: session_info[x] for x in ["temp_tiers", "shm_size"]}
+    reserved = dict(reservations)
+    yield
+    session_info.update(saved)
+    reservations.clear()
+    reservations.update(reserved)
+
+
+class TestTempstore:
+    def test_tiers(self):
+        if platform.system() != "Linux":
+            return None
+
+        assert tiers() == [("/tmp/", None), ("/var/tmp/", None)]
+        target = nc.temp_file.temp_file("nc")
+        assert tier_of(target) == ("/tmp/", None)
+        assert fallback(target).startswith("/var/tmp/")
+        assert fallback(fallback(target)) is None
+        assert fallback(ff) is None
+
+        assert choose_dir(1e30) in ["/tmp/", "/var/tmp/"]
+
+        assert reserve(1e30, target) is False
+        assert reserve(1e30, target, force=True)
+        assert choose_dir(0) == "/var/tmp/"
+        release(1e30, target)
+        assert choose_dir(0) == "/tmp/"
+
+        assert estimate_size(f"cdo -fldmean {ff} {target}", target) == os.path.getsize(
+            ff
+        )
+
+    def test_quota(self):
+        if platform.system() != "Linux":
+            return None
+
+        nc.options(temp_tiers=[("/tmp", 0), "/var/tmp"])
+        assert choose_dir(0) == "/var/tmp/"
+
+        # the headroom is scaled to small quotas
+        assert headroom(("/tmp/", None)) == 0.5e9
+        assert headroom(("/tmp/", 1e8)) == 1e7
+        assert has_room(("/tmp/", 1e9), 1e8, usage={"/tmp/": 0})
+        assert has_room(("/tmp/", 1e9), 1e8, usage={"/tmp/": 9e8}) is False
+        nc.options(temp_tiers=[("/tmp", 1e9), "/var/tmp"])
+        assert choose_dir(1e8, usage={"/tmp/": 0}) == "/tmp/"
+        assert choose_dir(1e8, usage={"/tmp/": 9e8}) == "/var/tmp/"
+        nc.options(temp_tiers=[("/tmp", 0), "/var/tmp"])
+
+        ds = nc.open_data(ff, checks=False)
+        ds.spatial_mean()
+        ds.run()
+        assert ds[0].startswith("/var/tmp/")
+
+        del ds
+        n = len(nc.session_files())
+        assert n == 0
+
+    def test_shm(self):
+        if platform.system() != "Linux" or not os.path.isdir("/dev/shm"):
+            return None
+        if shm_pressure(1000):
+            return None
+
+        target = nc.temp_file.temp_file("nc")
+        assert relocate(target, 1000) == target
+
+        nc.options(shm_size=1e6)
+        assert choose_dir(1000) == "/dev/shm/"
+        assert choose_dir(1e7) == "/tmp/"
+        assert relocate(target, 1000).startswith("/dev/shm/")
+        assert relocate(target, 1e7) == target
+        assert fallback(relocate(target, 1000)) == target
+
+        ds = nc.open_data(ff, checks=False)
+        ds.spatial_mean()
+        ds.run()
+        assert ds[0].startswith("/dev/shm/")
+        ds.tmean()
+        ds.run()
+        assert ds[0].startswith("/dev/shm/")
+
+        nc.options(shm_size=0)
+        assert choose_dir(1000) == "/tmp/"
+
+        del ds
+        n = len(nc.session_files())
+        assert n == 0
+
+    def test_error(self):
+        with pytest.raises(TypeError):
+            nc.options(temp_tiers="/tmp")
+        with pytest.raises(ValueError):
+            nc.options(temp_tiers=["/foo/bar/baz"])
+        with pytest.raises(TypeError):
+            nc.options(temp_tiers=[("/tmp", "1")])
+        with pytest.raises(ValueError):
+            nc.options(temp_tiers=[("/tmp", -1)])
+        with pytest.raises(TypeError):
+            nc.options(shm_size="1")
+        with pytest.raises(ValueError):
+            nc.options(shm_size=-1)
@@ -0,0 +1,42 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+import multiprocessing as mp
+
+from nctoolkit.runners import omp_threads
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestThreads:
+    def test_threads(self):
+        if mp.cpu_count() < 2:
+            return None
+
+        nc.options(cores=2)
+        assert omp_threads() == 2
+        assert omp_threads(2) == 1
+        assert omp_threads(3) == 1
+
+        ds = nc.open_data(ff, checks=False)
+        ds.spatial_mean()
+        ds.run()
+        x = ds.to_dataframe().sst.values[0]
+
+        nc.options(cores=1)
+        assert omp_threads() == 1
+
+        ds = nc.open_data(ff, checks=False)
+        ds.spatial_mean()
+        ds.run()
+        y = ds.to_dataframe().sst.values[0]
+
+        assert x == y
+
+        del ds
+        n = len(nc.session_files())
+        assert n == 0
@@ -0,0 +1,60 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+import platform
+
+from nctoolkit.strategies import spatially_local, choose_strategy
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestTiling:
+    def test_local(self):
+        assert spatially_local(f"cdo -L -timmean -selyear,1990 {ff} out.nc")
+        assert spatially_local(f"cdo -L -aexpr,'new=sst+273.15' {ff} out.nc")
+        assert spatially_local(f"cdo -L -fldmean {ff} out.nc") is False
+        assert spatially_local(f"cdo -L -aexpr,'new=fldmean(sst)' {ff} out.nc") is False
+        assert spatially_local(f"cdo -L -sub {ff} -timmean {ff} out.nc") is False
+
+        # nothing is split unless tiling is switched on
+        assert choose_strategy(f"cdo -L -timmean {ff} out.nc", ff) is None
+
+    def test_tiling(self):
+        if platform.system() != "Linux":
+            return None
+
+        ds = nc.open_data(ff, checks=False)
+        ds.subset(years=range(1990, 1995))
+        ds.tmean()
+        ds.assign(sst=lambda x: x.sst + 1)
+        ds.run()
+        x = ds.to_xarray().sst.values
+
+        nc.options(cores=2, tiling=True, split_size=0)
+        ds = nc.open_data(ff, checks=False)
+        ds.subset(years=range(1990, 1995))
+        ds.tmean()
+        ds.assign(sst=lambda x: x.sst + 1)
+        ds.run()
+        y = ds.to_xarray().sst.values
+        nc.options(cores=1, tiling=False, split_size=1e9)
+
+        assert x.shape == y.shape
+        assert ((x - y) ** 2).sum() == 0
+
+        with pytest.raises(TypeError):
+            nc.options(tiling="yes")
+
+        with pytest.raises(TypeError):
+            nc.options(split_size="1")
+
+        with pytest.raises(ValueError):
+            nc.options(split_size=-1)
+
+        del ds
+        n = len(nc.session_files())
+        assert n == 0
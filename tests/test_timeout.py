@@ -0,0 +1,38 @@
+import nctoolkit as nc
+import os, pytest
+import time
+
+from nctoolkit.runners import execute, children, kill_children
+from nctoolkit.temp_file import temp_file
+
+nc.options(lazy=True)
+
+
+class TestTimeout:
+    def test_timeout(self):
+        with pytest.raises(TypeError):
+            nc.options(timeout="1")
+        with pytest.raises(ValueError):
+            nc.options(timeout=0)
+
+        nc.options(timeout=1)
+        target = temp_file("nc")
+        start = time.time()
+        with pytest.raises(ValueError):
+            execute(f"sleep 20; touch {target}", target)
+        # the child and the processes it started are killed
+        assert time.time() - start < 10
+        assert len(children) == 0
+        time.sleep(0.5)
+        assert os.path.exists(target) is False
+
+        out, result = execute("echo done")
+        assert out.returncode == 0
+        assert result.decode("utf-8").strip() == "done"
+        nc.options(timeout=None)
+
+        kill_children()
+        assert len(children) == 0
+
+        n = len(nc.session_files())
+        assert n == 0
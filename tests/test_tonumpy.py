@@ -0,0 +1,108 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import numpy as np
+import os, pytest
+
+nc.options(lazy=True)
+
+
+ff = "data/sst.mon.mean.nc"
+
+
+class TestTonumpy:
+    def test_iter_chunks(self):
+        ds = nc.open_data(ff, checks=False)
+        data = xr.open_dataset(ff, mask_and_scale=False).sst.values
+
+        chunks = list(ds.iter_chunks("sst", time_chunk=5))
+        assert chunks[0].shape == (5,) + data.shape[1:]
+        assert chunks[-1].shape[0] == data.shape[0] - 5 * (len(chunks) - 1)
+        assert np.array_equal(np.concatenate(chunks), data)
+
+        chunks = list(ds.iter_chunks("sst"))
+        assert len(chunks) == data.shape[0]
+        assert np.array_equal(chunks[3][0], data[3])
+
+        # the dataset is run first
+        ds.tmean()
+        chunks = list(ds.iter_chunks("sst"))
+        assert ds.current != [ff]
+
+        with pytest.raises(TypeError):
+            ds.iter_chunks()
+        with pytest.raises(TypeError):
+            ds.iter_chunks("sst", time_chunk=1.5)
+        with pytest.raises(ValueError):
+            ds.iter_chunks("sst", time_chunk=0)
+        with pytest.raises(TypeError):
+            ds.iter_chunks("sst", level="1")
+        with pytest.raises(ValueError):
+            list(ds.iter_chunks("foo"))
+        with pytest.raises(ValueError):
+            list(ds.iter_chunks("sst", level=0))
+
+        del ds
+
+        n = len(nc.session_files())
+        assert n == 0
+
+    def test_levels(self):
+        ds = nc.open_data("data/vertical_tester.nc", checks=False)
+        data = xr.open_dataset("data/vertical_tester.nc", mask_and_scale=False)
+        data = data.e3t.values
+
+        chunks = list(ds.iter_chunks("e3t", level=2))
+        assert len(chunks) == data.shape[0]
+        assert np.array_equal(chunks[0], data[0:1, 2])
+
+        with pytest.raises(ValueError):
+            list(ds.iter_chunks("e3t", level=data.shape[1]))
+
+        del ds
+
+        n = len(nc.session_files())
+        assert n == 0
+
+    def test_to_numpy(self):
+        ds = nc.open_data(ff, checks=False)
+        data = xr.open_dataset(ff, mask_and_scale=False)
+        values = data.sst.values
+
+        x = ds.to_numpy("sst")
+        assert not isinstance(x, np.memmap)
+        assert np.array_equal(x, values)
+
+        # uncompressed netCDF3 files are memory mapped
+        out = "data/classic_test.nc"
+        if os.path.exists(out):
+            os.remove(out)
+        data.to_netcdf(out, format="NETCDF3_64BIT")
+        data.close()
+        ds = nc.open_data(out, checks=False)
+        x = ds.to_numpy("sst")
+        assert isinstance(x, np.memmap)
+        assert x.dtype == np.dtype(">f4")
+        assert np.array_equal(x, values)
+        assert np.array_equal(x[5], ds.to_numpy("sst")[5])
+
+        chunks = list(ds.iter_chunks("sst", time_chunk=7))
+        assert np.array_equal(np.concatenate(chunks), values)
+        assert np.array_equal(ds.to_numpy("lon"), xr.open_dataset(out).lon.values)
+
+        with pytest.raises(TypeError):
+            ds.to_numpy()
+        with pytest.raises(ValueError):
+            ds.to_numpy("foo")
+
+        del x
+        os.remove(out)
+
+        ds = nc.open_data(nc.create_ensemble("data/ensemble")[0:2], checks=False)
+        with pytest.raises(ValueError):
+            ds.to_numpy("sst")
+
+        del ds
+
+        n = len(nc.session_files())
+        assert n == 0
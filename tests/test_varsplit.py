@@ -0,0 +1,45 @@
+import nctoolkit as nc
+import pandas as pd
+import xarray as xr
+import os, pytest
+import platform
+
+from nctoolkit.strategies import variables_local, choose_strategy
+
+nc.options(lazy=True)
+
+
+ff = "data/vertical_tester.nc"
+
+
+class TestVarsplit:
+    def test_local(self):
+        assert variables_local(f"cdo -L -vertmean {ff} out.nc")
+        assert variables_local(f"cdo -L -timmean -vertmean {ff} out.nc")
+        assert variables_local(f"cdo -L -aexpr,'x=one+e3t' {ff} out.nc") is False
+        assert variables_local(f"cdo -L -selname,one {ff} out.nc") is False
+
+    def test_varsplit(self):
+        if platform.system() != "Linux":
+            return None
+
+        ds = nc.open_data(ff, checks=False)
+        ds.tmean()
+        ds.run()
+        x = ds.to_xarray()
+
+        nc.options(cores=2, split_size=0)
+        assert choose_strategy(f"cdo -L -timmean {ff} out.nc", ff) == "variables"
+        ds = nc.open_data(ff, checks=False)
+        ds.tmean()
+        ds.run()
+        y = ds.to_xarray()
+        nc.options(cores=1, split_size=1e9)
+
+        assert ds.variables == ["e3t", "one"]
+        for vv in ["e3t", "one"]:
+            assert float(((x[vv] - y[vv]) ** 2).sum()) == 0
+
+        del ds
+        n = len(nc.session_files())
+        assert n == 0